@@ -6,10 +6,44 @@ import shutil
 import zipfile
 import threading
 import time
+import random
 import re
+import hashlib
+import zlib
+import sqlite3
+import asyncio
+import contextlib
+import contextvars
+import concurrent.futures
+import uuid
+import functools
+from collections import Counter, OrderedDict, deque
+from types import MappingProxyType
+from typing import Any
 from pathlib import Path
+from html.parser import HTMLParser
 import webbrowser
 
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    from pydantic import BaseModel, ConfigDict, ValidationError
+except ImportError:
+    BaseModel = None
+
 # LLM imports for multiagent AI system
 from dotenv import load_dotenv
 try:
@@ -36,42 +70,1762 @@ if OPENAI_API_KEY and not globals().get('_env_debug_printed'):
     print(f"OpenAI API key loaded: {OPENAI_API_KEY[:8]}...")
     globals()['_env_debug_printed'] = True
 
-if UNSPLASH_ACCESS_KEY and UNSPLASH_ACCESS_KEY != "your_unsplash_key_here" and not globals().get('_unsplash_debug_printed'):
-    print(f"Unsplash API key loaded: {UNSPLASH_ACCESS_KEY[:8]}...")
-    globals()['_unsplash_debug_printed'] = True
+if UNSPLASH_ACCESS_KEY and UNSPLASH_ACCESS_KEY != "your_unsplash_key_here" and not globals().get('_unsplash_debug_printed'):
+    print(f"Unsplash API key loaded: {UNSPLASH_ACCESS_KEY[:8]}...")
+    globals()['_unsplash_debug_printed'] = True
+
+# Configure Streamlit page
+st.set_page_config(
+    page_title="WebWeaver Enterprise",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Offline record/replay settings ("live", "record" or "replay")
+LLM_MODE = os.getenv("WEBWEAVER_LLM_MODE", "live").lower()
+LLM_FIXTURES_PATH = os.getenv("WEBWEAVER_LLM_FIXTURES", "llm_fixtures.jsonl")
+# Replay latency: "none", "recorded", "fixed:S", "uniform:MIN,MAX", "normal:MEAN,STD" or "lognormal:MU,SIGMA"
+REPLAY_LATENCY = os.getenv("WEBWEAVER_REPLAY_LATENCY", "recorded")
+REPLAY_SEED = os.getenv("WEBWEAVER_REPLAY_SEED")
+
+class ReplayMessage:
+    """Minimal chat message returned by ReplayLLM (mirrors AIMessage.content)"""
+    def __init__(self, content):
+        self.content = content
+
+class ReplayLLM:
+    """Offline LLM stand-in: records prompt/response pairs to a fixture file or replays them"""
+    def __init__(self, fixture_path, mode="replay", llm=None, latency="recorded", seed=None, chunk_size=40):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown ReplayLLM mode: {mode}")
+        if mode == "record" and llm is None:
+            raise ValueError("Record mode needs a live LLM to wrap")
+        
+        self.fixture_path = fixture_path
+        self.mode = mode
+        self.llm = llm
+        self.chunk_size = chunk_size
+        self.model_name = getattr(llm, 'model_name', None) or "replay"
+        self.temperature = getattr(llm, 'temperature', 0.0)
+        self._latency_kind, self._latency_params = self._parse_latency(latency)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.fixtures = self._load_fixtures()
+    
+    @staticmethod
+    def _parse_latency(spec):
+        """Parse a latency spec such as 'uniform:0.2,1.5' into (kind, params)"""
+        kind, _, params = (spec or "none").partition(":")
+        kind = kind.strip().lower()
+        if kind not in ("none", "recorded", "fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown replay latency distribution: {spec}")
+        values = [float(v) for v in params.split(",") if v.strip()]
+        expected = {"none": 0, "recorded": 0, "fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}[kind]
+        if len(values) != expected:
+            raise ValueError(f"Latency '{kind}' expects {expected} parameter(s), got: {spec}")
+        return kind, values
+    
+    @staticmethod
+    def fixture_key(prompt):
+        """Stable key for a prompt (plain string or list of chat messages)
+
+        A RenderedPrompt is keyed on its cache_view, like the response cache, so remembered
+        history that differs between runs does not change which fixture is replayed.
+        """
+        prompt = getattr(prompt, 'cache_view', None) or prompt
+        if not isinstance(prompt, str):
+            prompt = json.dumps(prompt_messages(prompt), ensure_ascii=False)
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    
+    def _load_fixtures(self):
+        """Load recorded responses (JSON lines: key, response, latency)"""
+        fixtures = {}
+        if os.path.exists(self.fixture_path):
+            with open(self.fixture_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        fixtures[record['key']] = record
+        elif self.mode == "replay":
+            print(f"[ReplayLLM] Fixture file not found: {self.fixture_path}")
+        return fixtures
+    
+    def _record(self, prompt, content, latency):
+        """Append a prompt/response pair to the fixture file"""
+        record = {
+            'key': self.fixture_key(prompt),
+            'prompt': prompt if isinstance(prompt, str) else prompt_messages(prompt),
+            'response': content,
+            'latency': round(latency, 3)
+        }
+        with self._lock:
+            self.fixtures[record['key']] = record
+            with open(self.fixture_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    
+    def _lookup(self, prompt):
+        """Return the recorded fixture for prompt or raise KeyError"""
+        key = self.fixture_key(prompt)
+        if key not in self.fixtures:
+            raise KeyError(f"No recorded response for prompt {key[:12]}")
+        return self.fixtures[key]
+    
+    def _sample_latency(self, record):
+        """Draw a synthetic latency (seconds) for a replayed response"""
+        kind, params = self._latency_kind, self._latency_params
+        with self._lock:
+            if kind == "recorded":
+                delay = record.get('latency', 0.0)
+            elif kind == "fixed":
+                delay = params[0]
+            elif kind == "uniform":
+                delay = self._random.uniform(params[0], params[1])
+            elif kind == "normal":
+                delay = self._random.gauss(params[0], params[1])
+            elif kind == "lognormal":
+                delay = self._random.lognormvariate(params[0], params[1])
+            else:
+                delay = 0.0
+        return max(0.0, delay)
+    
+    def _chunks(self, content):
+        """Split a replayed response into stream chunks"""
+        return [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)] or [""]
+    
+    def invoke(self, prompt, **kwargs):
+        if self.mode == "record":
+            start = time.time()
+            response = self.llm.invoke(prompt, **kwargs)
+            content = response.content if hasattr(response, 'content') else str(response)
+            self._record(prompt, content, time.time() - start)
+            return response
+        
+        record = self._lookup(prompt)
+        time.sleep(self._sample_latency(record))
+        return ReplayMessage(record['response'])
+    
+    def stream(self, prompt, **kwargs):
+        if self.mode == "record":
+            start = time.time()
+            parts = []
+            for chunk in self.llm.stream(prompt, **kwargs):
+                parts.append(chunk.content if hasattr(chunk, 'content') else str(chunk))
+                yield chunk
+            self._record(prompt, ''.join(parts), time.time() - start)
+            return
+        
+        record = self._lookup(prompt)
+        chunks = self._chunks(record['response'])
+        delay = self._sample_latency(record) / len(chunks)
+        for chunk in chunks:
+            time.sleep(delay)
+            yield ReplayMessage(chunk)
+    
+    async def ainvoke(self, prompt, **kwargs):
+        if self.mode == "record":
+            start = time.time()
+            response = await self.llm.ainvoke(prompt, **kwargs)
+            content = response.content if hasattr(response, 'content') else str(response)
+            self._record(prompt, content, time.time() - start)
+            return response
+        
+        record = self._lookup(prompt)
+        await asyncio.sleep(self._sample_latency(record))
+        return ReplayMessage(record['response'])
+    
+    async def astream(self, prompt, **kwargs):
+        if self.mode == "record":
+            start = time.time()
+            parts = []
+            async for chunk in self.llm.astream(prompt, **kwargs):
+                parts.append(chunk.content if hasattr(chunk, 'content') else str(chunk))
+                yield chunk
+            self._record(prompt, ''.join(parts), time.time() - start)
+            return
+        
+        record = self._lookup(prompt)
+        chunks = self._chunks(record['response'])
+        delay = self._sample_latency(record) / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield ReplayMessage(chunk)
+
+# Initialize LLM models for multiagent system
+def get_available_llm():
+    """Get the best available LLM model (or the offline record/replay stand-in)"""
+    if LLM_MODE == "replay":
+        try:
+            llm = ReplayLLM(LLM_FIXTURES_PATH, mode="replay", latency=REPLAY_LATENCY, seed=REPLAY_SEED)
+            return llm, f"Replay ({len(llm.fixtures)} fixtures)"
+        except Exception as e:
+            print(f"Replay LLM initialization failed: {e}")
+            return None, "Replay Failed"
+    
+    try:
+        if OPENAI_API_KEY and OPENAI_AVAILABLE and ChatOpenAI:
+            try:
+                llm = ChatOpenAI(
+                    model="gpt-4o",
+                    api_key=OPENAI_API_KEY,
+                    temperature=0.7
+                )
+                if LLM_MODE == "record":
+                    return ReplayLLM(LLM_FIXTURES_PATH, mode="record", llm=llm), "OpenAI GPT-4o (recording)"
+                return llm, "OpenAI GPT-4o"
+            except Exception as e:
+                print(f"OpenAI initialization failed: {e}")
+                return None, "OpenAI Failed"
+                
+    except Exception as e:
+        print(f"LLM initialization error: {e}")
+    
+    return None, "No LLM Available"
+
+# Global LLM variables (initialized on first use)
+LLM_MODEL = None
+LLM_NAME = "No LLM Available"
+_llm_initialized = False
+
+# LLM response cache settings (local SQLite file, shared by all sessions in the process)
+LLM_CACHE_ENABLED = os.getenv("WEBWEAVER_LLM_CACHE", "1") != "0"
+LLM_CACHE_PATH = os.getenv(
+    "WEBWEAVER_LLM_CACHE_PATH",
+    str(Path.home() / ".webweaver" / "llm_cache.sqlite3")
+)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("WEBWEAVER_LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("WEBWEAVER_LLM_CACHE_MAX_MB", "200")) * 1024 * 1024
+LLM_CACHE_MAX_AGE = int(os.getenv("WEBWEAVER_LLM_CACHE_MAX_AGE_HOURS", "168")) * 3600
+# Comma-separated agent names that must always call the LLM (e.g. "QAAgent,HTMLAgent")
+LLM_CACHE_SKIP_AGENTS = {
+    name.strip() for name in os.getenv("WEBWEAVER_LLM_CACHE_SKIP", "").split(",") if name.strip()
+}
+
+# Live preview streaming settings for HTMLAgent
+STREAM_PREVIEW_ENABLED = os.getenv("WEBWEAVER_STREAM_PREVIEW", "1") != "0"
+PREVIEW_REFRESH_SECONDS = float(os.getenv("WEBWEAVER_PREVIEW_REFRESH_SECONDS", "1.0"))
+
+# Run agent steps on the shared asyncio loop (ainvoke) instead of the Streamlit script thread
+ASYNC_AGENTS_ENABLED = os.getenv("WEBWEAVER_ASYNC_AGENTS", "0") == "1"
+# Worker threads available to independent workflow graph steps
+WORKFLOW_MAX_WORKERS = int(os.getenv("WEBWEAVER_WORKFLOW_WORKERS", "4"))
+
+# Review each HTML candidate with QA and PM validation concurrently (one merged fix loop)
+PARALLEL_REVIEW_ENABLED = os.getenv("WEBWEAVER_PARALLEL_REVIEW", "0") == "1"
+# Seconds to wait for the second reviewer after the first one rejects a candidate
+REVIEW_MERGE_GRACE_SECONDS = float(os.getenv("WEBWEAVER_REVIEW_GRACE_SECONDS", "5"))
+
+# Run the local structural HTML checks before (and instead of) the LLM QA review
+HTML_LINT_ENABLED = os.getenv("WEBWEAVER_HTML_LINT", "1") == "1"
+# Consecutive rounds lint warnings fail a review before they are only logged (errors always fail)
+LINT_WARNING_ROUNDS = int(os.getenv("WEBWEAVER_LINT_WARNING_ROUNDS", "2"))
+
+# Modifications return only the changed page regions instead of the whole document
+PATCH_MODE_ENABLED = os.getenv("WEBWEAVER_PATCH_MODE", "1") != "0"
+
+# Modifications rerun only the design/content stages the feedback affects (others come from the workspace stages.json)
+STAGE_REUSE_ENABLED = os.getenv("WEBWEAVER_STAGE_REUSE", "1") != "0"
+
+# Generate the page skeleton and every section concurrently, then stitch them locally
+SECTIONED_HTML_ENABLED = os.getenv("WEBWEAVER_SECTIONED_HTML", "0") == "1"
+SECTIONED_HTML_MIN_SECTIONS = int(os.getenv("WEBWEAVER_SECTIONED_MIN_SECTIONS", "3"))
+
+# Durable agent memory shared across sessions (write-through SQLite); off by default in replay
+# mode, where history from earlier runs would make the prompts differ from the recorded ones
+MEMORY_STORE_ENABLED = os.getenv("WEBWEAVER_MEMORY_STORE", "0" if LLM_MODE == "replay" else "1") != "0"
+MEMORY_STORE_PATH = os.getenv(
+    "WEBWEAVER_MEMORY_STORE_PATH",
+    os.path.join(os.path.expanduser("~"), ".webweaver", "agent_memory.sqlite3")
+)
+MEMORY_RETENTION_DAYS = float(os.getenv("WEBWEAVER_MEMORY_RETENTION_DAYS", "30"))
+MEMORY_MAX_PER_TYPE = int(os.getenv("WEBWEAVER_MEMORY_MAX_PER_TYPE", "500"))
+
+# Rank remembered interactions by similarity to the current task (hashed TF-IDF, NumPy)
+MEMORY_RETRIEVAL_DIM = int(os.getenv("WEBWEAVER_MEMORY_RETRIEVAL_DIM", "2048"))
+MEMORY_RETRIEVAL_CANDIDATES = int(os.getenv("WEBWEAVER_MEMORY_RETRIEVAL_CANDIDATES", "100"))
+
+# Run builds on a background worker pool; the UI polls the job status by id
+BACKGROUND_JOBS_ENABLED = os.getenv("WEBWEAVER_BACKGROUND_JOBS", "1") != "0"
+JOB_WORKERS = int(os.getenv("WEBWEAVER_JOB_WORKERS", "2"))
+JOB_DIR = os.getenv("WEBWEAVER_JOB_DIR", os.path.join(os.path.expanduser("~"), ".webweaver", "jobs"))
+JOB_POLL_SECONDS = float(os.getenv("WEBWEAVER_JOB_POLL_SECONDS", "1.5"))
+# Job status/preview files older than this are deleted (and their agents dropped)
+JOB_RETENTION_HOURS = float(os.getenv("WEBWEAVER_JOB_RETENTION_HOURS", "24"))
+
+# Ask the provider for schema-constrained JSON (PM, Design, Content, QA) instead of parsing a markdown fence
+STRUCTURED_OUTPUT_ENABLED = os.getenv("WEBWEAVER_STRUCTURED_OUTPUT", "1") != "0"
+# Per-schema max_tokens for structured requests, e.g. "content_generation=6000,design_system=3000"
+OUTPUT_TOKEN_CAPS_SPEC = os.getenv("WEBWEAVER_OUTPUT_TOKEN_CAPS", "")
+
+# Process-wide cap on concurrent LLM calls; waiting calls are served round-robin per session
+LLM_MAX_IN_FLIGHT = int(os.getenv("WEBWEAVER_LLM_MAX_IN_FLIGHT", "4"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("WEBWEAVER_LLM_RATE_LIMIT_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("WEBWEAVER_LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = 30.0
+
+# Identical concurrent prompts share one in-flight request
+SINGLE_FLIGHT_ENABLED = os.getenv("WEBWEAVER_SINGLE_FLIGHT", "1") != "0"
+
+# Hedged requests: a second identical request is sent when the first is slower than the agent's usual latency
+HEDGE_AGENTS = {
+    name.strip() for name in os.getenv("WEBWEAVER_HEDGE_AGENTS", "HTMLAgent").split(",") if name.strip()
+}
+HEDGE_PERCENTILE = float(os.getenv("WEBWEAVER_HEDGE_PERCENTILE", "90"))
+HEDGE_MIN_SAMPLES = int(os.getenv("WEBWEAVER_HEDGE_MIN_SAMPLES", "5"))
+# Opt-in per-agent deadlines in seconds, e.g. "HTMLAgent=600,QAAgent=60"; set them well above the
+# agent's normal latency (full-page HTML generation can take minutes). A call that misses its
+# deadline is retried once as a plain request without hedging or deadline.
+LLM_TIMEOUTS_SPEC = os.getenv("WEBWEAVER_LLM_TIMEOUTS", "")
+
+# Token/cost accounting; a workflow over budget stops its review loops (0 = unlimited)
+WORKFLOW_TOKEN_BUDGET = int(os.getenv("WEBWEAVER_WORKFLOW_TOKEN_BUDGET", "0"))
+WORKFLOW_COST_BUDGET = float(os.getenv("WEBWEAVER_WORKFLOW_COST_BUDGET_USD", "0"))
+# USD per 1K (input, output) tokens
+MODEL_PRICES = {
+    "gpt-4o": (
+        float(os.getenv("WEBWEAVER_PRICE_INPUT_PER_1K", "0.0025")),
+        float(os.getenv("WEBWEAVER_PRICE_OUTPUT_PER_1K", "0.01"))
+    ),
+    "gpt-4o-mini": (0.00015, 0.0006),
+}
+# Input tokens served from the provider's prompt cache are billed at this fraction of the input price
+CACHED_INPUT_PRICE_FACTOR = float(os.getenv("WEBWEAVER_CACHED_INPUT_PRICE_FACTOR", "0.5"))
+# Per-session token totals kept in memory; the least recently used session's totals are dropped beyond this
+USAGE_MAX_SESSIONS = int(os.getenv("WEBWEAVER_USAGE_MAX_SESSIONS", "256"))
+
+# Per-agent model routing: JSON file path or inline JSON, e.g.
+# {"QAAgent": {"model": "gpt-4o-mini", "temperature": 0, "max_tokens": 800}, "HTMLAgent": null}
+# Keys are agent names or "Agent.schema" (e.g. "ProductManager.validation"); null restores the default model
+MODEL_CONFIG = os.getenv("WEBWEAVER_MODEL_CONFIG", "")
+DEFAULT_MODEL_ROUTES = {
+    "QAAgent": {"model": "gpt-4o-mini", "temperature": 0},
+    "ProductManager.validation": {"model": "gpt-4o-mini", "temperature": 0},
+}
+
+# HTML/QA loops stop early once candidates or review feedback stop changing
+CONVERGENCE_HTML_SIMILARITY = float(os.getenv("WEBWEAVER_CONVERGENCE_HTML_SIMILARITY", "0.995"))
+CONVERGENCE_FEEDBACK_SIMILARITY = float(os.getenv("WEBWEAVER_CONVERGENCE_FEEDBACK_SIMILARITY", "0.85"))
+
+class LLMResponseCache:
+    """Disk-backed, content-addressed cache for LLM responses with LRU eviction"""
+    def __init__(self, db_path, max_entries=2000, max_bytes=200 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+
+    def _connect(self):
+        """Open a short-lived connection (safe to use from any thread)"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def make_key(model_name, temperature, prompt, options=None):
+        """Hash model name, temperature, full prompt and any request options into a cache key"""
+        parts = [model_name, temperature, prompt]
+        if options:
+            parts.append(options)
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return cached content for key, or None on miss/expiry"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT content, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and now - row[1] <= self.max_age:
+                conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[0]
+
+            if row:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, key, model_name, content):
+        """Store content and evict expired / least recently used entries"""
+        now = time.time()
+        size = len(content.encode('utf-8'))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, content, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, content, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def discard(self, key):
+        """Remove a single entry (e.g. a response that failed to parse)"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently used ones until within limits"""
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age,))
+
+        count, total_size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall():
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count -= 1
+            total_size -= size
+            evicted += 1
+        print(f"[LLMCache] Evicted {evicted} least recently used entries")
+
+    def stats(self):
+        """Return hit/miss counters and current cache size"""
+        with self._lock, self._connect() as conn:
+            count, total_size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': count,
+            'bytes': total_size
+        }
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Get the process-wide LLM response cache (None if disabled or unavailable)"""
+    global _llm_cache, LLM_CACHE_ENABLED
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            try:
+                _llm_cache = LLMResponseCache(
+                    LLM_CACHE_PATH,
+                    max_entries=LLM_CACHE_MAX_ENTRIES,
+                    max_bytes=LLM_CACHE_MAX_BYTES,
+                    max_age=LLM_CACHE_MAX_AGE
+                )
+            except Exception as e:
+                print(f"[LLMCache] Disabled - could not open {LLM_CACHE_PATH}: {e}")
+                LLM_CACHE_ENABLED = False
+                return None
+    return _llm_cache
+
+def _llm_cache_key(prompt, llm=None, options=None):
+    """Cache key for a prompt sent to the given (default: global) model (a RenderedPrompt is keyed on its cache_view)"""
+    prompt = getattr(prompt, 'cache_view', None) or prompt
+    llm = llm or LLM_MODEL
+    model_name = getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or type(llm).__name__
+    return LLMResponseCache.make_key(str(model_name), getattr(llm, 'temperature', None), prompt, options)
+
+def _cache_lookup(prompt, agent_name, use_cache, options=None):
+    """Return (cache, key, cached_content) for a prompt; cache is None when bypassed"""
+    cache = get_llm_cache() if use_cache and agent_name not in LLM_CACHE_SKIP_AGENTS else None
+    if not cache:
+        return None, None, None
+
+    key = _llm_cache_key(prompt, options=options)
+    try:
+        cached = cache.get(key)
+    except sqlite3.Error as e:
+        print(f"[LLMCache] Lookup failed: {e}")
+        cached = None
+    if cached is not None:
+        print(f"[LLMCache] Hit for {agent_name}")
+    return cache, key, cached
+
+def routed_model_name(options):
+    """Model a call with these request options is sent to (the route's model, else the default model)"""
+    return (options or {}).get('model') or getattr(LLM_MODEL, 'model_name', None)
+
+def _cache_store(cache, key, content, options=None):
+    """Store a fresh response under the model it was routed to (no-op when the cache was bypassed)"""
+    if cache and content:
+        try:
+            cache.put(key, routed_model_name(options), content)
+        except sqlite3.Error as e:
+            print(f"[LLMCache] Store failed: {e}")
+
+# Which queue an LLM call waits in: a Streamlit session id (or job owner); None falls back to the script context
+_llm_session = contextvars.ContextVar('webweaver_llm_session', default=None)
+
+def current_llm_session():
+    """Scheduling key for LLM calls made from this thread/task"""
+    session = _llm_session.get()
+    if session:
+        return session
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+    return getattr(ctx, 'session_id', None) or "default"
+
+@contextlib.contextmanager
+def llm_session(session):
+    """Schedule LLM calls made inside the block under session"""
+    token = _llm_session.set(session)
+    try:
+        yield
+    finally:
+        _llm_session.reset(token)
+
+class LLMScheduler:
+    """Process-wide cap on in-flight LLM calls; waiting calls are granted round-robin across sessions"""
+    
+    class _Waiter:
+        __slots__ = ('grant', 'granted')
+        
+        def __init__(self, grant):
+            self.grant = grant
+            self.granted = False
+    
+    def __init__(self, max_in_flight=4):
+        self.max_in_flight = max(1, max_in_flight)
+        self.in_flight = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+        # session -> waiting calls; dict order is the round-robin order
+        self._queues = {}
+    
+    def _enqueue(self, session, grant):
+        """Take a free slot (returns None) or queue a waiter that grant() wakes later"""
+        with self._lock:
+            if self.in_flight < self.max_in_flight and not self._queues:
+                self.in_flight += 1
+                return None
+            waiter = self._Waiter(grant)
+            self._queues.setdefault(session, deque()).append(waiter)
+            return waiter
+    
+    def _dispatch(self):
+        """Grant free slots, one call per session in turn (caller holds the lock)"""
+        while self.in_flight < self.max_in_flight and self._queues:
+            session = next(iter(self._queues))
+            queue = self._queues.pop(session)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[session] = queue
+            self.in_flight += 1
+            waiter.granted = True
+            waiter.grant()
+    
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._dispatch()
+    
+    def note_retry(self):
+        with self._lock:
+            self.retries += 1
+    
+    def acquire(self, session):
+        """Block the calling thread until a slot is granted"""
+        event = threading.Event()
+        if self._enqueue(session, event.set):
+            event.wait()
+    
+    async def aacquire(self, session):
+        """Wait for a slot without blocking the event loop (cancellation gives the place back)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+        
+        waiter = self._enqueue(session, grant)
+        if waiter is None:
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    queue = self._queues.get(session)
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[session]
+            if granted:
+                self.release()
+            raise
+    
+    @contextlib.contextmanager
+    def slot(self, session):
+        self.acquire(session)
+        try:
+            yield
+        finally:
+            self.release()
+    
+    @contextlib.asynccontextmanager
+    async def aslot(self, session):
+        await self.aacquire(session)
+        try:
+            yield
+        finally:
+            self.release()
+    
+    def has_capacity(self):
+        """True if a call would get a slot right away (nothing queued, a slot free)"""
+        with self._lock:
+            return self.in_flight < self.max_in_flight and not self._queues
+    
+    def stats(self):
+        """In-flight and queued call counts plus rate-limit retries so far"""
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'queued': sum(len(queue) for queue in self._queues.values()),
+                'sessions_waiting': len(self._queues),
+                'retries': self.retries
+            }
+
+_llm_scheduler = None
+_llm_scheduler_lock = threading.Lock()
+
+def get_llm_scheduler():
+    """Get (and lazily create) the process-wide LLM call scheduler"""
+    global _llm_scheduler
+    with _llm_scheduler_lock:
+        if _llm_scheduler is None:
+            _llm_scheduler = LLMScheduler(LLM_MAX_IN_FLIGHT)
+    return _llm_scheduler
+
+def _is_rate_limited(error):
+    """True for provider 429 / rate-limit errors"""
+    return type(error).__name__ == "RateLimitError" or getattr(error, 'status_code', None) == 429
+
+def _rate_limit_backoff(scheduler, agent_name, attempt):
+    """Full-jitter exponential backoff delay (seconds) for a rate-limited call"""
+    scheduler.note_retry()
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    print(f"[LLMScheduler] {agent_name} rate limited - retry {attempt + 1}/{LLM_RATE_LIMIT_RETRIES} in {delay:.1f}s")
+    return delay
+
+class TokenUsage:
+    """Thread-safe token and cost totals for a scope (workflow or session), overall and per agent"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.estimated_calls = 0
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.by_agent = {}
+    
+    @property
+    def total_tokens(self):
+        return self.input_tokens + self.output_tokens
+    
+    def add(self, agent_name, input_tokens, output_tokens, cost, estimated=False, cached_tokens=0):
+        with self._lock:
+            self.calls += 1
+            self.estimated_calls += int(estimated)
+            self.input_tokens += input_tokens
+            self.cached_input_tokens += cached_tokens
+            self.output_tokens += output_tokens
+            self.cost += cost
+            agent = self.by_agent.setdefault(agent_name, {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cost': 0.0})
+            agent['calls'] += 1
+            agent['input_tokens'] += input_tokens
+            agent['output_tokens'] += output_tokens
+            agent['cost'] += cost
+    
+    def summary(self):
+        """Plain-dict snapshot (JSON serializable)"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'estimated_calls': self.estimated_calls,
+                'input_tokens': self.input_tokens,
+                'cached_input_tokens': self.cached_input_tokens,
+                'output_tokens': self.output_tokens,
+                'cost_usd': round(self.cost, 6),
+                'by_agent': {name: dict(agent, cost=round(agent['cost'], 6)) for name, agent in self.by_agent.items()}
+            }
+
+# Usage meters (e.g. the running workflow's) that every LLM call in this thread/task is charged to
+_usage_meters = contextvars.ContextVar('webweaver_usage_meters', default=())
+_session_usage = OrderedDict()
+_session_usage_lock = threading.Lock()
+
+@contextlib.contextmanager
+def usage_scope(meter):
+    """Charge LLM calls made inside the block to meter as well"""
+    token = _usage_meters.set(_usage_meters.get() + (meter,))
+    try:
+        yield meter
+    finally:
+        _usage_meters.reset(token)
+
+def get_session_usage(session=None):
+    """Token totals for a session (default: the current LLM scheduling session); keeps the last USAGE_MAX_SESSIONS"""
+    session = session or current_llm_session()
+    with _session_usage_lock:
+        if session in _session_usage:
+            _session_usage.move_to_end(session)
+        else:
+            _session_usage[session] = TokenUsage()
+            while len(_session_usage) > max(USAGE_MAX_SESSIONS, 1):
+                _session_usage.popitem(last=False)
+        return _session_usage[session]
+
+_token_encoding = None
+
+def count_tokens(text):
+    """Local token count: tiktoken's o200k_base (GPT-4o) when available, else ~4 characters per token"""
+    global _token_encoding, tiktoken
+    if not isinstance(text, str):
+        text = "\n".join(content for _, content in prompt_messages(text))
+    if tiktoken is not None and _token_encoding is None:
+        try:
+            _token_encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # The encoding is downloaded on first use; offline installs fall back to the estimate
+            print(f"[Usage] tiktoken unavailable ({e}) - estimating tokens from length")
+            tiktoken = None
+    if _token_encoding is not None:
+        return len(_token_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4
+
+def llm_cost(model, input_tokens, output_tokens, cached_tokens=0):
+    """USD cost of a call at MODEL_PRICES (unknown models are priced as gpt-4o)
+
+    cached_tokens is the part of input_tokens read from the provider's prompt cache.
+    """
+    input_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4o"])
+    input_cost = (input_tokens - cached_tokens + cached_tokens * CACHED_INPUT_PRICE_FACTOR) / 1000 * input_price
+    return input_cost + output_tokens / 1000 * output_price
+
+def record_llm_usage(agent_name, prompt, options, content, usage=None):
+    """Charge one completed LLM call to the session and every active usage scope
+
+    usage is the provider's usage_metadata; without it tokens are counted locally.
+    """
+    estimated = not usage
+    cached_tokens = 0
+    if estimated:
+        input_tokens, output_tokens = count_tokens(prompt), count_tokens(content or '')
+    else:
+        input_tokens, output_tokens = usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+        cached_tokens = (usage.get('input_token_details') or {}).get('cache_read', 0) or 0
+    
+    model = routed_model_name(options) or "gpt-4o"
+    cost = llm_cost(model, input_tokens, output_tokens, cached_tokens)
+    for meter in (get_session_usage(),) + _usage_meters.get():
+        meter.add(agent_name, input_tokens, output_tokens, cost, estimated, cached_tokens)
+
+def _record_response_usage(agent_name, prompt, options, response):
+    content = response.content if hasattr(response, 'content') else str(response)
+    record_llm_usage(agent_name, prompt, options, content, getattr(response, 'usage_metadata', None))
+
+def _stream_options(options):
+    """Ask OpenAI to report token usage on the final stream chunk"""
+    return dict(options, stream_usage=True) if _openai_backend() else options
+
+def scheduled_invoke(prompt, agent_name, options):
+    """LLM_MODEL.invoke inside a scheduler slot, retrying rate-limit errors (the slot is freed while backing off)"""
+    scheduler = get_llm_scheduler()
+    session = current_llm_session()
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        with scheduler.slot(session):
+            try:
+                response = LLM_MODEL.invoke(prompt, **options)
+                _record_response_usage(agent_name, prompt, options, response)
+                return response
+            except Exception as e:
+                if attempt == LLM_RATE_LIMIT_RETRIES or not _is_rate_limited(e):
+                    raise
+        time.sleep(_rate_limit_backoff(scheduler, agent_name, attempt))
+
+async def ascheduled_invoke(prompt, agent_name, options, on_send=None):
+    """Async variant of scheduled_invoke; on_send() is called each time the request leaves the queue"""
+    scheduler = get_llm_scheduler()
+    session = current_llm_session()
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        async with scheduler.aslot(session):
+            if on_send:
+                on_send()
+            try:
+                response = await LLM_MODEL.ainvoke(prompt, **options)
+                _record_response_usage(agent_name, prompt, options, response)
+                return response
+            except asyncio.CancelledError:
+                # Cancelled in flight (hedge loser, deadline): the prompt is billed all the same
+                record_llm_usage(agent_name, prompt, options, '')
+                raise
+            except Exception as e:
+                if attempt == LLM_RATE_LIMIT_RETRIES or not _is_rate_limited(e):
+                    raise
+        await asyncio.sleep(_rate_limit_backoff(scheduler, agent_name, attempt))
+
+def scheduled_stream(prompt, agent_name, options):
+    """LLM_MODEL.stream inside a scheduler slot; rate-limit errors are retried only before the first chunk"""
+    scheduler = get_llm_scheduler()
+    session = current_llm_session()
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        started = False
+        parts, usage = [], None
+        with scheduler.slot(session):
+            try:
+                for chunk in LLM_MODEL.stream(prompt, **_stream_options(options)):
+                    started = True
+                    parts.append(getattr(chunk, 'content', None) or '')
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    yield chunk
+                record_llm_usage(agent_name, prompt, options, ''.join(parts), usage)
+                return
+            except Exception as e:
+                if started or attempt == LLM_RATE_LIMIT_RETRIES or not _is_rate_limited(e):
+                    raise
+        time.sleep(_rate_limit_backoff(scheduler, agent_name, attempt))
+
+async def ascheduled_stream(prompt, agent_name, options, on_send=None):
+    """Async variant of scheduled_stream; on_send() is called each time the request leaves the queue"""
+    scheduler = get_llm_scheduler()
+    session = current_llm_session()
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        started = False
+        parts, usage = [], None
+        async with scheduler.aslot(session):
+            if on_send:
+                on_send()
+            try:
+                async for chunk in LLM_MODEL.astream(prompt, **_stream_options(options)):
+                    started = True
+                    parts.append(getattr(chunk, 'content', None) or '')
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    yield chunk
+                record_llm_usage(agent_name, prompt, options, ''.join(parts), usage)
+                return
+            except (asyncio.CancelledError, GeneratorExit):
+                # Cancelled or closed in flight (hedge loser, deadline): charge what was sent and received
+                record_llm_usage(agent_name, prompt, options, ''.join(parts), usage)
+                raise
+            except Exception as e:
+                if started or attempt == LLM_RATE_LIMIT_RETRIES or not _is_rate_limited(e):
+                    raise
+        await asyncio.sleep(_rate_limit_backoff(scheduler, agent_name, attempt))
+
+class LatencyTracker:
+    """Recent per-agent LLM latencies ("first_token" for streams, "complete" for invokes) for hedging decisions"""
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self.window = window
+    
+    def record(self, agent_name, kind, seconds):
+        with self._lock:
+            self._samples.setdefault((agent_name, kind), deque(maxlen=self.window)).append(seconds)
+    
+    def percentile(self, agent_name, kind, percent, min_samples=5):
+        """Latency at the given percentile, or None until min_samples calls have been seen"""
+        with self._lock:
+            samples = sorted(self._samples.get((agent_name, kind), ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+        return samples[index]
+
+_latency_tracker = LatencyTracker()
+# Hedged calls: "hedged" second requests launched, "hedge_won" times the second request finished first,
+# "deadline_fallback" calls retried without hedging after missing their deadline
+HEDGE_STATS = Counter()
+
+def _agent_seconds(spec):
+    """Parse "Agent=seconds,Agent2=seconds" (or "schema=tokens") into a dict"""
+    limits = {}
+    for item in spec.split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            limits[name.strip()] = float(seconds)
+    return limits
+
+LLM_TIMEOUTS = _agent_seconds(LLM_TIMEOUTS_SPEC)
+
+def _uses_agent_loop(agent_name):
+    """Hedged or deadline-bound agents always run their LLM calls on the agent loop (where losers can be cancelled)"""
+    return agent_name in HEDGE_AGENTS or agent_name in LLM_TIMEOUTS
+
+def hedge_delay(agent_name, kind):
+    """Seconds to wait before sending a second identical request; None = do not hedge"""
+    if agent_name not in HEDGE_AGENTS:
+        return None
+    return _latency_tracker.percentile(agent_name, kind, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+
+class _SendClock:
+    """Marks when an attempt got its scheduler slot, i.e. when its request was actually sent"""
+    def __init__(self):
+        self.sent = asyncio.Event()
+        self.at = None
+    
+    def mark(self):
+        self.at = time.perf_counter()
+        self.sent.set()
+
+async def _timed(agent_name, kind, start_attempt, clock):
+    """Run start_attempt(clock.mark) and record its latency from the send (time queued for a slot excluded)"""
+    result = await start_attempt(clock.mark)
+    if clock.at is not None:
+        _latency_tracker.record(agent_name, kind, time.perf_counter() - clock.at)
+    return result
+
+async def _race_hedged(agent_name, kind, start_attempt, discard=None):
+    """Run start_attempt(on_send); if it is still pending hedge_delay after it was sent, race a second attempt
+
+    The first success wins and the other attempt is cancelled; discard(result) cleans up a loser
+    that also finished. No second request is sent while the scheduler has calls waiting for a slot.
+    """
+    delay = hedge_delay(agent_name, kind)
+    clock = _SendClock()
+    primary = asyncio.ensure_future(_timed(agent_name, kind, start_attempt, clock))
+    pending = {primary}
+    try:
+        if delay is not None:
+            # The hedge timer starts when the request is sent, not while it waits for a slot
+            sent = asyncio.ensure_future(clock.sent.wait())
+            try:
+                await asyncio.wait({primary, sent}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sent.cancel()
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and not get_llm_scheduler().has_capacity():
+                # Saturated: a second request would only queue behind (and slow down) everyone else
+                HEDGE_STATS["hedge_skipped"] += 1
+            elif not done:
+                HEDGE_STATS["hedged"] += 1
+                print(f"[Hedge] {agent_name}: no {'first token' if kind == 'first_token' else 'response'} after {delay:.1f}s - sending a second request")
+                pending.add(asyncio.ensure_future(_timed(agent_name, kind, start_attempt, _SendClock())))
+        
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+            if winner is None:
+                error = next(iter(done)).exception()
+                continue
+            for task in done - {winner}:
+                if discard and task.exception() is None:
+                    discard(task.result())
+            if winner is not primary:
+                HEDGE_STATS["hedge_won"] += 1
+            return winner.result()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def _deadline_fallback(prompt, agent_name, options, cache, key):
+    """After a call missed its agent deadline, send one plain request (no hedge, no deadline) instead of failing"""
+    HEDGE_STATS["deadline_fallback"] += 1
+    print(f"[Hedge] {agent_name}: no answer within {LLM_TIMEOUTS[agent_name]:.0f}s - retrying once without hedging")
+    response = await ascheduled_invoke(prompt, agent_name, options)
+    content = response.content if hasattr(response, 'content') else str(response)
+    await asyncio.to_thread(_cache_store, cache, key, content, options)
+    return content
+
+async def hedged_invoke(prompt, agent_name, options):
+    """ascheduled_invoke with a hedged second request when completion is slower than usual"""
+    return await _race_hedged(agent_name, "complete", lambda on_send: ascheduled_invoke(prompt, agent_name, options, on_send))
+
+async def hedged_stream(prompt, agent_name, options):
+    """ascheduled_stream that hedges on time to first token, then streams from whichever request answered first"""
+    async def open_stream(on_send):
+        stream = ascheduled_stream(prompt, agent_name, options, on_send)
+        try:
+            return await stream.__anext__(), stream
+        except StopAsyncIteration:
+            return None, stream
+    
+    def close(opened):
+        asyncio.ensure_future(opened[1].aclose())
+    
+    first, stream = await _race_hedged(agent_name, "first_token", open_stream, discard=close)
+    try:
+        if first is not None:
+            yield first
+            async for chunk in stream:
+                yield chunk
+    finally:
+        await stream.aclose()
+
+class SingleFlight:
+    """Coalesces identical concurrent LLM calls: the first caller sends the request, later ones share its result"""
+    
+    class Abandoned(Exception):
+        """The leading call was cancelled; callers waiting on it retry"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+    
+    def _join(self, key):
+        """Return (future, is_leader) for key, registering a new flight if none is in progress"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = concurrent.futures.Future()
+                self.leaders += 1
+                return flight, True
+            self.coalesced += 1
+            return flight, False
+    
+    def _finish(self, key, flight, result=None, error=None):
+        # Drop the key first so callers arriving after completion start a fresh request
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+    
+    def run(self, key, fn):
+        """Return fn() for the first caller of key; concurrent callers block and get the same result"""
+        while True:
+            flight, leader = self._join(key)
+            if not leader:
+                try:
+                    return flight.result()
+                except self.Abandoned:
+                    continue
+            
+            try:
+                result = fn()
+            except Exception as e:
+                self._finish(key, flight, error=e)
+                raise
+            except BaseException:
+                self._finish(key, flight, error=self.Abandoned())
+                raise
+            self._finish(key, flight, result)
+            return result
+    
+    async def arun(self, key, factory):
+        """Async variant of run; factory() returns the coroutine to await when leading"""
+        while True:
+            flight, leader = self._join(key)
+            if not leader:
+                try:
+                    # Shielded so a cancelled follower does not cancel the shared flight
+                    return await asyncio.shield(asyncio.wrap_future(flight))
+                except self.Abandoned:
+                    continue
+            
+            try:
+                result = await factory()
+            except asyncio.CancelledError:
+                self._finish(key, flight, error=self.Abandoned())
+                raise
+            except Exception as e:
+                self._finish(key, flight, error=e)
+                raise
+            self._finish(key, flight, result)
+            return result
+    
+    def stats(self):
+        with self._lock:
+            return {'leaders': self.leaders, 'coalesced': self.coalesced, 'in_flight': len(self._flights)}
+
+_single_flight = SingleFlight()
+
+def _flight_key(prompt, options):
+    """Single-flight key (None disables coalescing)"""
+    return _llm_cache_key(prompt, options=options) if SINGLE_FLIGHT_ENABLED else None
+
+def coalesce_llm_call(prompt, options, fn):
+    """Run fn() unless an identical call is already in flight, in which case share its response text"""
+    key = _flight_key(prompt, options)
+    return _single_flight.run(key, fn) if key else fn()
+
+async def acoalesce_llm_call(prompt, options, factory):
+    """Async variant of coalesce_llm_call"""
+    key = _flight_key(prompt, options)
+    return await (_single_flight.arun(key, factory) if key else factory())
+
+def _partial_once(content, on_partial, agent_name):
+    """Render the finished response once (callers that joined another stream saw no partials) and return it"""
+    try:
+        on_partial(content)
+    except Exception as e:
+        print(f"[{agent_name}] Preview update failed: {e}")
+    return content
+
+def invoke_llm(prompt, agent_name, use_cache=True, schema=None):
+    """Invoke the shared LLM and return the response text, serving repeats from the cache
+
+    schema names an entry of OUTPUT_SCHEMAS; when structured output is available the
+    provider is asked for JSON matching it (see structured_output_options). The agent's
+    model route is applied as well (see llm_request_options).
+    """
+    if _uses_agent_loop(agent_name):
+        return run_agent_coroutine(ainvoke_llm(prompt, agent_name, use_cache, schema))
+    
+    options = llm_request_options(agent_name, schema)
+    cache, key, cached = _cache_lookup(prompt, agent_name, use_cache, options)
+    if cached is not None:
+        return cached
+
+    def call():
+        _log_route(agent_name, options)
+        response = scheduled_invoke(prompt, agent_name, options)
+        content = response.content if hasattr(response, 'content') else str(response)
+        _cache_store(cache, key, content, options)
+        return content
+
+    return coalesce_llm_call(prompt, options, call)
+
+def stream_llm(prompt, agent_name, on_partial, use_cache=True, refresh_interval=1.0):
+    """Stream the LLM response, passing the accumulated text to on_partial at most every refresh_interval seconds"""
+    if _uses_agent_loop(agent_name):
+        return run_agent_coroutine(astream_llm(prompt, agent_name, on_partial, use_cache, refresh_interval))
+    
+    options = llm_request_options(agent_name)
+    cache, key, cached = _cache_lookup(prompt, agent_name, use_cache, options)
+    if cached is not None:
+        on_partial(cached)
+        return cached
+
+    def call():
+        _log_route(agent_name, options)
+        parts = []
+        last_refresh = time.time()
+        for chunk in scheduled_stream(prompt, agent_name, options):
+            text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if not text:
+                continue
+            parts.append(text)
+
+            now = time.time()
+            if now - last_refresh >= refresh_interval:
+                last_refresh = now
+                try:
+                    on_partial(''.join(parts))
+                except Exception as e:
+                    print(f"[{agent_name}] Preview update failed: {e}")
+
+        content = ''.join(parts)
+        _cache_store(cache, key, content, options)
+        return content
+
+    # A caller that joined someone else's stream only sees the finished page
+    return _partial_once(coalesce_llm_call(prompt, options, call), on_partial, agent_name)
+
+async def ainvoke_llm(prompt, agent_name, use_cache=True, schema=None):
+    """Async variant of invoke_llm using the LangChain ainvoke API"""
+    options = llm_request_options(agent_name, schema)
+    cache, key, cached = await asyncio.to_thread(_cache_lookup, prompt, agent_name, use_cache, options)
+    if cached is not None:
+        return cached
+
+    async def call():
+        _log_route(agent_name, options)
+        response = await hedged_invoke(prompt, agent_name, options)
+        content = response.content if hasattr(response, 'content') else str(response)
+        await asyncio.to_thread(_cache_store, cache, key, content, options)
+        return content
+
+    try:
+        return await asyncio.wait_for(acoalesce_llm_call(prompt, options, call), LLM_TIMEOUTS.get(agent_name))
+    except asyncio.TimeoutError:
+        return await _deadline_fallback(prompt, agent_name, options, cache, key)
+
+async def astream_llm(prompt, agent_name, on_partial, use_cache=True, refresh_interval=1.0):
+    """Async variant of stream_llm using the LangChain astream API"""
+    options = llm_request_options(agent_name)
+    cache, key, cached = await asyncio.to_thread(_cache_lookup, prompt, agent_name, use_cache, options)
+    if cached is not None:
+        on_partial(cached)
+        return cached
+
+    async def call():
+        _log_route(agent_name, options)
+        parts = []
+        last_refresh = time.time()
+        async for chunk in hedged_stream(prompt, agent_name, options):
+            text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if not text:
+                continue
+            parts.append(text)
+
+            now = time.time()
+            if now - last_refresh >= refresh_interval:
+                last_refresh = now
+                try:
+                    on_partial(''.join(parts))
+                except Exception as e:
+                    print(f"[{agent_name}] Preview update failed: {e}")
+
+        content = ''.join(parts)
+        await asyncio.to_thread(_cache_store, cache, key, content, options)
+        return content
+
+    try:
+        content = await asyncio.wait_for(acoalesce_llm_call(prompt, options, call), LLM_TIMEOUTS.get(agent_name))
+    except asyncio.TimeoutError:
+        content = await _deadline_fallback(prompt, agent_name, options, cache, key)
+    return _partial_once(content, on_partial, agent_name)
+
+class AgentEventLoop:
+    """Process-wide asyncio loop on a daemon thread that runs agent coroutines for all sessions"""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="webweaver-agent-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine from any thread and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the agent loop and block the calling thread until it finishes"""
+        return self.submit(coro).result(timeout)
+
+_agent_loop = None
+_agent_loop_lock = threading.Lock()
+
+def get_agent_loop():
+    """Get (and lazily start) the shared agent event loop"""
+    global _agent_loop
+    with _agent_loop_lock:
+        if _agent_loop is None:
+            _agent_loop = AgentEventLoop()
+    return _agent_loop
+
+async def _in_context(coro, values):
+    for var, value in values:
+        var.set(value)
+    return await coro
+
+def run_agent_coroutine(coro, timeout=None):
+    """Run an agent coroutine on the shared event loop from synchronous (Streamlit) code"""
+    # Tasks on the loop do not inherit the caller's context; carry its context variables
+    # (progress sink, usage scopes) and scheduling session over
+    values = list(contextvars.copy_context().items()) + [(_llm_session, current_llm_session())]
+    return get_agent_loop().run(_in_context(coro, values), timeout)
+
+# Where workflow progress messages go: None means the current Streamlit page
+_progress_sink = contextvars.ContextVar('webweaver_progress_sink', default=None)
+
+def report_progress(level, message):
+    """Show a workflow status message ("info", "success", "warning", "error") on the page or the active job"""
+    sink = _progress_sink.get()
+    if sink:
+        sink(level, message)
+    else:
+        getattr(st, level)(message)
+
+@contextlib.contextmanager
+def progress_sink(sink):
+    """Route report_progress messages from this thread to sink(level, message) (e.g. a job record or stdout)"""
+    token = _progress_sink.set(sink)
+    try:
+        yield
+    finally:
+        _progress_sink.reset(token)
+
+def bind_script_context(fn):
+    """Wrap fn so Streamlit calls and progress reporting inside it work from worker threads / the agent loop"""
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+    # Progress sink, LLM session and usage scopes travel with the context variables
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        # A fresh copy per call: one Context cannot be entered by two threads at once
+        return context.copy().run(fn, *args, **kwargs)
+    return bound
+
+def forget_llm_response(prompt, agent_name=None, schema=None):
+    """Drop a cached response for prompt so the next call goes to the LLM again"""
+    cache = get_llm_cache()
+    if cache and LLM_MODEL:
+        try:
+            cache.discard(_llm_cache_key(prompt, options=llm_request_options(agent_name, schema)))
+        except sqlite3.Error as e:
+            print(f"[LLMCache] Discard failed: {e}")
+
+_json_decoder = json.JSONDecoder()
+# How LLM JSON responses were parsed ("direct", "repaired", "failed") - for profiling
+JSON_EXTRACT_STATS = Counter()
+
+def _json_block_end(text, start):
+    """End (exclusive) of the balanced {...} block opening at start, skipping braces in strings; None if unterminated"""
+    depth = 0
+    quote = None
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"' or (quote == '“' and char == '”'):
+                quote = None
+        elif char in '"“':
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return None
+
+def _repair_json(text):
+    """Fix smart-quote delimiters and trailing commas in one pass; returns (text, fixes applied)"""
+    out = []
+    fixes = set()
+    quote = None
+    escaped = False
+    for index, char in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"' or (quote == '“' and char == '”'):
+                quote = None
+                char = '"'
+            out.append(char)
+            continue
+        
+        if char in '"“':
+            if char == '“':
+                fixes.add("smart quotes")
+            quote = char
+            out.append('"')
+        elif char == ',':
+            following = index + 1
+            while following < len(text) and text[following].isspace():
+                following += 1
+            if following < len(text) and text[following] in '}]':
+                fixes.add("trailing commas")
+            else:
+                out.append(char)
+        else:
+            out.append(char)
+    return ''.join(out), sorted(fixes)
+
+# "{" followed by a key or "}" - the opening of a JSON object rather than a brace in prose
+_JSON_OBJECT_START = re.compile(r'\{\s*["“}]')
+
+def _scan_json(text, start, stop):
+    """First decodable JSON object between start and stop; returns (object, strategy) or (None, None)"""
+    position = text.find('{', start, stop)
+    while position != -1:
+        try:
+            result, _ = _json_decoder.raw_decode(text, position)
+            if isinstance(result, dict):
+                return result, "direct"
+        except ValueError:
+            pass
+        
+        end = _json_block_end(text, position)
+        if end is None:
+            if _JSON_OBJECT_START.match(text, position):
+                # Truncated object - the braces after it are its own nested values, not a separate answer
+                return None, None
+            # A stray brace in prose - a complete object may still follow
+            position = text.find('{', position + 1, stop)
+            continue
+        
+        repaired, fixes = _repair_json(text[position:end])
+        if fixes:
+            try:
+                result = json.loads(repaired)
+                if isinstance(result, dict):
+                    return result, f"repaired ({', '.join(fixes)})"
+            except ValueError:
+                pass
+        
+        # Skip the whole block instead of retrying every nested brace
+        position = text.find('{', end, stop)
+    return None, None
+
+def extract_json(content, source="LLM"):
+    """Extract the JSON object from an LLM response (prefers a ```json fence); None if there is none"""
+    text = content or ''
+    fence = text.find('```json')
+    
+    result, strategy = _scan_json(text, max(fence, 0), len(text))
+    if result is None and fence > 0:
+        result, strategy = _scan_json(text, 0, fence)
+    
+    JSON_EXTRACT_STATS[strategy.split(' ')[0] if strategy else "failed"] += 1
+    if result is None:
+        print(f"[JSON] {source}: no parsable JSON object in response ({len(text)} chars)")
+    elif strategy != "direct":
+        print(f"[JSON] {source}: parsed after {strategy}")
+    return result
+
+# Typed models mirroring each agent's OUTPUT FORMAT block, keyed by the memory interaction type.
+# Fields the workflow reads are required and typed; descriptive ones are Any and default, so terse
+# or richer answers (nested section specs, numeric scales, metric objects) still validate.
+if BaseModel is not None:
+    class _AgentOutput(BaseModel):
+        model_config = ConfigDict(extra="allow")
+    
+    Score = str | int | float | None
+    
+    class BusinessAnalysis(_AgentOutput):
+        business_type: Any = ""
+        target_market: Any = ""
+        competitive_positioning: Any = ""
+        success_metrics: list[Any] = []
+    
+    class EnhancedRequirements(_AgentOutput):
+        primary_objectives: list[Any] = []
+        user_journey: Any = ""
+        conversion_goals: list[Any] = []
+        technical_requirements: list[Any] = []
+        content_strategy: Any = ""
+    
+    class RequirementsAnalysis(_AgentOutput):
+        analysis: BusinessAnalysis
+        enhanced_requirements: EnhancedRequirements
+        design_agent_prompt: str
+    
+    class ValidationResult(_AgentOutput):
+        validation_passed: bool
+        score: Score = None
+        missing_core_requirements: list[Any] = []
+        feedback: str = ""
+    
+    class DesignStrategy(_AgentOutput):
+        visual_concept: Any = ""
+        user_experience_goal: Any = ""
+        brand_personality: Any = ""
+        design_principles: list[Any] = []
+    
+    class ColorPalette(_AgentOutput):
+        primary: str
+        secondary: str = ""
+        accent: str = ""
+        text: str = ""
+        background: str = ""
+    
+    class VisualSystem(_AgentOutput):
+        color_palette: ColorPalette
+        typography: dict[str, Any] = {}
+        layout: dict[str, Any] = {}
+        components: dict[str, Any] = {}
+    
+    class DesignSystem(_AgentOutput):
+        design_strategy: DesignStrategy
+        visual_system: VisualSystem
+        sections_design: dict[str, Any] = {}
+        content_agent_prompt: str
+    
+    class ContentStrategy(_AgentOutput):
+        brand_voice: Any = ""
+        messaging_framework: Any = ""
+        target_persona: Any = ""
+        conversion_strategy: Any = ""
+    
+    class WebsiteContent(_AgentOutput):
+        content_strategy: ContentStrategy
+        website_content: dict
+        html_agent_prompt: str
+    
+    class ReviewIssue(_AgentOutput):
+        description: str
+        fix_suggestion: Any = ""
+    
+    class CodeReview(_AgentOutput):
+        qa_passed: bool
+        overall_score: Score = None
+        critical_issues: list[ReviewIssue] = []
+        suggestions: list[ReviewIssue] = []
+        feedback_for_html_agent: str = ""
+    
+    # schema -> (model, max_tokens); bare JSON needs no room for commentary around it
+    OUTPUT_SCHEMAS = {
+        "requirements_analysis": (RequirementsAnalysis, 1200),
+        "validation": (ValidationResult, 400),
+        "design_system": (DesignSystem, 2400),
+        "content_generation": (WebsiteContent, 4000),
+        "code_review": (CodeReview, 700),
+    }
+    for _schema, _cap in _agent_seconds(OUTPUT_TOKEN_CAPS_SPEC).items():
+        if _schema in OUTPUT_SCHEMAS:
+            OUTPUT_SCHEMAS[_schema] = (OUTPUT_SCHEMAS[_schema][0], int(_cap))
+        else:
+            print(f"[StructuredOutput] Ignoring token cap for unknown schema: {_schema}")
+else:
+    OUTPUT_SCHEMAS = {}
+
+_structured_formats = {}
+
+def _openai_backend():
+    """True if the shared model is (or wraps, e.g. ReplayLLM in record mode) a ChatOpenAI instance"""
+    llm = LLM_MODEL
+    while getattr(llm, 'llm', None) is not None:
+        llm = llm.llm
+    return OPENAI_AVAILABLE and isinstance(llm, ChatOpenAI)
+
+def structured_output_options(schema):
+    """Provider request options (json_schema response format, max_tokens) for schema; {} when unavailable"""
+    if not (STRUCTURED_OUTPUT_ENABLED and schema in OUTPUT_SCHEMAS and _openai_backend()):
+        return {}
+    
+    model, max_tokens = OUTPUT_SCHEMAS[schema]
+    if schema not in _structured_formats:
+        _structured_formats[schema] = {
+            "type": "json_schema",
+            "json_schema": {"name": model.__name__, "schema": model.model_json_schema(), "strict": False}
+        }
+    return {"response_format": _structured_formats[schema], "max_tokens": max_tokens}
+
+def load_model_routes(config=None):
+    """DEFAULT_MODEL_ROUTES merged with the WEBWEAVER_MODEL_CONFIG overrides (file path or inline JSON)"""
+    routes = {key: dict(route) for key, route in DEFAULT_MODEL_ROUTES.items()}
+    config = MODEL_CONFIG if config is None else config
+    if not config:
+        return routes
+    
+    try:
+        if config.lstrip().startswith('{'):
+            overrides = json.loads(config)
+        else:
+            with open(config, 'r', encoding='utf-8') as f:
+                overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[ModelRouter] Ignoring model config {config}: {e}")
+        return routes
+    
+    for key, route in overrides.items():
+        if route:
+            routes[key] = {name: route[name] for name in ("model", "temperature", "max_tokens") if route.get(name) is not None}
+        else:
+            routes.pop(key, None)
+    return routes
+
+MODEL_ROUTES = load_model_routes()
+
+def model_route(agent_name, schema=None):
+    """Model overrides for an agent call: "Agent.schema" first, then the agent name; {} uses the default model"""
+    return MODEL_ROUTES.get(f"{agent_name}.{schema}") or MODEL_ROUTES.get(agent_name) or {}
+
+def llm_request_options(agent_name, schema=None):
+    """Per-call invoke kwargs: the agent's model route plus structured output options (OpenAI backends only)"""
+    if not _openai_backend():
+        return {}
+    
+    options = dict(model_route(agent_name, schema))
+    structured = structured_output_options(schema)
+    if structured:
+        options["response_format"] = structured["response_format"]
+        # An explicit max_tokens on the route overrides the schema's cap
+        options.setdefault("max_tokens", structured["max_tokens"])
+    return options
 
-# Configure Streamlit page
-st.set_page_config(
-    page_title="WebWeaver Enterprise",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+def _log_route(agent_name, options):
+    """Record which model (and settings) an agent call is routed to"""
+    if "model" in options or "temperature" in options:
+        settings = ", ".join(f"{name}={options[name]}" for name in ("temperature", "max_tokens") if name in options)
+        model = routed_model_name(options) or 'default'
+        print(f"[ModelRouter] {agent_name} -> {model}" + (f" ({settings})" if settings else ""))
 
-# Initialize LLM models for multiagent system
-def get_available_llm():
-    """Get the best available LLM model"""
+def parse_agent_output(content, schema, source="LLM"):
+    """Extract the response JSON and validate it against OUTPUT_SCHEMAS[schema]
+
+    None if there is no JSON or a field the workflow reads is missing or mistyped. Mismatches
+    deeper in descriptive fields are only logged and the parsed dict is kept as-is, since the
+    basic fallback templates would be worse than a slightly off-schema answer.
+    """
+    result = extract_json(content, source)
+    if result is None or schema not in OUTPUT_SCHEMAS:
+        return result
+    
+    model, _ = OUTPUT_SCHEMAS[schema]
     try:
-        if OPENAI_API_KEY and OPENAI_AVAILABLE and ChatOpenAI:
-            try:
-                llm = ChatOpenAI(
-                    model="gpt-4o",
-                    api_key=OPENAI_API_KEY,
-                    temperature=0.7
-                )
-                return llm, "OpenAI GPT-4o"
-            except Exception as e:
-                print(f"OpenAI initialization failed: {e}")
-                return None, "OpenAI Failed"
-                
-    except Exception as e:
-        print(f"LLM initialization error: {e}")
+        return model.model_validate(result).model_dump()
+    except ValidationError as e:
+        required = {name for name, field in model.model_fields.items() if field.is_required()}
+        blocking = [error for error in e.errors()
+                    if error['type'] == 'missing' or (len(error['loc']) == 1 and error['loc'][0] in required)]
+        if blocking or not isinstance(result, dict):
+            JSON_EXTRACT_STATS["invalid"] += 1
+            print(f"[JSON] {source}: response does not match {model.__name__} ({e.error_count()} errors)")
+            return None
+        print(f"[JSON] {source}: keeping response despite {e.error_count()} {model.__name__} mismatch(es): "
+              + "; ".join(".".join(str(part) for part in error['loc']) for error in e.errors()))
+        return result
+
+class PromptContext:
+    """Renders agent outputs (design, content, requirements) as compact indented text for a receiving agent"""
     
-    return None, "No LLM Available"
+    # Top-level keys each receiving agent needs; prompts addressed to other agents are never forwarded
+    RELEVANT_KEYS = {
+        "content": {"design": ("design_strategy", "visual_system", "sections_design")},
+        "html": {
+            "design": ("design_strategy", "visual_system", "sections_design"),
+            "content": ("content_strategy", "website_content"),
+        },
+        "section": {"design": ("visual_system",)},
+        "qa": {
+            "design": ("visual_system", "sections_design"),
+            "content": ("website_content",),
+        },
+        "pm": {
+            "requirements": ("analysis", "enhanced_requirements"),
+            "design": ("design_strategy", "visual_system"),
+            "content": ("content_strategy", "website_content"),
+        },
+    }
+    
+    @classmethod
+    def render(cls, value, indent=0):
+        """Indented "key: value" lines; scalar lists on one line, empty values dropped"""
+        pad = "  " * indent
+        if isinstance(value, dict):
+            lines = []
+            for key, item in value.items():
+                if item in (None, "", [], {}):
+                    continue
+                label = str(key).replace('_', ' ')
+                if isinstance(item, (dict, list)) and not cls._is_flat(item):
+                    body = cls.render(item, indent + 1)
+                    if body.strip():
+                        lines.append(f"{pad}{label}:")
+                        lines.append(body)
+                else:
+                    lines.append(f"{pad}{label}: {cls._scalar(item)}")
+            return "\n".join(lines)
+        
+        if isinstance(value, list):
+            if cls._is_flat(value):
+                return f"{pad}{cls._scalar(value)}"
+            lines = []
+            for item in value:
+                body = cls.render(item, indent + 1).lstrip()
+                lines.append(f"{pad}- {body}")
+            return "\n".join(lines)
+        return f"{pad}{cls._scalar(value)}"
+    
+    @staticmethod
+    def _is_flat(value):
+        return isinstance(value, list) and not any(isinstance(item, (dict, list)) for item in value)
+    
+    @staticmethod
+    def _scalar(value):
+        if isinstance(value, list):
+            return ", ".join(" ".join(str(item).split()) for item in value if item not in (None, ""))
+        return " ".join(str(value).split())
+    
+    @classmethod
+    def compile(cls, role, **sections):
+        """Render each named section (design=..., content=...) for role; logs estimated tokens per section"""
+        keys = cls.RELEVANT_KEYS.get(role, {})
+        rendered = {}
+        report = []
+        for name, value in sections.items():
+            if isinstance(value, dict):
+                wanted = keys.get(name)
+                if wanted:
+                    value = {key: value[key] for key in wanted if key in value}
+                text = cls.render(value)
+            else:
+                text = " ".join(str(value or "").split())
+            rendered[name] = text or "none"
+            report.append(f"{name} {count_tokens(rendered[name])} (raw {count_tokens(str(sections[name]))})")
+        
+        print(f"[PromptContext] {role} tokens: {', '.join(report)}")
+        return rendered
 
-# Global LLM variables (initialized on first use)
-LLM_MODEL = None
-LLM_NAME = "No LLM Available"
-_llm_initialized = False
+def prompt_messages(prompt):
+    """[[role, content], ...] for a plain string, (role, content) tuples or LangChain messages"""
+    if isinstance(prompt, str):
+        return [["human", prompt]]
+    return [
+        [message[0], message[1]] if isinstance(message, (tuple, list))
+        else [getattr(message, 'type', ''), getattr(message, 'content', str(message))]
+        for message in prompt
+    ]
+
+# Every PromptTemplate by name (for the startup prefix report)
+PROMPT_TEMPLATES = {}
+
+class RenderedPrompt(list):
+    """Chat messages of a PromptTemplate plus the messages the response cache is keyed on (cache_view)"""
+    cache_view = None
+
+class PromptTemplate:
+    """Agent prompt split into a static system prefix and per-request sections
+
+    The system text is fixed when the template is defined and never formatted, so all
+    requests of a template start with the same bytes and providers can serve that
+    prefix from their prompt cache. Request data only goes into the user message.
+    """
+    def __init__(self, name, system, sections, cache_exempt=()):
+        self.name = name
+        self.system = system.strip()
+        # (heading, field) pairs in message order; a None heading inserts the value as-is
+        self.sections = tuple(sections)
+        # Fields left out of the response-cache key (e.g. remembered history that changes every session)
+        self.cache_exempt = frozenset(cache_exempt)
+        self.prefix_hash = hashlib.sha256(self.system.encode('utf-8')).hexdigest()[:12]
+        PROMPT_TEMPLATES[name] = self
+    
+    def render(self, **values):
+        """[("system", prefix), ("human", sections)] for one request; empty sections are left out"""
+        unknown = set(values) - {field for _, field in self.sections}
+        if unknown:
+            raise ValueError(f"{self.name} prompt has no section(s): {', '.join(sorted(unknown))}")
+        
+        blocks, keyed = [], []
+        for heading, field in self.sections:
+            value = values.get(field)
+            if value in (None, "", [], {}):
+                continue
+            text = str(value).strip()
+            block = f"{heading}:\n{text}" if heading else text
+            blocks.append(block)
+            if field not in self.cache_exempt:
+                keyed.append(block)
+        
+        messages = RenderedPrompt([("system", self.system), ("human", "\n\n".join(blocks))])
+        if len(keyed) != len(blocks):
+            messages.cache_view = [("system", self.system), ("human", "\n\n".join(keyed))]
+        return messages
+    
+    @staticmethod
+    def spec_lines(user_specs, *fields):
+        """Bullet list of (label, key, default) entries from the user specs"""
+        return "\n".join(f"• {label}: {user_specs.get(key, default)}" for label, key, default in fields)
 
 def log_agent_communication(source, target, message, details=None):
     """Log agent-to-agent communication to console"""
@@ -84,8 +1838,7 @@ def log_agent_communication(source, target, message, details=None):
         print(f"  Details: {details}")
     
     # Still keep a minimal log for debugging if needed
-    if 'agent_log' not in st.session_state:
-        st.session_state.agent_log = []
+    agent_log = st.session_state.get('agent_log', [])
     
     log_entry = {
         'timestamp': timestamp,
@@ -95,11 +1848,10 @@ def log_agent_communication(source, target, message, details=None):
         'details': details
     }
     
-    st.session_state.agent_log.append(log_entry)
+    agent_log.append(log_entry)
     
     # Keep only last 10 entries
-    if len(st.session_state.agent_log) > 10:
-        st.session_state.agent_log.pop(0)
+    st.session_state.agent_log = agent_log[-10:]
 
 class SpecAgent:
     """Enhanced requirement gathering for truly custom websites"""
@@ -242,40 +1994,280 @@ class SpecAgent:
         return spec
 
 # Enhanced multi-agent system with individual LLM integration and memories
+class MemoryStore:
+    """SQLite-backed agent interaction history shared by all sessions, with a retention policy"""
+    PRUNE_EVERY = 50
+    
+    def __init__(self, db_path, max_age=30 * 24 * 3600, max_per_type=500):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.max_per_type = max_per_type
+        self._writes = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS agent_memory (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    agent TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    timestamp REAL NOT NULL,
+                    input TEXT,
+                    output TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_memory_lookup ON agent_memory(agent, type, timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_memory_timestamp ON agent_memory(timestamp)")
+            self._prune(conn, time.time())
+    
+    def _connect(self):
+        """Open a short-lived connection (safe to use from any thread)"""
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    def add(self, agent, interaction_type, timestamp, input_data, output_data):
+        """Write one interaction; applies the retention policy every PRUNE_EVERY writes"""
+        row = (agent, interaction_type, timestamp,
+               json.dumps(input_data, ensure_ascii=False, default=str),
+               json.dumps(output_data, ensure_ascii=False, default=str))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO agent_memory (agent, type, timestamp, input, output) VALUES (?, ?, ?, ?, ?)", row
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(conn, time.time())
+    
+    def recent(self, agent, interaction_type, limit, before=None):
+        """Newest `limit` interactions of one type (oldest first) as (timestamp, input, output) tuples"""
+        before = before if before is not None else time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT timestamp, input, output FROM agent_memory "
+                "WHERE agent = ? AND type = ? AND timestamp < ? ORDER BY timestamp DESC LIMIT ?",
+                (agent, interaction_type, before, limit)
+            ).fetchall()
+        return [(timestamp, json.loads(input_json), json.loads(output_json))
+                for timestamp, input_json, output_json in reversed(rows)]
+    
+    def _prune(self, conn, now):
+        """Drop interactions older than max_age and all but the newest max_per_type per agent/type"""
+        conn.execute("DELETE FROM agent_memory WHERE timestamp < ?", (now - self.max_age,))
+        conn.execute("""
+            DELETE FROM agent_memory WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (PARTITION BY agent, type ORDER BY timestamp DESC) AS position
+                    FROM agent_memory
+                ) WHERE position > ?
+            )
+        """, (self.max_per_type,))
+
+_memory_store = None
+_memory_store_lock = threading.Lock()
+
+def get_memory_store():
+    """Get the process-wide agent memory store (None if disabled or unavailable)"""
+    global _memory_store, MEMORY_STORE_ENABLED
+    if not MEMORY_STORE_ENABLED:
+        return None
+    
+    with _memory_store_lock:
+        if _memory_store is None:
+            try:
+                _memory_store = MemoryStore(
+                    MEMORY_STORE_PATH,
+                    max_age=MEMORY_RETENTION_DAYS * 24 * 3600,
+                    max_per_type=MEMORY_MAX_PER_TYPE
+                )
+            except Exception as e:
+                print(f"[MemoryStore] Disabled - could not open {MEMORY_STORE_PATH}: {e}")
+                MEMORY_STORE_ENABLED = False
+                return None
+    return _memory_store
+
+class MemoryRetriever:
+    """Embedding-free similarity index: hashed bag-of-words rows weighted by TF-IDF at query time"""
+    MAX_TEXT_CHARS = 4000
+    
+    def __init__(self, dim=2048, max_records=None):
+        self.dim = dim
+        # Only the newest max_records stay indexed (None = unbounded)
+        self.max_records = max_records
+        self.records = deque(maxlen=max_records)
+        self._matrix = np.zeros((16, dim), dtype=np.float32)
+        self._doc_freq = np.zeros(dim, dtype=np.float32)
+    
+    @staticmethod
+    def record_text(record):
+        """Text used to index a record (its input and output, flattened)"""
+        return f"{record.input} {record.output}"[:MemoryRetriever.MAX_TEXT_CHARS]
+    
+    def vectorize(self, text):
+        """Log-scaled term counts over hashed token buckets"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = re.findall(r'[a-z0-9#]{2,}', str(text).lower())
+        if tokens:
+            buckets = np.fromiter((zlib.crc32(token.encode('utf-8')) % self.dim for token in tokens),
+                                  dtype=np.int64, count=len(tokens))
+            np.add.at(vector, buckets, 1.0)
+            np.log1p(vector, out=vector)
+        return vector
+    
+    def add(self, record):
+        """Incrementally index one record (evicting the oldest one when full)"""
+        row = len(self.records)
+        if row == self.max_records:
+            # Shift rather than overwrite so rows stay oldest-first (ties favour newer records)
+            self._doc_freq -= self._matrix[0] > 0
+            self._matrix[:row - 1] = self._matrix[1:row]
+            row -= 1
+        elif row == len(self._matrix):
+            self._matrix = np.vstack([self._matrix, np.zeros_like(self._matrix)])
+        vector = self.vectorize(self.record_text(record))
+        self._matrix[row] = vector
+        self._doc_freq += vector > 0
+        self.records.append(record)
+    
+    def top_k(self, query, k):
+        """Records most similar to query by cosine similarity, least relevant first"""
+        count = len(self.records)
+        if not count:
+            return []
+        
+        idf = np.log((count + 1) / (self._doc_freq + 1)) + 1.0
+        documents = self._matrix[:count] * idf
+        query_vector = self.vectorize(query) * idf
+        
+        norms = np.linalg.norm(documents, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        scores = documents @ query_vector / np.where(norms == 0, 1.0, norms)
+        # Ascending stable sort: on ties the newer record ranks higher
+        best = np.argsort(scores, kind='stable')[-k:]
+        records = list(self.records)
+        return [records[index] for index in best]
+
+class MemoryRecord:
+    """One remembered interaction (supports dict-style .get() used by the prompt formatters)"""
+    __slots__ = ('timestamp', 'type', 'input', 'output', 'context_snapshot')
+    
+    def __init__(self, timestamp, interaction_type, input_data, output_data, context_snapshot):
+        self.timestamp = timestamp
+        self.type = interaction_type
+        self.input = input_data
+        self.output = output_data
+        self.context_snapshot = context_snapshot
+    
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+    
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
 class AgentMemory:
     """Individual memory system for each agent"""
+    MAX_HISTORY = 20
+    MAX_PER_TYPE = 5
+    MAX_LEARNING_NOTES = 10
+    
     def __init__(self, agent_name):
         self.agent_name = agent_name
-        self.conversation_history = []
+        # Bounded ring buffers: overall order plus one index per interaction type (records are shared)
+        self.conversation_history = deque(maxlen=self.MAX_HISTORY)
+        self._by_type = {}
+        # Earlier sessions' interactions, loaded per type on first use
+        self._stored_by_type = {}
+        self._created_at = time.time()
+        # Similarity indexes per type, built on the first query that asks for ranking
+        self._retrievers = {}
         self.context_data = {}
+        self._snapshot = MappingProxyType({})
         self.previous_outputs = []
-        self.learning_notes = []
+        self.learning_notes = deque(maxlen=self.MAX_LEARNING_NOTES)
     
     def add_interaction(self, input_data, output_data, interaction_type="standard"):
         """Add an interaction to memory"""
-        interaction = {
-            'timestamp': time.time(),
-            'type': interaction_type,
-            'input': input_data,
-            'output': output_data,
-            'context_snapshot': self.context_data.copy()
-        }
+        # Copy-on-write: records share one read-only snapshot until the context changes
+        if self._snapshot is None:
+            self._snapshot = MappingProxyType(dict(self.context_data))
+        
+        interaction = MemoryRecord(time.time(), interaction_type, input_data, output_data, self._snapshot)
         self.conversation_history.append(interaction)
         
-        # Keep only last 20 interactions to prevent memory overflow
-        if len(self.conversation_history) > 20:
-            self.conversation_history.pop(0)
+        typed = self._by_type.get(interaction_type)
+        if typed is None:
+            typed = self._by_type[interaction_type] = deque(maxlen=self.MAX_PER_TYPE)
+        typed.append(interaction)
+        if interaction_type in self._retrievers:
+            self._retrievers[interaction_type].add(interaction)
+        
+        store = get_memory_store()
+        if store:
+            try:
+                store.add(self.agent_name, interaction_type, interaction.timestamp, input_data, output_data)
+            except sqlite3.Error as e:
+                print(f"[MemoryStore] Write failed: {e}")
     
     def update_context(self, key, value):
         """Update context data"""
+        if self.context_data.get(key, self) is value:
+            return
         self.context_data[key] = value
+        self._snapshot = None
+    
+    def get_relevant_context(self, query_type=None, include_stored=True, query=None, k=None):
+        """Retrieve relevant context for current query (include_stored adds earlier sessions' history)
+        
+        With a query (spec, prompt or feedback text) the k most similar interactions of the type are
+        returned instead of the most recent ones, ordered least to most relevant.
+        """
+        k = k or self.MAX_PER_TYPE
+        if not query_type:
+            return list(self.conversation_history)[-k:]
+        
+        if query is not None and np is not None:
+            return self._retriever(query_type, include_stored).top_k(query, k)
+        
+        session = list(self._by_type.get(query_type, ()))
+        if not include_stored or len(session) >= k:
+            return session[-k:]
+        return (self._load_stored(query_type)[-self.MAX_PER_TYPE:] + session)[-k:]
+    
+    def _retriever(self, query_type, include_stored):
+        """Similarity index over stored candidates plus this session's interactions of one type"""
+        if not include_stored:
+            retriever = MemoryRetriever(MEMORY_RETRIEVAL_DIM)
+            for record in self._by_type.get(query_type, ()):
+                retriever.add(record)
+            return retriever
+        
+        if query_type not in self._retrievers:
+            # Bounded like the per-type deques: stored candidates plus one session's worth of records
+            retriever = MemoryRetriever(MEMORY_RETRIEVAL_DIM, MEMORY_RETRIEVAL_CANDIDATES + self.MAX_PER_TYPE)
+            for record in self._load_stored(query_type) + list(self._by_type.get(query_type, ())):
+                retriever.add(record)
+            self._retrievers[query_type] = retriever
+        return self._retrievers[query_type]
     
-    def get_relevant_context(self, query_type=None):
-        """Retrieve relevant context for current query"""
-        if query_type:
-            relevant = [h for h in self.conversation_history if h['type'] == query_type]
-            return relevant[-5:] if relevant else []
-        return self.conversation_history[-5:]
+    def _load_stored(self, query_type):
+        """Lazily fetch this agent's latest stored interactions of one type from before this session"""
+        if query_type not in self._stored_by_type:
+            records = []
+            store = get_memory_store()
+            if store:
+                try:
+                    # Ranked queries choose among more candidates than plain recency needs
+                    limit = MEMORY_RETRIEVAL_CANDIDATES if np is not None else self.MAX_PER_TYPE
+                    records = [
+                        MemoryRecord(timestamp, query_type, input_data, output_data, MappingProxyType({}))
+                        for timestamp, input_data, output_data in store.recent(
+                            self.agent_name, query_type, limit, before=self._created_at
+                        )
+                    ]
+                except sqlite3.Error as e:
+                    print(f"[MemoryStore] Read failed: {e}")
+            self._stored_by_type[query_type] = records
+        return self._stored_by_type[query_type]
     
     def add_learning_note(self, note):
         """Add learning note for future reference"""
@@ -283,14 +2275,13 @@ class AgentMemory:
             'timestamp': time.time(),
             'note': note
         })
-        
-        # Keep only last 10 learning notes
-        if len(self.learning_notes) > 10:
-            self.learning_notes.pop(0)
 
 class WorkflowManager:
-    """Manages complex agent workflows and cycle counting"""
-    def __init__(self):
+    """Manages complex agent workflows, cycle counting and the token/cost budget"""
+    def __init__(self, token_budget=None, cost_budget=None):
+        self.usage = TokenUsage()
+        self.token_budget = WORKFLOW_TOKEN_BUDGET if token_budget is None else token_budget
+        self.cost_budget = WORKFLOW_COST_BUDGET if cost_budget is None else cost_budget
         self.reset_cycles()
     
     def reset_cycles(self):
@@ -298,14 +2289,28 @@ class WorkflowManager:
         self.html_qa_cycles = 0
         self.pm_html_cycles = 0
         self.total_cycles = 0
+        self.stage_timings = {}
+        self.stop_log = []
     
     def can_continue_html_qa(self):
         """Check if HTML-QA cycle can continue"""
-        return self.html_qa_cycles < 5 and self.total_cycles < 25
+        return self.html_qa_cycles < 5 and self.total_cycles < 25 and not self.budget_exceeded()
     
     def can_continue_pm_html(self):
         """Check if PM-HTML cycle can continue"""
-        return self.pm_html_cycles < 5 and self.total_cycles < 25
+        return self.pm_html_cycles < 5 and self.total_cycles < 25 and not self.budget_exceeded()
+    
+    def budget_exceeded(self):
+        """Description of the exhausted budget, or None while within budget"""
+        if self.token_budget and self.usage.total_tokens >= self.token_budget:
+            return f"token budget exhausted ({self.usage.total_tokens:,}/{self.token_budget:,} tokens)"
+        if self.cost_budget and self.usage.cost >= self.cost_budget:
+            return f"cost budget exhausted (${self.usage.cost:.4f}/${self.cost_budget:.4f})"
+        return None
+    
+    def limit_reason(self):
+        """Why a loop ran out of iterations"""
+        return self.budget_exceeded() or "maximum cycles reached"
     
     def increment_html_qa(self):
         """Increment HTML-QA cycle counter"""
@@ -320,10 +2325,334 @@ class WorkflowManager:
     def reset_html_qa(self):
         """Reset HTML-QA cycles for new PM iteration"""
         self.html_qa_cycles = 0
+    
+    def record_stop(self, loop_name, reason):
+        """Record why a development loop ended"""
+        self.stop_log.append({'loop': loop_name, 'cycle': self.html_qa_cycles, 'reason': reason})
+        log_agent_communication("WorkflowManager", "System", f"{loop_name} stopped", reason)
+    
+    @property
+    def stop_reason(self):
+        """Reason the most recent loop ended (None while running)"""
+        return self.stop_log[-1]['reason'] if self.stop_log else None
+
+def metered_workflow(fn):
+    """Charge the LLM calls of a workflow function to its WorkflowManager (fourth argument) and log the total"""
+    @functools.wraps(fn)
+    def wrapper(payload, workspace_path, agents, workflow, *args, **kwargs):
+        with usage_scope(workflow.usage):
+            result = fn(payload, workspace_path, agents, workflow, *args, **kwargs)
+        usage = workflow.usage
+        log_agent_communication("Workflow", "System", f"LLM usage: {usage.total_tokens:,} tokens, ${usage.cost:.4f}",
+                               f"{usage.calls} calls ({usage.estimated_calls} estimated), "
+                               f"{usage.input_tokens:,} in / {usage.output_tokens:,} out")
+        return result
+    return wrapper
+
+class ConvergenceTracker:
+    """Detects stalled HTML/QA loops from near-identical candidates and repeated QA feedback"""
+    def __init__(self, html_threshold=0.995, feedback_threshold=0.85):
+        self.html_threshold = html_threshold
+        self.feedback_threshold = feedback_threshold
+        self._last_html = None
+        self._last_feedback = None
+        self.html_similarity = None
+        self.feedback_similarity = None
+    
+    EMBEDDED_PATTERN = re.compile(r'(<(style|script)\b[^>]*>.*?</\2>)', re.IGNORECASE | re.DOTALL)
+    
+    @classmethod
+    def _html_tokens(cls, html):
+        """Normalize HTML into tag-level tokens, with CSS/JS split into rules and statements (whitespace and comments ignored)"""
+        html = re.sub(r'<!--.*?-->', '', html, flags=re.DOTALL)
+        parts = cls.EMBEDDED_PATTERN.split(html)
+        tokens = []
+        # split() yields text, (block, tag name) pairs, text, ...
+        for index in range(0, len(parts), 3):
+            text = re.sub(r'\s+', ' ', parts[index])
+            tokens.extend(token.strip() for token in text.split('>') if token.strip())
+            if index + 1 < len(parts):
+                pieces = re.split(r'(?<=[{};])|\n', parts[index + 1])
+                tokens.extend(" ".join(piece.split()) for piece in pieces if piece.strip())
+        return tokens
+    
+    @staticmethod
+    def _feedback_tokens(feedback):
+        return re.findall(r'[a-z0-9#]+', (feedback or '').lower())
+    
+    @staticmethod
+    def _similarity(a, b):
+        from difflib import SequenceMatcher
+        if not a and not b:
+            return 1.0
+        return SequenceMatcher(None, a, b, autojunk=False).ratio()
+    
+    @staticmethod
+    def _changed_words(previous, tokens):
+        """Words of the tokens that differ between two candidates, as (old, new)"""
+        from difflib import SequenceMatcher
+        old, new = [], []
+        opcodes = SequenceMatcher(None, previous, tokens, autojunk=False).get_opcodes()
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag != 'equal':
+                old.extend(previous[i1:i2])
+                new.extend(tokens[j1:j2])
+        return " ".join(old).split(), " ".join(new).split()
+    
+    def observe_html(self, html):
+        """Record a new candidate; returns a stop reason if it barely differs from the previous one
+
+        Only the changed tokens are compared, so a small real fix on a large page (one CSS
+        rule, one attribute) counts as progress; identical or cosmetically re-emitted
+        changes do not.
+        """
+        tokens = self._html_tokens(html)
+        previous, self._last_html = self._last_html, tokens
+        if previous is None:
+            return None
+        
+        old, new = self._changed_words(previous, tokens)
+        self.html_similarity = self._similarity(old, new) if (old or new) else 1.0
+        if self.html_similarity >= self.html_threshold:
+            return f"no progress: changed parts of the candidate {self.html_similarity:.1%} identical to the previous one"
+        return None
+    
+    def observe_feedback(self, feedback):
+        """Record QA feedback; returns a stop reason if it repeats the previous round"""
+        tokens = self._feedback_tokens(feedback)
+        previous, self._last_feedback = self._last_feedback, tokens
+        if previous is None:
+            return None
+        
+        self.feedback_similarity = self._similarity(previous, tokens)
+        if self.feedback_similarity >= self.feedback_threshold:
+            return f"repeated feedback: QA feedback {self.feedback_similarity:.1%} similar to the previous round"
+        return None
+
+class WorkflowAbort(Exception):
+    """Raised by a workflow step to stop the whole workflow with a user-facing message"""
+
+class WorkflowStep:
+    """A workflow node: fn(**inputs) returns a dict holding its declared outputs"""
+    def __init__(self, name, fn, inputs=(), outputs=()):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+class WorkflowGraph:
+    """Dependency-aware scheduler that runs each step once its inputs exist, independent steps concurrently"""
+    def __init__(self, steps, max_workers=4):
+        self.steps = {step.name: step for step in steps}
+        self.max_workers = max_workers
+        self.timings = {}
+        self._producers = {}
+        
+        for step in steps:
+            for output in step.outputs:
+                if output in self._producers:
+                    raise ValueError(f"'{output}' is produced by both {self._producers[output]} and {step.name}")
+                self._producers[output] = step.name
+    
+    def dependencies(self, name):
+        """Names of the steps whose outputs the given step consumes"""
+        return {self._producers[i] for i in self.steps[name].inputs if i in self._producers}
+    
+    def validate(self, initial_keys):
+        """Reject inputs that neither a step nor the initial context provides, and cycles"""
+        for step in self.steps.values():
+            for key in step.inputs:
+                if key not in self._producers and key not in initial_keys:
+                    raise ValueError(f"Step '{step.name}' needs '{key}', which nothing provides")
+        self.topological_order()
+    
+    def topological_order(self):
+        """Return step names in dependency order"""
+        order = []
+        remaining = {name: self.dependencies(name) for name in self.steps}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps - set(order)]
+            if not ready:
+                raise ValueError(f"Workflow graph has a cycle between: {', '.join(remaining)}")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+        return order
+    
+    def run(self, context):
+        """Execute the graph and return the context extended with every step's outputs"""
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        
+        context = dict(context)
+        self.validate(context.keys())
+        self.timings = {}
+        
+        run_start = time.perf_counter()
+        execute = bind_script_context(self._execute_step)
+        pending = dict(self.steps)
+        running = {}
+        
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="webweaver-step")
+        try:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    if all(key in context for key in step.inputs):
+                        inputs = {key: context[key] for key in step.inputs}
+                        running[pool.submit(execute, step, inputs, run_start)] = name
+                        del pending[name]
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    context.update(future.result())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        
+        return context
+    
+    def _execute_step(self, step, inputs, run_start):
+        """Run one step, record its start/end offsets and check its outputs"""
+        started = time.perf_counter() - run_start
+        try:
+            result = step.fn(**inputs)
+        finally:
+            self.timings[step.name] = (started, time.perf_counter() - run_start)
+        
+        result = result or {}
+        missing = [key for key in step.outputs if key not in result]
+        if missing:
+            raise ValueError(f"Step '{step.name}' did not produce: {', '.join(missing)}")
+        return {key: result[key] for key in step.outputs}
+    
+    def critical_path(self):
+        """Longest chain of dependent steps by measured duration: (step names, seconds)"""
+        finish = {}
+        previous = {}
+        for name in self.topological_order():
+            start, end = self.timings.get(name, (0.0, 0.0))
+            deps = self.dependencies(name)
+            before = max(deps, key=lambda d: finish[d], default=None)
+            finish[name] = (end - start) + (finish[before] if before else 0.0)
+            previous[name] = before
+        
+        if not finish:
+            return [], 0.0
+        
+        name = max(finish, key=finish.get)
+        total = finish[name]
+        path = []
+        while name:
+            path.append(name)
+            name = previous[name]
+        return list(reversed(path)), total
+
+class StageCache:
+    """Last design/content outputs of a site (workspace stages.json), each keyed by a fingerprint of its inputs"""
+    FILENAME = 'stages.json'
+    
+    def __init__(self, workspace_path):
+        self.path = os.path.join(workspace_path, self.FILENAME)
+        self.stages = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.stages = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[StageCache] Ignoring unreadable {self.path}: {e}")
+    
+    @staticmethod
+    def fingerprint(*inputs):
+        """Short stable hash of JSON-serializable stage inputs"""
+        payload = json.dumps(inputs, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+    
+    @classmethod
+    def stage_inputs(cls, stage, user_specs, design_output=None):
+        """Fingerprint of what a stage reads: design reads the specs; content also reads the design strategy"""
+        if stage == "design":
+            return cls.fingerprint("design", user_specs)
+        strategy = design_output.get('design_strategy') if isinstance(design_output, dict) else None
+        return cls.fingerprint("content", user_specs, strategy)
+    
+    def get(self, stage, inputs):
+        """Stored output of stage if it was produced from the same inputs, else None"""
+        entry = self.stages.get(stage)
+        if entry and entry.get('inputs') == inputs:
+            return entry.get('output')
+        return None
+    
+    def latest(self, stage):
+        """Stored output of stage regardless of its inputs (None if never stored)"""
+        return (self.stages.get(stage) or {}).get('output')
+    
+    def put(self, stage, inputs, output):
+        self.stages[stage] = {'inputs': inputs, 'output': output, 'updated': time.time()}
+    
+    def site_specs(self):
+        """Specs the stored stages were fingerprinted with (the spec the site was created from), or None"""
+        return (self.stages.get('site') or {}).get('specs')
+    
+    def record(self, user_specs, design_output, content_output):
+        """Store both stage outputs with their input fingerprints and write the file"""
+        self.stages['site'] = {'specs': user_specs, 'updated': time.time()}
+        self.put("design", self.stage_inputs("design", user_specs), design_output)
+        self.put("content", self.stage_inputs("content", user_specs, design_output), content_output)
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.stages, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[StageCache] Could not save {self.path}: {e}")
+
+class ChangeImpact:
+    """Decides which stages a modification request invalidates (local keyword rules, no LLM call)"""
+    # Feedback that changes what the site is for reruns every stage
+    STRATEGY = re.compile(
+        r"\b(rebrand\w*|redesign\w*|overhaul\w*|start over|from scratch|reposition\w*|pivot\w*|"
+        r"target (audience|market)|audience|industry|completely|entire(ly)?|whole (site|website|page))\b"
+    )
+    DESIGN = re.compile(
+        r"\b(colou?rs?|palette|fonts?|typography|typeface|theme|dark mode|light mode|styles?|styling|look|feel|"
+        r"visual\w*|brand(ing)?|gradients?|shadows?|spacing|whitespace|padding|margins?|layout|grid|"
+        r"modern|minimal\w*|elegant|aesthetic\w*|background|contrast|rounded|corners?)\b"
+    )
+    CONTENT = re.compile(
+        r"\b(text|copy|copywriting|wording|words?|headlines?|headings?|titles?|taglines?|slogans?|"
+        r"paragraphs?|descriptions?|rewrite|reword\w*|rephrase|tone|voice|messag\w*|phrases?|typos?|"
+        r"spelling|grammar|translat\w*|language|content|call to action|cta|bio|story|mission|say|says)\b"
+    )
+    HTML = re.compile(
+        r"\b(buttons?|links?|menus?|nav\w*|forms?|animat\w*|responsive|mobile|hover|scroll\w*|images?|"
+        r"icons?|footer|header|sections?|align\w*|cent(er|re)\w*|move|reorder|order|bug|broken|fix\w*|"
+        r"javascript|script|click\w*|modal|popup|map|embed|sticky|width|height|size|bigger|smaller)\b"
+    )
+    
+    @classmethod
+    def analyze(cls, feedback):
+        """Return (stages to rerun, label): labels are "full", "design", "content", "design+content" and "html" """
+        text = " ".join((feedback or "").lower().split())
+        if cls.STRATEGY.search(text):
+            return {"design", "content"}, "full"
+        
+        stages = set()
+        if cls.DESIGN.search(text):
+            stages.add("design")
+        if cls.CONTENT.search(text):
+            stages.add("content")
+        if stages:
+            return stages, "+".join(stage for stage in ("design", "content") if stage in stages)
+        if cls.HTML.search(text):
+            return set(), "html"
+        # Nothing recognised - do not guess
+        return {"design", "content"}, "full"
 
 class ProductManagerAgent:
     """Enhanced Product Manager with LLM and memory"""
     
+    # Set to False to always call the LLM for this agent (bypass the response cache)
+    use_llm_cache = True
+    
     def __init__(self):
         self.memory = AgentMemory("ProductManager")
         self.memory.update_context("role", "Strategic product manager and requirements analyst")
@@ -333,25 +2662,29 @@ class ProductManagerAgent:
         if not LLM_MODEL:
             return self._create_basic_requirements(user_specs)
         
-        # Get relevant context from memory
-        previous_context = self.memory.get_relevant_context("requirements_analysis")
-        context_summary = ""
-        if previous_context:
-            context_summary = f"\nPREVIOUS EXPERIENCE:\n{self._format_context(previous_context)}"
-        
-        prompt = f"""You are a senior product manager and business analyst. Analyze the user's website requirements and enhance them with strategic insights.
-
-USER SPECIFICATIONS:
-• Business Name: {user_specs.get('business_name', 'Not specified')}
-• Industry: {user_specs.get('industry_focus', 'Not specified')}
-• Purpose: {user_specs.get('purpose', 'Not specified')}
-• Target Audience: {user_specs.get('target_audience', 'Not specified')}
-• Design Style: {user_specs.get('design_style', 'Not specified')}
-• Core Sections: {user_specs.get('core_sections', [])}
-• Special Features: {user_specs.get('special_features', [])}
-• Key Messages: {user_specs.get('key_messages', 'Not specified')}
-• Unique Selling Points: {user_specs.get('unique_selling_points', 'Not specified')}
-{context_summary}
+        prompt = self._requirements_prompt(user_specs)
+        try:
+            content = invoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="requirements_analysis")
+            return self._handle_requirements_response(content, prompt, user_specs)
+        except Exception as e:
+            print(f"[ProductManager] LLM error: {e}")
+            return self._create_basic_requirements(user_specs)
+    
+    async def aanalyze_user_requirements(self, user_specs):
+        """Async variant of analyze_user_requirements (uses the LangChain ainvoke API)"""
+        if not LLM_MODEL:
+            return self._create_basic_requirements(user_specs)
+        
+        prompt = await asyncio.to_thread(self._requirements_prompt, user_specs)
+        try:
+            content = await ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="requirements_analysis")
+            return await asyncio.to_thread(self._handle_requirements_response, content, prompt, user_specs)
+        except Exception as e:
+            print(f"[ProductManager] LLM error: {e}")
+            return self._create_basic_requirements(user_specs)
+    
+    REQUIREMENTS_PROMPT = PromptTemplate("ProductManager.requirements", """
+You are a senior product manager and business analyst. Analyze the user's website requirements and enhance them with strategic insights.
 
 TASKS:
 1. Analyze the business requirements deeply
@@ -363,74 +2696,85 @@ TASKS:
 
 OUTPUT FORMAT:
 ```json
-{{
-    "analysis": {{
+{
+    "analysis": {
         "business_type": "detailed business classification",
         "target_market": "refined target audience analysis",
         "competitive_positioning": "market positioning strategy",
         "success_metrics": ["metric1", "metric2", "metric3"]
-    }},
-    "enhanced_requirements": {{
+    },
+    "enhanced_requirements": {
         "primary_objectives": ["objective1", "objective2"],
         "user_journey": "describe ideal user flow",
         "conversion_goals": ["goal1", "goal2"],
         "technical_requirements": ["req1", "req2"],
         "content_strategy": "content approach description"
-    }},
+    },
     "design_agent_prompt": "Detailed prompt for design agent including all strategic insights, visual requirements, user experience goals, and specific design direction based on business analysis"
-}}
-```"""
-
-        try:
-            response = LLM_MODEL.invoke(prompt)
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            # Extract JSON from response
-            result = self._extract_json_from_response(content)
-            if result:
-                self.memory.add_interaction(user_specs, result, "requirements_analysis")
-                self.memory.update_context("last_analysis", result)
-                return result
-            else:
-                raise Exception("Failed to parse LLM response")
-                
-        except Exception as e:
-            print(f"[ProductManager] LLM error: {e}")
-            return self._create_basic_requirements(user_specs)
+}
+```""", (("USER SPECIFICATIONS", "specs"), ("PREVIOUS EXPERIENCE", "history")), cache_exempt=("history",))
+    
+    def _requirements_prompt(self, user_specs):
+        """Build the requirements analysis prompt"""
+        # Get relevant context from memory
+        previous_context = self.memory.get_relevant_context("requirements_analysis", query=str(user_specs), k=3)
+        
+        return self.REQUIREMENTS_PROMPT.render(
+            specs=PromptTemplate.spec_lines(
+                user_specs,
+                ("Business Name", 'business_name', 'Not specified'),
+                ("Industry", 'industry_focus', 'Not specified'),
+                ("Purpose", 'purpose', 'Not specified'),
+                ("Target Audience", 'target_audience', 'Not specified'),
+                ("Design Style", 'design_style', 'Not specified'),
+                ("Core Sections", 'core_sections', []),
+                ("Special Features", 'special_features', []),
+                ("Key Messages", 'key_messages', 'Not specified'),
+                ("Unique Selling Points", 'unique_selling_points', 'Not specified'),
+            ),
+            history=self._format_context(previous_context) if previous_context else None
+        )
+    
+    def _handle_requirements_response(self, content, prompt, user_specs):
+        """Parse the analysis response and record it in memory"""
+        # Extract JSON from response
+        result = parse_agent_output(content, "requirements_analysis", self.memory.agent_name)
+        if result:
+            self.memory.add_interaction(user_specs, result, "requirements_analysis")
+            self.memory.update_context("last_analysis", result)
+            return result
+        else:
+            forget_llm_response(prompt, self.memory.agent_name, "requirements_analysis")
+            raise Exception("Failed to parse LLM response")
     
     def validate_final_website(self, html_content, original_requirements, design_output, content_output):
         """Validate if website meets all requirements"""
         if not LLM_MODEL:
             return True, "Basic validation passed"
         
-        previous_validations = self.memory.get_relevant_context("validation")
-        context_summary = ""
-        if previous_validations:
-            context_summary = f"\nPREVIOUS VALIDATIONS:\n{self._format_context(previous_validations)}"
-        
-        # Be more lenient on later validations
-        validation_guidance = ""
-        if len(previous_validations) >= 1:
-            validation_guidance = f"\nIMPORTANT: This is validation {len(previous_validations) + 1}. Focus only on CORE REQUIREMENTS from original specifications. Do not request additional features not originally specified."
-        elif len(previous_validations) >= 2:
-            validation_guidance = f"\nCRITICAL: This is validation {len(previous_validations) + 1}/5. MUST PASS unless core requirements are missing. Do not ask for enhancements beyond original scope."
+        prompt = self._validation_prompt(html_content, original_requirements, design_output, content_output)
+        try:
+            content = invoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="validation")
+            return self._handle_validation_response(content, prompt, html_content, original_requirements)
+        except Exception as e:
+            print(f"[ProductManager] Validation error: {e}")
+            return True, "Basic validation passed - requirements satisfied"
+    
+    async def avalidate_final_website(self, html_content, original_requirements, design_output, content_output):
+        """Async variant of validate_final_website (uses the LangChain ainvoke API)"""
+        if not LLM_MODEL:
+            return True, "Basic validation passed"
         
-        prompt = f"""You are a senior product manager validating if a website meets the ORIGINAL business requirements. Focus ONLY on what was initially requested.
-
-ORIGINAL USER REQUIREMENTS (STICK TO THESE ONLY):
-{original_requirements}
-
-DESIGN SPECIFICATIONS:
-{design_output}
-
-CONTENT STRATEGY:
-{content_output}
-
-WEBSITE CODE TO VALIDATE:
-{html_content[:2000]}...
-
-{context_summary}
-{validation_guidance}
+        prompt = self._validation_prompt(html_content, original_requirements, design_output, content_output)
+        try:
+            content = await ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="validation")
+            return await asyncio.to_thread(self._handle_validation_response, content, prompt, html_content, original_requirements)
+        except Exception as e:
+            print(f"[ProductManager] Validation error: {e}")
+            return True, "Basic validation passed - requirements satisfied"
+    
+    VALIDATION_PROMPT = PromptTemplate("ProductManager.validation", """
+You are a senior product manager validating if a website meets the ORIGINAL business requirements. Focus ONLY on what was initially requested.
 
 VALIDATION RULES:
 • ONLY validate against ORIGINAL user requirements
@@ -455,66 +2799,71 @@ MVP VALIDATION CHECKLIST:
 
 OUTPUT FORMAT:
 ```json
-{{
+{
     "validation_passed": true/false,
     "score": "percentage_score",
     "missing_core_requirements": ["only_originally_specified_requirements"],
     "feedback": "Brief feedback focusing ONLY on original requirements, or approval message"
-}}
+}
 ```
 
-REMEMBER: Pass if core original requirements are met. Do not expand scope beyond user's initial request."""
-
-        try:
-            response = LLM_MODEL.invoke(prompt)
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            result = self._extract_json_from_response(content)
-            if result:
-                # Force pass on 3rd+ validation if no core requirements missing
-                if len(previous_validations) >= 2 and not result.get('missing_core_requirements'):
-                    validation_passed = True
-                    feedback = "Website meets original requirements - approved for deployment"
-                else:
-                    validation_passed = result.get('validation_passed', False)
-                    feedback = result.get('feedback', 'Requirements not fully met')
-                
-                self.memory.add_interaction(
-                    {"html_content": html_content[:500], "requirements": original_requirements}, 
-                    result, 
-                    "validation"
-                )
-                
-                return validation_passed, feedback
-            else:
-                return True, "Validation completed - requirements met"
-                
-        except Exception as e:
-            print(f"[ProductManager] Validation error: {e}")
-            return True, "Basic validation passed - requirements satisfied"
+REMEMBER: Pass if core original requirements are met. Do not expand scope beyond user's initial request.""", (
+        ("ORIGINAL USER REQUIREMENTS (STICK TO THESE ONLY)", "requirements"),
+        ("DESIGN SPECIFICATIONS", "design"),
+        ("CONTENT STRATEGY", "content"),
+        ("WEBSITE CODE TO VALIDATE", "html"),
+        ("PREVIOUS VALIDATIONS", "history"),
+        (None, "guidance"),
+    ))
     
-    def _extract_json_from_response(self, content):
-        """Extract JSON from LLM response"""
-        import json
-        import re
+    def _validation_prompt(self, html_content, original_requirements, design_output, content_output):
+        """Build the final validation prompt"""
+        previous_validations = self.memory.get_relevant_context("validation", include_stored=False)
         
-        # Try to find JSON in code blocks
-        json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except:
-                pass
+        # Be more lenient on later validations
+        validation_guidance = None
+        if len(previous_validations) >= 1:
+            validation_guidance = f"IMPORTANT: This is validation {len(previous_validations) + 1}. Focus only on CORE REQUIREMENTS from original specifications. Do not request additional features not originally specified."
+        elif len(previous_validations) >= 2:
+            validation_guidance = f"CRITICAL: This is validation {len(previous_validations) + 1}/5. MUST PASS unless core requirements are missing. Do not ask for enhancements beyond original scope."
         
-        # Try to find JSON in the text
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(0))
-            except:
-                pass
+        context = PromptContext.compile(
+            "pm", requirements=original_requirements, design=design_output, content=content_output
+        )
         
-        return None
+        return self.VALIDATION_PROMPT.render(
+            requirements=context['requirements'],
+            design=context['design'],
+            content=context['content'],
+            html=f"{html_content[:2000]}...",
+            history=self._format_context(previous_validations) if previous_validations else None,
+            guidance=validation_guidance
+        )
+    
+    def _handle_validation_response(self, content, prompt, html_content, original_requirements):
+        """Parse the validation verdict and record it in memory"""
+        previous_validations = self.memory.get_relevant_context("validation", include_stored=False)
+        
+        result = parse_agent_output(content, "validation", self.memory.agent_name)
+        if result:
+            # Force pass on 3rd+ validation if no core requirements missing
+            if len(previous_validations) >= 2 and not result.get('missing_core_requirements'):
+                validation_passed = True
+                feedback = "Website meets original requirements - approved for deployment"
+            else:
+                validation_passed = result.get('validation_passed', False)
+                feedback = result.get('feedback') or 'Requirements not fully met'
+        
+            self.memory.add_interaction(
+                {"html_content": html_content[:500], "requirements": original_requirements}, 
+                result, 
+                "validation"
+            )
+        
+            return validation_passed, feedback
+        else:
+            forget_llm_response(prompt, self.memory.agent_name, "validation")
+            return True, "Validation completed - requirements met"
     
     def _format_context(self, context_list):
         """Format context for prompt inclusion"""
@@ -545,6 +2894,9 @@ REMEMBER: Pass if core original requirements are met. Do not expand scope beyond
 class DesignAgent:
     """Enhanced Design Agent with LLM and memory"""
     
+    # Set to False to always call the LLM for this agent (bypass the response cache)
+    use_llm_cache = True
+    
     def __init__(self):
         self.memory = AgentMemory("DesignAgent")
         self.memory.update_context("role", "Senior UI/UX designer and visual design expert")
@@ -554,22 +2906,29 @@ class DesignAgent:
         if not LLM_MODEL:
             return self._create_basic_design_system(user_specs)
         
-        previous_designs = self.memory.get_relevant_context("design_system")
-        context_summary = ""
-        if previous_designs and is_modification:
-            context_summary = f"\nPREVIOUS DESIGN WORK:\n{self._format_context(previous_designs)}"
+        prompt = self._design_prompt(pm_prompt, user_specs, is_modification)
+        try:
+            content = invoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="design_system")
+            return self._handle_design_response(content, prompt, pm_prompt, user_specs)
+        except Exception as e:
+            print(f"[DesignAgent] LLM error: {e}")
+            return self._create_basic_design_system(user_specs)
+    
+    async def acreate_design_system(self, pm_prompt, user_specs, is_modification=False):
+        """Async variant of create_design_system (uses the LangChain ainvoke API)"""
+        if not LLM_MODEL:
+            return self._create_basic_design_system(user_specs)
         
-        prompt = f"""You are a world-class UI/UX designer. Create a comprehensive design system based on product manager's strategic analysis.
-
-PRODUCT MANAGER'S STRATEGIC DIRECTION:
-{pm_prompt}
-
-USER SPECIFICATIONS:
-• Business: {user_specs.get('business_name', 'Professional Business')}
-• Industry: {user_specs.get('industry_focus', 'Professional Services')}
-• Style Preference: {user_specs.get('design_style', 'Modern')}
-• Primary Color: {user_specs.get('primary_color', '#3498db')}
-{context_summary}
+        prompt = await asyncio.to_thread(self._design_prompt, pm_prompt, user_specs, is_modification)
+        try:
+            content = await ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="design_system")
+            return await asyncio.to_thread(self._handle_design_response, content, prompt, pm_prompt, user_specs)
+        except Exception as e:
+            print(f"[DesignAgent] LLM error: {e}")
+            return self._create_basic_design_system(user_specs)
+    
+    DESIGN_PROMPT = PromptTemplate("DesignAgent.design_system", """
+You are a world-class UI/UX designer. Create a comprehensive design system based on product manager's strategic analysis.
 
 DESIGN TASKS:
 1. Analyze the strategic requirements and user needs
@@ -580,88 +2939,82 @@ DESIGN TASKS:
 
 OUTPUT FORMAT:
 ```json
-{{
-    "design_strategy": {{
+{
+    "design_strategy": {
         "visual_concept": "overall design concept description",
         "user_experience_goal": "UX objectives and user flow",
         "brand_personality": "visual brand personality traits",
         "design_principles": ["principle1", "principle2", "principle3"]
-    }},
-    "visual_system": {{
-        "color_palette": {{
+    },
+    "visual_system": {
+        "color_palette": {
             "primary": "hex_color",
             "secondary": "hex_color", 
             "accent": "hex_color",
             "text": "hex_color",
             "background": "hex_color"
-        }},
-        "typography": {{
+        },
+        "typography": {
             "headings": "font_family_and_style",
             "body": "font_family_and_style",
             "scale": "typography_scale_description"
-        }},
-        "layout": {{
+        },
+        "layout": {
             "grid_system": "grid_approach_description",
             "spacing": "spacing_system_description",
             "breakpoints": "responsive_breakpoint_strategy"
-        }},
-        "components": {{
+        },
+        "components": {
             "buttons": "button_style_description",
             "cards": "card_component_style",
             "navigation": "navigation_design_approach",
             "forms": "form_styling_approach"
-        }}
-    }},
-    "sections_design": {{
+        }
+    },
+    "sections_design": {
         "hero": "hero_section_design_specification",
         "about": "about_section_design_specification", 
         "services": "services_section_design_specification",
         "contact": "contact_section_design_specification"
-    }},
+    },
     "content_agent_prompt": "Detailed prompt for Content Agent including tone of voice, content structure, messaging strategy, and specific content requirements for each section based on design and UX goals. IMPORTANT: Final output will be a SINGLE HTML FILE with embedded CSS/JS."
-}}
-```"""
-
-        try:
-            response = LLM_MODEL.invoke(prompt)
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            result = self._extract_json_from_response(content)
-            if result:
-                self.memory.add_interaction(
-                    {"pm_prompt": pm_prompt, "user_specs": user_specs}, 
-                    result, 
-                    "design_system"
-                )
-                self.memory.update_context("last_design", result)
-                return result
-            else:
-                raise Exception("Failed to parse design response")
-                
-        except Exception as e:
-            print(f"[DesignAgent] LLM error: {e}")
-            return self._create_basic_design_system(user_specs)
+}
+```""", (
+        ("PRODUCT MANAGER'S STRATEGIC DIRECTION", "direction"),
+        ("USER SPECIFICATIONS", "specs"),
+        ("PREVIOUS DESIGN WORK", "history"),
+    ), cache_exempt=("history",))
     
-    def _extract_json_from_response(self, content):
-        """Extract JSON from LLM response"""
-        import json
-        import re
-        
-        json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except:
-                pass
+    def _design_prompt(self, pm_prompt, user_specs, is_modification=False):
+        """Build the design system prompt"""
+        previous_designs = self.memory.get_relevant_context("design_system", query=f"{pm_prompt} {user_specs}", k=3)
         
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(0))
-            except:
-                pass
-        
-        return None
+        return self.DESIGN_PROMPT.render(
+            direction=pm_prompt,
+            specs=PromptTemplate.spec_lines(
+                user_specs,
+                ("Business", 'business_name', 'Professional Business'),
+                ("Industry", 'industry_focus', 'Professional Services'),
+                ("Style Preference", 'design_style', 'Modern'),
+                ("Primary Color", 'primary_color', '#3498db'),
+            ),
+            history=self._format_context(previous_designs) if previous_designs and is_modification else None
+        )
+    
+    def _handle_design_response(self, content, prompt, pm_prompt, user_specs):
+        """Parse the design system response and record it in memory"""
+        result = parse_agent_output(content, "design_system", self.memory.agent_name)
+        if result:
+            self.memory.add_interaction(
+                {"pm_prompt": pm_prompt, "user_specs": user_specs}, 
+                result, 
+                "design_system"
+            )
+            self.memory.update_context("last_design", result)
+            return result
+        else:
+            forget_llm_response(prompt, self.memory.agent_name, "design_system")
+            raise Exception("Failed to parse design response")
     
     def _format_context(self, context_list):
         """Format context for prompt inclusion"""
@@ -694,6 +3047,9 @@ OUTPUT FORMAT:
 class ContentAgent:
     """Enhanced Content Agent with LLM and memory"""
     
+    # Set to False to always call the LLM for this agent (bypass the response cache)
+    use_llm_cache = True
+    
     def __init__(self):
         self.memory = AgentMemory("ContentAgent")
         self.memory.update_context("role", "Professional copywriter and content strategist")
@@ -703,26 +3059,29 @@ class ContentAgent:
         if not LLM_MODEL:
             return self._create_basic_content(user_specs)
         
-        previous_content = self.memory.get_relevant_context("content_generation")
-        context_summary = ""
-        if previous_content and is_modification:
-            context_summary = f"\nPREVIOUS CONTENT WORK:\n{self._format_context(previous_content)}"
+        prompt = self._content_prompt(design_prompt, user_specs, design_output, is_modification)
+        try:
+            content = invoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="content_generation")
+            return self._handle_content_response(content, prompt, design_prompt, user_specs)
+        except Exception as e:
+            print(f"[ContentAgent] LLM error: {e}")
+            return self._create_basic_content(user_specs)
+    
+    async def agenerate_website_content(self, design_prompt, user_specs, design_output, is_modification=False):
+        """Async variant of generate_website_content (uses the LangChain ainvoke API)"""
+        if not LLM_MODEL:
+            return self._create_basic_content(user_specs)
         
-        prompt = f"""You are a professional copywriter and content strategist. Create compelling website content based on design strategy.
-
-DESIGN AGENT'S CONTENT DIRECTION:
-{design_prompt}
-
-USER SPECIFICATIONS:
-• Business: {user_specs.get('business_name', 'Professional Business')}
-• Industry: {user_specs.get('industry_focus', 'Professional Services')}
-• Target Audience: {user_specs.get('target_audience', 'Business Professionals')}
-• Key Messages: {user_specs.get('key_messages', 'Not specified')}
-• Unique Selling Points: {user_specs.get('unique_selling_points', 'Not specified')}
-
-DESIGN CONTEXT:
-{design_output}
-{context_summary}
+        prompt = await asyncio.to_thread(self._content_prompt, design_prompt, user_specs, design_output, is_modification)
+        try:
+            content = await ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="content_generation")
+            return await asyncio.to_thread(self._handle_content_response, content, prompt, design_prompt, user_specs)
+        except Exception as e:
+            print(f"[ContentAgent] LLM error: {e}")
+            return self._create_basic_content(user_specs)
+    
+    CONTENT_PROMPT = PromptTemplate("ContentAgent.content_generation", """
+You are a professional copywriter and content strategist. Create compelling website content based on design strategy.
 
 CONTENT TASKS:
 1. Create compelling, conversion-focused copy
@@ -733,83 +3092,80 @@ CONTENT TASKS:
 
 OUTPUT FORMAT:
 ```json
-{{
-    "content_strategy": {{
+{
+    "content_strategy": {
         "brand_voice": "brand_voice_description",
         "messaging_framework": "core_messaging_strategy",
         "target_persona": "refined_target_audience_description",
         "conversion_strategy": "how_content_drives_conversions"
-    }},
-    "website_content": {{
-        "hero": {{
+    },
+    "website_content": {
+        "hero": {
             "headline": "powerful_main_headline",
             "subheadline": "supporting_subheadline",
             "cta_text": "call_to_action_text"
-        }},
-        "about": {{
+        },
+        "about": {
             "headline": "about_section_headline", 
             "content": "about_section_content_paragraphs",
             "key_points": ["point1", "point2", "point3"]
-        }},
-        "services": {{
+        },
+        "services": {
             "headline": "services_section_headline",
             "intro": "services_introduction_text",
             "service_items": [
-                {{"title": "service1", "description": "service1_description"}},
-                {{"title": "service2", "description": "service2_description"}},
-                {{"title": "service3", "description": "service3_description"}}
+                {"title": "service1", "description": "service1_description"},
+                {"title": "service2", "description": "service2_description"},
+                {"title": "service3", "description": "service3_description"}
             ]
-        }},
-        "contact": {{
+        },
+        "contact": {
             "headline": "contact_section_headline",
             "intro": "contact_introduction_text",
             "cta": "contact_call_to_action"
-        }}
-    }},
+        }
+    },
     "html_agent_prompt": "Comprehensive prompt for HTML Agent including all design specifications, content, technical requirements, and specific implementation guidelines for creating a SINGLE-FILE HTML website with embedded CSS and JavaScript"
-}}
-```"""
-
-        try:
-            response = LLM_MODEL.invoke(prompt)
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            result = self._extract_json_from_response(content)
-            if result:
-                self.memory.add_interaction(
-                    {"design_prompt": design_prompt, "user_specs": user_specs}, 
-                    result, 
-                    "content_generation"
-                )
-                self.memory.update_context("last_content", result)
-                return result
-            else:
-                raise Exception("Failed to parse content response")
-                
-        except Exception as e:
-            print(f"[ContentAgent] LLM error: {e}")
-            return self._create_basic_content(user_specs)
+}
+```""", (
+        ("DESIGN AGENT'S CONTENT DIRECTION", "direction"),
+        ("USER SPECIFICATIONS", "specs"),
+        ("DESIGN CONTEXT", "design"),
+        ("PREVIOUS CONTENT WORK", "history"),
+    ), cache_exempt=("history",))
     
-    def _extract_json_from_response(self, content):
-        """Extract JSON from LLM response"""
-        import json
-        import re
-        
-        json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except:
-                pass
-        
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(0))
-            except:
-                pass
+    def _content_prompt(self, design_prompt, user_specs, design_output, is_modification=False):
+        """Build the content generation prompt"""
+        previous_content = self.memory.get_relevant_context("content_generation", query=design_prompt, k=3)
         
-        return None
+        return self.CONTENT_PROMPT.render(
+            direction=design_prompt,
+            specs=PromptTemplate.spec_lines(
+                user_specs,
+                ("Business", 'business_name', 'Professional Business'),
+                ("Industry", 'industry_focus', 'Professional Services'),
+                ("Target Audience", 'target_audience', 'Business Professionals'),
+                ("Key Messages", 'key_messages', 'Not specified'),
+                ("Unique Selling Points", 'unique_selling_points', 'Not specified'),
+            ),
+            design=PromptContext.compile("content", design=design_output)['design'],
+            history=self._format_context(previous_content) if previous_content and is_modification else None
+        )
+    
+    def _handle_content_response(self, content, prompt, design_prompt, user_specs):
+        """Parse the content response and record it in memory"""
+        result = parse_agent_output(content, "content_generation", self.memory.agent_name)
+        if result:
+            self.memory.add_interaction(
+                {"design_prompt": design_prompt, "user_specs": user_specs}, 
+                result, 
+                "content_generation"
+            )
+            self.memory.update_context("last_content", result)
+            return result
+        else:
+            forget_llm_response(prompt, self.memory.agent_name, "content_generation")
+            raise Exception("Failed to parse content response")
     
     def _format_context(self, context_list):
         """Format context for prompt inclusion"""
@@ -842,125 +3198,229 @@ OUTPUT FORMAT:
 class HTMLAgent:
     """Enhanced HTML Agent with LLM and memory"""
     
+    # Set to False to always call the LLM for this agent (bypass the response cache)
+    use_llm_cache = True
+    
     def __init__(self):
         self.memory = AgentMemory("HTMLAgent")
         self.memory.update_context("role", "Expert full-stack web developer")
     
     @staticmethod
-    def generate_website(spec, workspace_path):
+    def generate_website(spec, workspace_path, preview=None):
         """Generate initial website from specifications"""
-        return HTMLAgent._process_html(spec, workspace_path, mode="create")
+        return HTMLAgent._process_html(spec, workspace_path, mode="create", preview=preview)
     
     @staticmethod
-    def modify_website(feedback, workspace_path):
+    def modify_website(feedback, workspace_path, preview=None):
         """Modify existing website based on feedback"""
-        return HTMLAgent._process_html(feedback, workspace_path, mode="modify")
+        return HTMLAgent._process_html(feedback, workspace_path, mode="modify", preview=preview)
     
     @staticmethod
-    def _process_html(input_data, workspace_path, mode="create"):
+    def _process_html(input_data, workspace_path, mode="create", preview=None):
         """Unified HTML processing with enhanced workflow"""
         
         # Initialize workflow manager
         workflow = WorkflowManager()
         
         # Initialize or get agent instances
-        if 'agent_instances' not in st.session_state:
-            st.session_state.agent_instances = {
-                'product_manager': ProductManagerAgent(),
-                'design_agent': DesignAgent(),
-                'content_agent': ContentAgent(),
-                'html_agent': HTMLAgent(),
-                'qa_agent': QAAgent()
-            }
-        
-        agents = st.session_state.agent_instances
+        agents = get_session_agents()
         
         if mode == "create":
-            return HTMLAgent._create_website_workflow(input_data, workspace_path, agents, workflow)
+            return HTMLAgent._create_website_workflow(input_data, workspace_path, agents, workflow, preview)
         else:
-            return HTMLAgent._modify_website_workflow(input_data, workspace_path, agents, workflow)
+            return HTMLAgent._modify_website_workflow(input_data, workspace_path, agents, workflow, preview)
+    
+    @staticmethod
+    def _run_agent_step(agent, method_name, *args, **kwargs):
+        """Run an agent method on the shared async loop when enabled, else synchronously"""
+        if ASYNC_AGENTS_ENABLED:
+            async_method = getattr(agent, f"a{method_name}")
+            return run_agent_coroutine(async_method(*args, **kwargs))
+        return getattr(agent, method_name)(*args, **kwargs)
     
     @staticmethod
-    def _create_website_workflow(user_specs, workspace_path, agents, workflow):
-        """Complete website creation workflow"""
+    @metered_workflow
+    def _create_website_workflow(user_specs, workspace_path, agents, workflow, preview=None):
+        """Complete website creation workflow (run as a dependency graph of agent steps)"""
         try:
+            graph = HTMLAgent._build_create_graph(agents, workflow, workspace_path, preview)
+            context = graph.run({'user_specs': user_specs})
+            
+            path, path_time = graph.critical_path()
+            workflow.stage_timings = dict(graph.timings)
+            log_agent_communication("Workflow", "System", f"Critical path {path_time:.1f}s", 
+                                   " → ".join(path))
+            
+            final_html = context['final_html']
+            if final_html:
+                # Write final file
+                html_path = os.path.join(workspace_path, 'index.html')
+                with open(html_path, 'w', encoding='utf-8') as f:
+                    f.write(final_html)
+                
+                with open(os.path.join(workspace_path, 'styles.css'), 'w', encoding='utf-8') as f:
+                    f.write('/* All styles embedded in HTML */')
+                
+                # Lets later modifications reuse the design and content stages
+                StageCache(workspace_path).record(user_specs, context['design_output'], context['content_output'])
+                
+                report_progress("success", "✅ **ProductManager**: Website meets all requirements - Development complete!")
+                return True, "✅ Website created successfully"
+            else:
+                report_progress("error", "❌ Maximum development cycles reached")
+                return False, "Maximum development cycles reached"
+            
+        except WorkflowAbort as e:
+            report_progress("error", f"❌ {e}")
+            return False, str(e)
+        except Exception as e:
+            print(f"[HTMLAgent] Critical error: {e}")
+            report_progress("error", f"Critical error in website creation: {str(e)}")
+            return False, f"Critical error: {str(e)}"
+    
+    @staticmethod
+    def _build_create_graph(agents, workflow, workspace_path, preview=None):
+        """Express the creation workflow as steps with declared inputs and outputs
+
+        With the default flags the steps form one chain, pm_analysis → design → content → html_qa →
+        pm_validation, because each one's prompt is built from the previous one's output (the design
+        from the PM's design_agent_prompt, the content from the design's content_agent_prompt and
+        visual system, and validation from the QA-approved page). Overlap comes from the opt-in modes:
+        the skeleton step (WEBWEAVER_SECTIONED_HTML) runs alongside content, and parallel_review
+        (WEBWEAVER_PARALLEL_REVIEW) reviews each candidate with QA and PM validation at once.
+        """
+        def analyze_requirements(user_specs):
             # Step 1: Product Manager analyzes requirements
-            st.info("🔍 **ProductManager**: Analyzing business requirements and strategy...")
+            report_progress("info", "🔍 **ProductManager**: Analyzing business requirements and strategy...")
             log_agent_communication("SpecAgent", "ProductManager", "User specifications received", 
                                    f"Business: {user_specs.get('business_name')}")
             
-            pm_analysis = agents['product_manager'].analyze_user_requirements(user_specs)
-            design_prompt = pm_analysis.get('design_agent_prompt', 'Create a professional website design')
+            pm_analysis = HTMLAgent._run_agent_step(
+                agents['product_manager'], 'analyze_user_requirements', user_specs
+            )
             
-            st.success("✅ **ProductManager**: Strategic analysis completed")
+            report_progress("success", "✅ **ProductManager**: Strategic analysis completed")
             log_agent_communication("ProductManager", "DesignAgent", "Strategic direction provided", 
                                    f"Design prompt generated")
-            
+            return {'pm_analysis': pm_analysis}
+        
+        def create_design(user_specs, pm_analysis):
             # Step 2: Design Agent creates design system
-            st.info("🎨 **DesignAgent**: Creating visual design system and UX strategy...")
+            report_progress("info", "🎨 **DesignAgent**: Creating visual design system and UX strategy...")
             
-            design_output = agents['design_agent'].create_design_system(design_prompt, user_specs)
-            content_prompt = design_output.get('content_agent_prompt', 'Create professional content')
+            design_prompt = pm_analysis.get('design_agent_prompt', 'Create a professional website design')
+            design_output = HTMLAgent._run_agent_step(
+                agents['design_agent'], 'create_design_system', design_prompt, user_specs
+            )
             
-            st.success("✅ **DesignAgent**: Design system and UX strategy completed")
+            report_progress("success", "✅ **DesignAgent**: Design system and UX strategy completed")
             log_agent_communication("DesignAgent", "ContentAgent", "Design specifications ready", 
                                    f"Content direction provided")
-            
+            return {'design_output': design_output}
+        
+        def write_content(user_specs, design_output):
             # Step 3: Content Agent generates content
-            st.info("✍️ **ContentAgent**: Creating professional content and copy...")
+            report_progress("info", "✍️ **ContentAgent**: Creating professional content and copy...")
             
-            content_output = agents['content_agent'].generate_website_content(
+            content_prompt = design_output.get('content_agent_prompt', 'Create professional content')
+            content_output = HTMLAgent._run_agent_step(
+                agents['content_agent'], 'generate_website_content',
                 content_prompt, user_specs, design_output
             )
-            html_prompt = content_output.get('html_agent_prompt', 'Create a professional website')
             
-            st.success("✅ **ContentAgent**: Professional content created")
+            report_progress("success", "✅ **ContentAgent**: Professional content created")
             log_agent_communication("ContentAgent", "HTMLAgent", "Content and copy ready", 
                                    f"HTML development instructions provided")
-            
+            return {'content_output': content_output}
+        
+        def draft_skeleton(user_specs, design_output):
+            # Step 3b: the page shell needs only the design and the section list, so it is written alongside the content
+            report_progress("info", "🧱 **HTMLAgent**: Drafting the page shell while content is written...")
+            page_shell = HTMLAgent._run_agent_step(
+                agents['html_agent'], 'generate_skeleton', user_specs, design_output
+            )
+            return {'page_shell': page_shell}
+        
+        def develop_html(user_specs, design_output, content_output, page_shell=None):
             # Step 4: HTML-QA Development Cycle
-            st.info("🔧 **HTMLAgent**: Starting website development...")
+            report_progress("info", "🔧 **HTMLAgent**: Starting website development...")
             
-            final_html = HTMLAgent._html_qa_cycle(
+            html_prompt = content_output.get('html_agent_prompt', 'Create a professional website')
+            reviewed_html = HTMLAgent._html_qa_cycle(
                 html_prompt, user_specs, design_output, content_output, 
-                agents, workflow, workspace_path
+                agents, workflow, workspace_path, preview=preview, 
+                patch=SECTIONED_HTML_ENABLED and PATCH_MODE_ENABLED, sectioned=SECTIONED_HTML_ENABLED,
+                skeleton=page_shell
             )
             
-            if not final_html:
-                st.error("❌ Website development failed")
-                return False, "Website development failed"
-            
+            if not reviewed_html:
+                raise WorkflowAbort("Website development failed")
+            return {'reviewed_html': reviewed_html}
+        
+        def validate_requirements(reviewed_html, pm_analysis, design_output, content_output):
             # Step 5: Product Manager final validation
-            st.info("🔍 **ProductManager**: Final requirement validation...")
+            report_progress("info", "🔍 **ProductManager**: Final requirement validation...")
             
             final_html = HTMLAgent._pm_validation_cycle(
-                final_html, pm_analysis, design_output, content_output,
-                agents, workflow, workspace_path
+                reviewed_html, pm_analysis, design_output, content_output,
+                agents, workflow, workspace_path, preview=preview
             )
+            return {'final_html': final_html}
+        
+        def review_in_parallel(user_specs, pm_analysis, design_output, content_output, page_shell=None):
+            # Steps 4+5 merged: each candidate goes to QA and PM validation at the same time
+            report_progress("info", "🔧 **HTMLAgent**: Starting website development...")
             
-            if final_html:
-                # Write final file
-                html_path = os.path.join(workspace_path, 'index.html')
-                with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write(final_html)
-                
-                with open(os.path.join(workspace_path, 'styles.css'), 'w', encoding='utf-8') as f:
-                    f.write('/* All styles embedded in HTML */')
-                
-                st.success("✅ **ProductManager**: Website meets all requirements - Development complete!")
-                return True, "✅ Website created successfully"
-            else:
-                st.error("❌ Maximum development cycles reached")
-                return False, "Maximum development cycles reached"
+            html_prompt = content_output.get('html_agent_prompt', 'Create a professional website')
+            final_html = HTMLAgent._parallel_review_cycle(
+                html_prompt, user_specs, pm_analysis, design_output, content_output,
+                agents, workflow, workspace_path, preview=preview, 
+                patch=SECTIONED_HTML_ENABLED and PATCH_MODE_ENABLED, sectioned=SECTIONED_HTML_ENABLED,
+                skeleton=page_shell
+            )
             
-        except Exception as e:
-            print(f"[HTMLAgent] Critical error: {e}")
-            st.error(f"Critical error in website creation: {str(e)}")
-            return False, f"Critical error: {str(e)}"
+            if not final_html:
+                raise WorkflowAbort("Website development failed")
+            return {'final_html': final_html}
+        
+        # Content and the page shell both only wait for the design, so they run concurrently
+        shell_steps, shell_inputs = [], []
+        if SECTIONED_HTML_ENABLED:
+            shell_steps = [
+                WorkflowStep("skeleton", draft_skeleton, 
+                             inputs=['user_specs', 'design_output'], outputs=['page_shell']),
+            ]
+            shell_inputs = ['page_shell']
+        
+        if PARALLEL_REVIEW_ENABLED:
+            review_steps = [
+                WorkflowStep("parallel_review", review_in_parallel, 
+                             inputs=['user_specs', 'pm_analysis', 'design_output', 'content_output'] + shell_inputs,
+                             outputs=['final_html']),
+            ]
+        else:
+            review_steps = [
+                WorkflowStep("html_qa", develop_html, 
+                             inputs=['user_specs', 'design_output', 'content_output'] + shell_inputs,
+                             outputs=['reviewed_html']),
+                WorkflowStep("pm_validation", validate_requirements, 
+                             inputs=['reviewed_html', 'pm_analysis', 'design_output', 'content_output'],
+                             outputs=['final_html']),
+            ]
+        
+        return WorkflowGraph([
+            WorkflowStep("pm_analysis", analyze_requirements, 
+                         inputs=['user_specs'], outputs=['pm_analysis']),
+            WorkflowStep("design", create_design, 
+                         inputs=['user_specs', 'pm_analysis'], outputs=['design_output']),
+            WorkflowStep("content", write_content, 
+                         inputs=['user_specs', 'design_output'], outputs=['content_output']),
+        ] + shell_steps + review_steps, max_workers=WORKFLOW_MAX_WORKERS)
     
     @staticmethod
-    def _modify_website_workflow(feedback, workspace_path, agents, workflow):
-        """Website modification workflow starting from DesignAgent"""
+    @metered_workflow
+    def _modify_website_workflow(feedback, workspace_path, agents, workflow, preview=None, user_specs=None):
+        """Website modification workflow: reruns the design/content stages the feedback affects, then HTML/QA"""
         try:
             # Get current website
             html_path = os.path.join(workspace_path, 'index.html')
@@ -970,51 +3430,78 @@ class HTMLAgent:
             with open(html_path, 'r', encoding='utf-8') as f:
                 current_html = f.read()
             
-            # Get original user specs from session state
-            user_specs = st.session_state.get('website_context', {})
+            # Get original user specs from session state (background jobs pass them explicitly)
+            if user_specs is None:
+                user_specs = st.session_state.get('website_context', {})
             
             log_agent_communication("User", "DesignAgent", f"Modification request: {feedback[:50]}...", 
                                    f"Full feedback: {feedback}")
             
-            # Start from Design Agent with modification context
-            st.info("🎨 **DesignAgent**: Analyzing modification requirements...")
-            
-            modification_prompt = f"MODIFICATION REQUEST: {feedback}\n\nAnalyze this request and update the design system accordingly. Consider the existing website and user feedback."
+            # Only the stages this feedback touches are rerun; the rest come from the last build of this site
+            stages, impact = ChangeImpact.analyze(feedback) if STAGE_REUSE_ENABLED else ({"design", "content"}, "full")
+            stage_cache = StageCache(workspace_path)
+            # Fingerprint against the spec the stages were recorded with: the session's website_context
+            # is a different dict than the SpecAgent spec the site was created from and would never match
+            site_specs = stage_cache.site_specs() or user_specs
+            log_agent_communication("Workflow", "System", f"Change impact: {impact}", 
+                                   f"Stages to rerun: {', '.join(sorted(stages)) or 'none'} (+ HTML)")
             
-            design_output = agents['design_agent'].create_design_system(
-                modification_prompt, user_specs, is_modification=True
-            )
-            content_prompt = design_output.get('content_agent_prompt', 'Update content based on feedback')
+            design_output = None
+            if "design" not in stages:
+                design_output = stage_cache.get("design", StageCache.stage_inputs("design", site_specs))
+            if design_output:
+                report_progress("info", "♻️ **DesignAgent**: Design system not affected by this request - reusing it")
+            else:
+                # Start from Design Agent with modification context
+                report_progress("info", "🎨 **DesignAgent**: Analyzing modification requirements...")
+                
+                modification_prompt = f"MODIFICATION REQUEST: {feedback}\n\nAnalyze this request and update the design system accordingly. Consider the existing website and user feedback."
+                
+                design_output = HTMLAgent._run_agent_step(
+                    agents['design_agent'], 'create_design_system',
+                    modification_prompt, user_specs, is_modification=True
+                )
+                previous_design = stage_cache.latest("design")
+                if impact == "design" and isinstance(previous_design, dict) and previous_design.get('design_strategy'):
+                    # A purely visual change keeps the strategy the current copy was written for
+                    design_output = dict(design_output, design_strategy=previous_design['design_strategy'])
+                
+                report_progress("success", "✅ **DesignAgent**: Modification design completed")
             
-            st.success("✅ **DesignAgent**: Modification design completed")
+            content_output = None
+            if "content" not in stages:
+                content_output = stage_cache.get("content", StageCache.stage_inputs("content", site_specs, design_output))
+            if content_output:
+                report_progress("info", "♻️ **ContentAgent**: Content not affected by this request - reusing it")
+            else:
+                # Content Agent updates
+                report_progress("info", "✍️ **ContentAgent**: Updating content strategy...")
+                
+                content_prompt = design_output.get('content_agent_prompt', 'Update content based on feedback')
+                content_output = HTMLAgent._run_agent_step(
+                    agents['content_agent'], 'generate_website_content',
+                    f"MODIFICATION REQUEST: {feedback}\n\n{content_prompt}", user_specs, design_output, is_modification=True
+                )
+                
+                report_progress("success", "✅ **ContentAgent**: Content updates completed")
             
-            # Content Agent updates
-            st.info("✍️ **ContentAgent**: Updating content strategy...")
+            # HTML-QA cycle for modifications; the request is restated since reused content predates it
+            report_progress("info", "🔧 **HTMLAgent**: Implementing modifications...")
             
-            content_output = agents['content_agent'].generate_website_content(
-                content_prompt, user_specs, design_output, is_modification=True
-            )
             html_prompt = content_output.get('html_agent_prompt', 'Update website based on feedback')
-            
-            st.success("✅ **ContentAgent**: Content updates completed")
-            
-            # HTML-QA cycle for modifications
-            st.info("🔧 **HTMLAgent**: Implementing modifications...")
-            
-            # Add current HTML to prompt context
-            html_prompt_with_context = f"{html_prompt}\n\nCURRENT WEBSITE CODE:\n{current_html}"
-            
+            # Both the patch and the full-page prompt carry the current page themselves
             final_html = HTMLAgent._html_qa_cycle(
-                html_prompt_with_context, user_specs, design_output, content_output,
-                agents, workflow, workspace_path, current_html=current_html
+                f"MODIFICATION REQUEST: {feedback}\n\n{html_prompt}", user_specs, design_output, content_output,
+                agents, workflow, workspace_path, current_html=current_html, preview=preview, patch=PATCH_MODE_ENABLED
             )
             
             if final_html and final_html != current_html:
                 # Write updated file
                 with open(html_path, 'w', encoding='utf-8') as f:
                     f.write(final_html)
+                stage_cache.record(site_specs, design_output, content_output)
                 
-                st.success("✅ **HTMLAgent**: Modifications applied successfully")
+                report_progress("success", "✅ **HTMLAgent**: Modifications applied successfully")
                 return True, "✅ Website updated successfully"
             else:
                 return False, "❌ No changes made or modification failed"
@@ -1024,53 +3511,108 @@ class HTMLAgent:
             return False, f"❌ Modification failed: {str(e)}"
     
     @staticmethod
-    def _html_qa_cycle(html_prompt, user_specs, design_output, content_output, agents, workflow, workspace_path, current_html=None):
-        """HTML Agent and QA Agent development cycle"""
+    def _generate_candidate(html_agent, html_prompt, user_specs, design_output, content_output, working_html=None, preview=None, patch=False, sectioned=False, skeleton=None):
+        """Produce the next HTML candidate: stitched sections for a first draft, region patch for a revision, else full generation"""
+        candidate = None
+        if sectioned and not working_html:
+            candidate = HTMLAgent._run_agent_step(
+                html_agent, 'generate_sectioned_html',
+                html_prompt, user_specs, design_output, content_output, skeleton=skeleton
+            )
+            if candidate:
+                report_progress("info", "🧩 **HTMLAgent**: Sections generated in parallel and stitched")
+            else:
+                report_progress("info", "🔧 **HTMLAgent**: Sectioned generation not applicable - generating full page...")
+        elif patch and working_html:
+            candidate = HTMLAgent._run_agent_step(
+                html_agent, 'generate_html_patch',
+                html_prompt, user_specs, design_output, content_output, working_html
+            )
+            if candidate:
+                report_progress("info", "🩹 **HTMLAgent**: Changed regions merged into the current page")
+            else:
+                report_progress("info", "🔧 **HTMLAgent**: Patch not applicable - regenerating full page...")
+        
+        if candidate:
+            if preview:
+                preview(candidate)
+            return candidate
+        
+        return HTMLAgent._run_agent_step(
+            html_agent, 'generate_html_code',
+            html_prompt, user_specs, design_output, content_output, 
+            current_html=working_html, preview=preview
+        )
+    
+    @staticmethod
+    def _html_qa_cycle(html_prompt, user_specs, design_output, content_output, agents, workflow, workspace_path, current_html=None, preview=None, patch=False, sectioned=False, skeleton=None):
+        """HTML Agent and QA Agent development cycle (patch=True edits regions, sectioned=True fans out the first draft)"""
         html_agent = agents['html_agent']
         qa_agent = agents['qa_agent']
         
         working_html = current_html
+        convergence = ConvergenceTracker(CONVERGENCE_HTML_SIMILARITY, CONVERGENCE_FEEDBACK_SIMILARITY)
         
         while workflow.can_continue_html_qa():
             workflow.increment_html_qa()
             
-            st.info(f"🔧 **HTMLAgent**: Development iteration {workflow.html_qa_cycles}/5...")
+            report_progress("info", f"🔧 **HTMLAgent**: Development iteration {workflow.html_qa_cycles}/5...")
             
             # HTML Agent generates/updates code
-            working_html = html_agent.generate_html_code(
-                html_prompt, user_specs, design_output, content_output, 
-                current_html=working_html
+            working_html = HTMLAgent._generate_candidate(
+                html_agent, html_prompt, user_specs, design_output, content_output, 
+                working_html, preview=preview, patch=patch, sectioned=sectioned, skeleton=skeleton
             )
             
             if not working_html:
-                st.error("❌ **HTMLAgent**: Code generation failed")
+                report_progress("error", "❌ **HTMLAgent**: Code generation failed")
+                workflow.record_stop("html_qa", "code generation failed")
                 break
             
-            st.success(f"✅ **HTMLAgent**: Code generated (iteration {workflow.html_qa_cycles})")
+            report_progress("success", f"✅ **HTMLAgent**: Code generated (iteration {workflow.html_qa_cycles})")
+            
+            # Same page as the rejected one - another QA round cannot change the verdict
+            stall_reason = convergence.observe_html(working_html)
+            if stall_reason:
+                report_progress("warning", f"⚠️ **HTMLAgent**: Development stalled ({stall_reason}) - using current version")
+                workflow.record_stop("html_qa", stall_reason)
+                return working_html
+            
             log_agent_communication("HTMLAgent", "QAAgent", f"Code review request (iteration {workflow.html_qa_cycles})", 
                                    f"HTML length: {len(working_html)}")
             
             # QA Agent reviews code
-            st.info(f"🔍 **QAAgent**: Code review {workflow.html_qa_cycles}/5...")
+            report_progress("info", f"🔍 **QAAgent**: Code review {workflow.html_qa_cycles}/5...")
             
-            qa_passed, qa_feedback = qa_agent.review_html_code(working_html, user_specs, design_output, content_output)
+            qa_passed, qa_feedback = HTMLAgent._run_agent_step(
+                qa_agent, 'review_html_code', working_html, user_specs, design_output, content_output
+            )
             
             if qa_passed:
-                st.success(f"✅ **QAAgent**: Code approved (iteration {workflow.html_qa_cycles})")
+                report_progress("success", f"✅ **QAAgent**: Code approved (iteration {workflow.html_qa_cycles})")
                 log_agent_communication("QAAgent", "HTMLAgent", "Code approved", "Quality standards met")
+                workflow.record_stop("html_qa", "qa approved")
                 return working_html
             else:
-                st.warning(f"⚠️ **QAAgent**: Issues found - requesting fixes...")
+                report_progress("warning", f"⚠️ **QAAgent**: Issues found - requesting fixes...")
                 log_agent_communication("QAAgent", "HTMLAgent", "Code review failed", qa_feedback)
                 
+                stall_reason = convergence.observe_feedback(qa_feedback)
+                if stall_reason:
+                    report_progress("warning", f"⚠️ **QAAgent**: Review stalled ({stall_reason}) - using current version")
+                    workflow.record_stop("html_qa", stall_reason)
+                    return working_html
+                
                 # Update HTML prompt with QA feedback for next iteration
                 html_prompt = f"{html_prompt}\n\nQA FEEDBACK TO FIX:\n{qa_feedback}"
+        else:
+            workflow.record_stop("html_qa", workflow.limit_reason())
         
-        st.warning("⚠️ **HTMLAgent**: Maximum QA cycles reached - using last version")
+        report_progress("warning", "⚠️ **HTMLAgent**: Maximum QA cycles reached - using last version")
         return working_html
     
     @staticmethod
-    def _pm_validation_cycle(html_content, pm_analysis, design_output, content_output, agents, workflow, workspace_path):
+    def _pm_validation_cycle(html_content, pm_analysis, design_output, content_output, agents, workflow, workspace_path, preview=None):
         """Product Manager validation cycle"""
         pm_agent = agents['product_manager']
         max_pm_cycles = 3  # Reduced from 5 to prevent excessive cycles
@@ -1078,18 +3620,19 @@ class HTMLAgent:
         while workflow.can_continue_pm_html() and workflow.pm_html_cycles < max_pm_cycles:
             workflow.increment_pm_html()
             
-            st.info(f"🔍 **ProductManager**: Requirements validation {workflow.pm_html_cycles}/{max_pm_cycles}...")
+            report_progress("info", f"🔍 **ProductManager**: Requirements validation {workflow.pm_html_cycles}/{max_pm_cycles}...")
             
-            validation_passed, pm_feedback = pm_agent.validate_final_website(
+            validation_passed, pm_feedback = HTMLAgent._run_agent_step(
+                pm_agent, 'validate_final_website',
                 html_content, pm_analysis, design_output, content_output
             )
             
             if validation_passed:
-                st.success(f"✅ **ProductManager**: All requirements satisfied")
+                report_progress("success", f"✅ **ProductManager**: All requirements satisfied")
                 log_agent_communication("ProductManager", "System", "Final validation passed", "Website approved")
                 return html_content
             else:
-                st.warning(f"⚠️ **ProductManager**: Requirements not met - requesting changes...")
+                report_progress("warning", f"⚠️ **ProductManager**: Requirements not met - requesting changes...")
                 log_agent_communication("ProductManager", "HTMLAgent", "Requirements validation failed", pm_feedback)
                 
                 # Reset HTML-QA cycles for new PM iteration
@@ -1101,30 +3644,460 @@ class HTMLAgent:
                 # Run HTML-QA cycle again
                 html_content = HTMLAgent._html_qa_cycle(
                     html_prompt, {}, design_output, content_output,
-                    agents, workflow, workspace_path, current_html=html_content
+                    agents, workflow, workspace_path, current_html=html_content, preview=preview
                 )
                 
                 if not html_content:
                     break
         
-        st.warning(f"⚠️ **ProductManager**: Maximum validation cycles ({max_pm_cycles}) reached - deploying current version")
-        return html_content
+        budget_reason = workflow.budget_exceeded()
+        if budget_reason:
+            workflow.record_stop("pm_validation", budget_reason)
+            report_progress("warning", f"⚠️ **ProductManager**: {budget_reason} - deploying current version")
+            return html_content
+        
+        report_progress("warning", f"⚠️ **ProductManager**: Maximum validation cycles ({max_pm_cycles}) reached - deploying current version")
+        return html_content
+    
+    @staticmethod
+    def _parallel_review_cycle(html_prompt, user_specs, pm_analysis, design_output, content_output, agents, workflow, workspace_path, current_html=None, preview=None, patch=False, sectioned=False, skeleton=None):
+        """Single HTML loop where QA review and PM validation of each candidate run concurrently"""
+        html_agent = agents['html_agent']
+        
+        base_prompt = html_prompt
+        working_html = current_html
+        convergence = ConvergenceTracker(CONVERGENCE_HTML_SIMILARITY, CONVERGENCE_FEEDBACK_SIMILARITY)
+        
+        while workflow.can_continue_html_qa():
+            workflow.increment_html_qa()
+            
+            report_progress("info", f"🔧 **HTMLAgent**: Development iteration {workflow.html_qa_cycles}/5...")
+            
+            candidate = HTMLAgent._generate_candidate(
+                html_agent, html_prompt, user_specs, design_output, content_output, 
+                working_html, preview=preview, patch=patch, sectioned=sectioned, skeleton=skeleton
+            )
+            
+            if not candidate:
+                report_progress("error", "❌ **HTMLAgent**: Code generation failed")
+                workflow.record_stop("parallel_review", "code generation failed")
+                break
+            working_html = candidate
+            
+            report_progress("success", f"✅ **HTMLAgent**: Code generated (iteration {workflow.html_qa_cycles})")
+            
+            stall_reason = convergence.observe_html(working_html)
+            if stall_reason:
+                report_progress("warning", f"⚠️ **HTMLAgent**: Development stalled ({stall_reason}) - deploying current version")
+                workflow.record_stop("parallel_review", stall_reason)
+                return working_html
+            
+            log_agent_communication("HTMLAgent", "QAAgent + ProductManager", 
+                                   f"Parallel review request (iteration {workflow.html_qa_cycles})", 
+                                   f"HTML length: {len(working_html)}")
+            
+            report_progress("info", f"🔍 **QAAgent** + **ProductManager**: Reviewing candidate {workflow.html_qa_cycles}/5...")
+            
+            verdicts, cancelled = run_agent_coroutine(HTMLAgent._review_candidate(
+                agents, working_html, user_specs, pm_analysis, design_output, content_output
+            ))
+            for reviewer in cancelled:
+                log_agent_communication("HTMLAgent", reviewer, "Review cancelled", "Candidate superseded")
+            
+            if len(verdicts) == 2 and all(passed for passed, _ in verdicts.values()):
+                report_progress("success", f"✅ **QAAgent** + **ProductManager**: Candidate approved (iteration {workflow.html_qa_cycles})")
+                log_agent_communication("ProductManager", "System", "Final validation passed", "Website approved")
+                workflow.record_stop("parallel_review", "candidate approved")
+                return working_html
+            
+            # Merge whatever feedback arrived into one fix request for the next candidate
+            rejected = [reviewer for reviewer, (passed, _) in verdicts.items() if not passed]
+            fixes = []
+            for reviewer in rejected:
+                feedback = verdicts[reviewer][1]
+                log_agent_communication(reviewer, "HTMLAgent", "Review failed", feedback)
+                fixes.append(f"{reviewer.upper()} FEEDBACK TO FIX:\n{feedback}")
+            
+            report_progress("warning", f"⚠️ **{' + '.join(rejected)}**: Issues found - requesting fixes...")
+            
+            stall_reason = convergence.observe_feedback("\n".join(fixes))
+            if stall_reason:
+                report_progress("warning", f"⚠️ **{' + '.join(rejected)}**: Review stalled ({stall_reason}) - deploying current version")
+                workflow.record_stop("parallel_review", stall_reason)
+                return working_html
+            
+            html_prompt = f"{base_prompt}\n\n" + "\n\n".join(fixes)
+        else:
+            workflow.record_stop("parallel_review", workflow.limit_reason())
+        
+        report_progress("warning", "⚠️ **HTMLAgent**: Maximum review cycles reached - deploying current version")
+        return working_html
+    
+    @staticmethod
+    async def _review_candidate(agents, html_code, user_specs, pm_analysis, design_output, content_output):
+        """Run QA review and PM validation concurrently; cancel the slower one once the candidate is rejected
+        
+        Runs on the shared agent loop, so it must not touch st.session_state (that would be whichever
+        session's script context the loop thread was last bound to). Returns (verdicts, cancelled
+        reviewers) and leaves the logging to the caller's thread.
+        """
+        tasks = {
+            asyncio.ensure_future(agents['qa_agent'].areview_html_code(
+                html_code, user_specs, design_output, content_output
+            )): "QAAgent",
+            asyncio.ensure_future(agents['product_manager'].avalidate_final_website(
+                html_code, pm_analysis, design_output, content_output
+            )): "ProductManager"
+        }
+        
+        verdicts = {}
+        cancelled = []
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                verdicts[tasks[task]] = task.result()
+            
+            if pending and any(not passed for passed, _ in verdicts.values()):
+                # Candidate is superseded - give the other reviewer a short grace period, then cancel it
+                done, pending = await asyncio.wait(pending, timeout=REVIEW_MERGE_GRACE_SECONDS)
+                for task in done:
+                    verdicts[tasks[task]] = task.result()
+                for task in pending:
+                    task.cancel()
+                    cancelled.append(tasks[task])
+                break
+        
+        return verdicts, cancelled
+    
+    def generate_html_code(self, html_prompt, user_specs, design_output, content_output, current_html=None, preview=None):
+        """Generate HTML code using LLM with memory (streams partial output to preview if given)"""
+        if not LLM_MODEL:
+            return self._generate_template_fallback(user_specs)
+        
+        prompt = self._html_prompt(html_prompt, user_specs, design_output, content_output, current_html)
+        try:
+            if preview and STREAM_PREVIEW_ENABLED:
+                content = stream_llm(
+                    prompt, self.memory.agent_name,
+                    lambda partial: preview(self._preview_document(partial)),
+                    use_cache=self.use_llm_cache,
+                    refresh_interval=PREVIEW_REFRESH_SECONDS
+                )
+            else:
+                content = invoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache)
+            return self._handle_html_response(content, prompt, html_prompt, user_specs)
+        except Exception as e:
+            print(f"[HTMLAgent] Code generation error: {e}")
+            return None
+    
+    async def agenerate_html_code(self, html_prompt, user_specs, design_output, content_output, current_html=None, preview=None):
+        """Async variant of generate_html_code (uses the LangChain ainvoke API)"""
+        if not LLM_MODEL:
+            return self._generate_template_fallback(user_specs)
+        
+        prompt = await asyncio.to_thread(self._html_prompt, html_prompt, user_specs, design_output, content_output, current_html)
+        try:
+            if preview and STREAM_PREVIEW_ENABLED:
+                content = await astream_llm(
+                    prompt, self.memory.agent_name,
+                    lambda partial: preview(self._preview_document(partial)),
+                    use_cache=self.use_llm_cache,
+                    refresh_interval=PREVIEW_REFRESH_SECONDS
+                )
+            else:
+                content = await ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache)
+            return await asyncio.to_thread(self._handle_html_response, content, prompt, html_prompt, user_specs)
+        except Exception as e:
+            print(f"[HTMLAgent] Code generation error: {e}")
+            return None
+    
+    def generate_html_patch(self, html_prompt, user_specs, design_output, content_output, current_html):
+        """Modify only the affected page regions; returns the merged page or None to fall back to full regeneration"""
+        if not LLM_MODEL or not current_html:
+            return None
+        
+        try:
+            prompt = self._patch_prompt(html_prompt, user_specs, design_output, content_output, current_html)
+            content = invoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache)
+            return self._handle_patch_response(content, prompt, html_prompt, user_specs, current_html)
+        except Exception as e:
+            print(f"[HTMLAgent] Patch generation error: {e}")
+            return None
+    
+    async def agenerate_html_patch(self, html_prompt, user_specs, design_output, content_output, current_html):
+        """Async variant of generate_html_patch (uses the LangChain ainvoke API)"""
+        if not LLM_MODEL or not current_html:
+            return None
+        
+        try:
+            prompt = self._patch_prompt(html_prompt, user_specs, design_output, content_output, current_html)
+            content = await ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache)
+            return await asyncio.to_thread(self._handle_patch_response, content, prompt, html_prompt, user_specs, current_html)
+        except Exception as e:
+            print(f"[HTMLAgent] Patch generation error: {e}")
+            return None
+    
+    PATCH_PROMPT = PromptTemplate("HTMLAgent.patch", """
+You are an expert full-stack web developer making a targeted change to an existing single-file website.
+
+OUTPUT FORMAT (MANDATORY):
+Return ONLY the regions you change, each as a complete replacement element:
+<<<REGION region-name>>>
+...complete new markup for that region...
+<<<END>>>
+
+RULES:
+• Use the exact region names listed under ADDRESSABLE REGIONS OF THE CURRENT PAGE
+• "style" is the whole <style> element in <head>; "script" is the whole <script> element before </body>
+• To add a new block, use <<<REGION after:region-name>>> with the new element
+• To remove a block, return its region with an empty body
+• Leave every other region untouched and do NOT return the full document
+• Keep all CSS in the style region and all JavaScript in the script region
+• No explanations or markdown outside the region blocks""", (
+        ("DESIGN SPECIFICATIONS", "design"),
+        ("CONTENT SPECIFICATIONS", "content"),
+        ("USER REQUIREMENTS", "specs"),
+        ("MODIFICATION INSTRUCTIONS", "instructions"),
+        ("CURRENT WEBSITE CODE", "current_html"),
+        ("ADDRESSABLE REGIONS OF THE CURRENT PAGE", "outline"),
+    ))
+    
+    def _patch_prompt(self, html_prompt, user_specs, design_output, content_output, current_html):
+        """Build the region-level modification prompt (raises ValueError if the page cannot be split)"""
+        outline = PageRegions.outline(current_html)
+        context = PromptContext.compile("html", design=design_output, content=content_output)
+        
+        return self.PATCH_PROMPT.render(
+            design=context['design'],
+            content=context['content'],
+            specs=PromptTemplate.spec_lines(
+                user_specs,
+                ("Business", 'business_name', 'Professional Business'),
+                ("Primary Color", 'primary_color', '#3498db'),
+            ),
+            instructions=html_prompt,
+            current_html=current_html,
+            outline=outline
+        )
+    
+    def _handle_patch_response(self, content, prompt, html_prompt, user_specs, current_html):
+        """Merge returned regions into the current page and validate the result"""
+        try:
+            html_code = PageRegions.apply(current_html, content)
+        except ValueError as e:
+            print(f"[HTMLAgent] Patch could not be applied: {e}")
+            forget_llm_response(prompt, self.memory.agent_name)
+            return None
+        
+        if not self._validate_html(html_code):
+            print("[HTMLAgent] Patched HTML validation failed")
+            forget_llm_response(prompt, self.memory.agent_name)
+            return None
+        
+        self.memory.add_interaction(
+            {"prompt": html_prompt, "specs": user_specs}, 
+            {"html_code": html_code[:500], "patch": content[:500]}, 
+            "code_generation"
+        )
+        return html_code
+    
+    def generate_sectioned_html(self, html_prompt, user_specs, design_output, content_output, skeleton=None):
+        """Generate skeleton and sections concurrently and stitch them; None means use full generation"""
+        return run_agent_coroutine(self.agenerate_sectioned_html(html_prompt, user_specs, design_output, content_output, skeleton))
+    
+    async def agenerate_sectioned_html(self, html_prompt, user_specs, design_output, content_output, skeleton=None):
+        """Async implementation of generate_sectioned_html (one ainvoke per section, all in flight at once)
+        
+        A skeleton drafted earlier (generate_skeleton) is used as-is instead of requesting a new one.
+        """
+        if not LLM_MODEL:
+            return None
+        
+        plan = self._section_plan(user_specs)
+        if len(plan) < SECTIONED_HTML_MIN_SECTIONS:
+            return None
+        
+        try:
+            prompts = [self._skeleton_prompt(html_prompt, user_specs, design_output, plan)]
+            prompts += [self._section_prompt(slug, label, features, user_specs, design_output, content_output)
+                        for slug, label, features in plan]
+            requested = prompts[1:] if skeleton else prompts
+            responses = await asyncio.gather(*[
+                ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache) for prompt in requested
+            ])
+            if skeleton:
+                responses = [skeleton] + responses
+            return await asyncio.to_thread(self._handle_sectioned_response, responses, prompts, html_prompt, user_specs, plan)
+        except Exception as e:
+            print(f"[HTMLAgent] Sectioned generation error: {e}")
+            return None
+    
+    def generate_skeleton(self, user_specs, design_output):
+        """Draft the page shell from the design alone; None when sectioned generation does not apply"""
+        return run_agent_coroutine(self.agenerate_skeleton(user_specs, design_output))
     
-    def generate_html_code(self, html_prompt, user_specs, design_output, content_output, current_html=None):
-        """Generate HTML code using LLM with memory"""
+    async def agenerate_skeleton(self, user_specs, design_output):
+        """Async implementation of generate_skeleton (needs no content, so it can overlap ContentAgent)"""
         if not LLM_MODEL:
-            return self._generate_template_fallback(user_specs)
+            return None
         
-        # Get relevant context from memory
-        previous_code = self.memory.get_relevant_context("code_generation")
-        context_summary = ""
-        if previous_code:
-            context_summary = f"\nPREVIOUS DEVELOPMENT EXPERIENCE:\n{self._format_context(previous_code)}"
+        plan = self._section_plan(user_specs)
+        if len(plan) < SECTIONED_HTML_MIN_SECTIONS:
+            return None
+        
+        prompt = self._skeleton_prompt(None, user_specs, design_output, plan)
+        try:
+            skeleton = self._clean_code_response(
+                await ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache)
+            )
+        except Exception as e:
+            print(f"[HTMLAgent] Skeleton generation error: {e}")
+            return None
+        
+        if not self._validate_html(skeleton):
+            print("[HTMLAgent] Skeleton validation failed")
+            await asyncio.to_thread(forget_llm_response, prompt, self.memory.agent_name)
+            return None
+        return skeleton
+    
+    def _section_plan(self, user_specs):
+        """Map core sections to (slug, label, features); features without a matching section stay site-wide"""
+        plan = []
+        for label in user_specs.get('core_sections', []):
+            if any(label.strip().lower() == planned.strip().lower() for _, planned, _ in plan):
+                print(f"[HTMLAgent] Skipping repeated core section '{label}'")
+                continue
+            slug = SectionStitcher.section_slug(label, taken=[existing for existing, _, _ in plan])
+            plan.append((slug, label, []))
+        
+        for feature in user_specs.get('special_features', []):
+            for slug, _, features in plan:
+                if any(word in feature.lower() for word in slug.split('-') if not word.isdigit()):
+                    features.append(feature)
+                    break
+        return plan
+    
+    def _design_tokens(self, design_output):
+        """Fixed CSS custom properties shared by the skeleton and every section"""
+        palette = design_output.get('visual_system', {}).get('color_palette', {}) if isinstance(design_output, dict) else {}
+        typography = design_output.get('visual_system', {}).get('typography', {}) if isinstance(design_output, dict) else {}
+        return f"""--primary: {palette.get('primary', '#2c3e50')}; --secondary: {palette.get('secondary', '#3498db')};
+--accent: {palette.get('accent', '#e67e22')}; --text: {palette.get('text', '#222222')}; --bg: {palette.get('background', '#ffffff')};
+--font-heading: {typography.get('headings', 'system-ui, sans-serif')}; --font-body: {typography.get('body', 'system-ui, sans-serif')};
+--radius: 8px; --space: 1rem"""
+    
+    SKELETON_PROMPT = PromptTemplate("HTMLAgent.skeleton", """
+You are an expert full-stack web developer. Create ONLY the shared shell of a single-file website; the page sections are written separately and inserted later.
+
+REQUIREMENTS:
+• Complete document: <!DOCTYPE html>, <head> with meta tags, title and ONE <style> tag
+• In <style>, define exactly the CSS VARIABLES given below on :root and use them everywhere
+• Global styles only: reset, typography, buttons, containers, header/nav, footer, responsive breakpoints
+• <header> with the NAVIGATION LINKS given below
+• Inside <main>, output the SECTION PLACEHOLDERS given below EXACTLY, in that order, and nothing else
+• <footer>, then ONE <script> before </body> for navigation behaviour (mobile toggle, smooth scroll)
+• No external files
+
+Return ONLY the HTML document.""", (
+        ("DESIGN SPECIFICATIONS", "design"),
+        ("CSS VARIABLES", "tokens"),
+        ("BUSINESS", "business"),
+        ("SITE-WIDE FEATURES", "features"),
+        ("NAVIGATION LINKS", "nav_items"),
+        ("SECTION PLACEHOLDERS", "placeholders"),
+        ("HTML DEVELOPMENT INSTRUCTIONS", "instructions"),
+    ))
+    
+    def _skeleton_prompt(self, html_prompt, user_specs, design_output, plan):
+        """Prompt for the shared page shell (head, tokens, nav, footer, base script)"""
+        placeholders = "\n".join(SectionStitcher.PLACEHOLDER.format(slug) for slug, _, _ in plan)
+        nav_items = ", ".join(f'"{label}" -> #{slug}' for slug, label, _ in plan)
+        assigned = {feature for _, _, features in plan for feature in features}
+        site_wide = [feature for feature in user_specs.get('special_features', []) if feature not in assigned]
+        
+        return self.SKELETON_PROMPT.render(
+            design=PromptContext.compile("html", design=design_output)['design'],
+            tokens=self._design_tokens(design_output),
+            business=user_specs.get('business_name', 'Professional Business'),
+            features=", ".join(site_wide) or "none",
+            nav_items=nav_items,
+            placeholders=placeholders,
+            instructions=html_prompt
+        )
+    
+    SECTION_PROMPT = PromptTemplate("HTMLAgent.section", """
+You are an expert front-end developer writing ONE section of a single-file website. The page shell, global styles and navigation already exist.
+
+RULES:
+• The CSS VARIABLES listed below are already defined on :root - use them, do not redefine them
+• Implement the FEATURES listed for this section, if any
+
+OUTPUT:
+• Exactly one <section> element, with the element id given under SECTION, containing the complete section markup
+• Optionally one <style> tag with CSS for this section; prefix EVERY selector with #<section id>
+• Optionally one <script> tag with JavaScript for this section only (it runs in its own scope)
+• No <html>, <head>, <body>, navigation or footer
+
+Return ONLY the section, style and script markup.""", (
+        ("CSS VARIABLES", "tokens"),
+        ("DESIGN", "design"),
+        ("BUSINESS", "business"),
+        ("SECTION", "section"),
+        ("FEATURES", "features"),
+        ("CONTENT", "content"),
+    ))
+    
+    def _section_prompt(self, slug, label, features, user_specs, design_output, content_output):
+        """Prompt for one page section (markup plus section-scoped CSS/JS)"""
+        website_content = content_output.get('website_content', {}) if isinstance(content_output, dict) else {}
+        # Content is keyed by plain section names ("services"); a slug like "services-products" matches by word
+        section_content = website_content.get(slug) or next(
+            (website_content[word] for word in slug.split('-') if word in website_content), website_content
+        )
+        context = PromptContext.compile("section", design=design_output, content=section_content)
+        
+        return self.SECTION_PROMPT.render(
+            tokens=self._design_tokens(design_output),
+            design=context['design'],
+            business=user_specs.get('business_name', 'Professional Business'),
+            section=f'{label} (element id "{slug}")',
+            features=", ".join(features) or "none",
+            content=context['content']
+        )
+    
+    def _handle_sectioned_response(self, responses, prompts, html_prompt, user_specs, plan):
+        """Stitch skeleton and sections; drops cached responses of any part that was unusable"""
+        skeleton = self._clean_code_response(responses[0])
+        if not self._validate_html(skeleton):
+            print("[HTMLAgent] Skeleton validation failed")
+            forget_llm_response(prompts[0], self.memory.agent_name)
+            return None
+        
+        sections = []
+        for (slug, _, _), response, prompt in zip(plan, responses[1:], prompts[1:]):
+            try:
+                markup, css, js = SectionStitcher.parse_fragment(self._clean_code_response(response))
+            except ValueError as e:
+                print(f"[HTMLAgent] Section '{slug}' unusable: {e}")
+                forget_llm_response(prompt, self.memory.agent_name)
+                return None
+            sections.append((slug, markup, css, js))
         
-        mode_instruction = "Create a new website" if not current_html else "Modify the existing website"
-        current_code_section = f"\n\nCURRENT CODE TO MODIFY:\n{current_html}" if current_html else ""
+        html_code = SectionStitcher.stitch(skeleton, sections)
+        if not self._validate_html(html_code):
+            print("[HTMLAgent] Stitched HTML validation failed")
+            return None
         
-        prompt = f"""You are an expert full-stack web developer. {mode_instruction} based on the comprehensive specifications.
+        self.memory.add_interaction(
+            {"prompt": html_prompt, "specs": user_specs}, 
+            {"html_code": html_code[:500], "sections": [slug for slug, _, _ in plan]}, 
+            "code_generation"
+        )
+        return html_code
+    
+    HTML_PROMPT = PromptTemplate("HTMLAgent.html", """
+You are an expert full-stack web developer. Build the website described in the request (a new site, or a modification of the CURRENT CODE TO MODIFY when it is given) based on the comprehensive specifications.
 
 CRITICAL ARCHITECTURE REQUIREMENT:
 • MUST BE A SINGLE HTML FILE WITH ALL CSS AND JAVASCRIPT EMBEDDED
@@ -1133,22 +4106,6 @@ CRITICAL ARCHITECTURE REQUIREMENT:
 • ALL JAVASCRIPT MUST BE IN <script> TAG BEFORE </body>
 • SELF-CONTAINED AND READY TO RUN IMMEDIATELY
 
-HTML DEVELOPMENT INSTRUCTIONS:
-{html_prompt}
-
-DESIGN SPECIFICATIONS:
-{design_output}
-
-CONTENT SPECIFICATIONS:
-{content_output}
-
-USER REQUIREMENTS:
-• Business: {user_specs.get('business_name', 'Professional Business')}
-• Industry: {user_specs.get('industry_focus', 'Professional Services')}
-• Primary Color: {user_specs.get('primary_color', '#3498db')}
-{current_code_section}
-{context_summary}
-
 TECHNICAL REQUIREMENTS:
 • SINGLE HTML FILE with embedded CSS and JavaScript (MANDATORY)
 • Modern, responsive design (mobile-first approach)
@@ -1185,29 +4142,53 @@ CRITICAL SUCCESS FACTORS:
 • All functionality embedded within the single file
 • Professional design that works immediately
 
-OUTPUT: Return ONLY the complete HTML document. No explanations, no markdown blocks, just the raw HTML code."""
-
-        try:
-            response = LLM_MODEL.invoke(prompt)
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            # Clean the response
-            html_code = self._clean_code_response(content)
-            
-            if self._validate_html(html_code):
-                # Store in memory
-                self.memory.add_interaction(
-                    {"prompt": html_prompt, "specs": user_specs}, 
-                    {"html_code": html_code[:500]}, 
-                    "code_generation"
-                )
-                return html_code
-            else:
-                print("[HTMLAgent] HTML validation failed")
-                return None
-                
-        except Exception as e:
-            print(f"[HTMLAgent] Code generation error: {e}")
+OUTPUT: Return ONLY the complete HTML document. No explanations, no markdown blocks, just the raw HTML code.""", (
+        ("DESIGN SPECIFICATIONS", "design"),
+        ("CONTENT SPECIFICATIONS", "content"),
+        ("USER REQUIREMENTS", "specs"),
+        ("PREVIOUS DEVELOPMENT EXPERIENCE", "history"),
+        ("TASK", "task"),
+        ("HTML DEVELOPMENT INSTRUCTIONS", "instructions"),
+        ("CURRENT CODE TO MODIFY", "current_html"),
+    ), cache_exempt=("history",))
+    
+    def _html_prompt(self, html_prompt, user_specs, design_output, content_output, current_html=None):
+        """Build the HTML generation prompt (request sections run from most to least stable across fix cycles)"""
+        # Get relevant context from memory
+        previous_code = self.memory.get_relevant_context("code_generation", query=html_prompt, k=3)
+        context = PromptContext.compile("html", design=design_output, content=content_output)
+        
+        return self.HTML_PROMPT.render(
+            design=context['design'],
+            content=context['content'],
+            specs=PromptTemplate.spec_lines(
+                user_specs,
+                ("Business", 'business_name', 'Professional Business'),
+                ("Industry", 'industry_focus', 'Professional Services'),
+                ("Primary Color", 'primary_color', '#3498db'),
+            ),
+            history=self._format_context(previous_code) if previous_code else None,
+            task="Create a new website" if not current_html else "Modify the existing website",
+            instructions=html_prompt,
+            current_html=current_html
+        )
+    
+    def _handle_html_response(self, content, prompt, html_prompt, user_specs):
+        """Clean and validate generated HTML and record it in memory"""
+        # Clean the response
+        html_code = self._clean_code_response(content)
+        
+        if self._validate_html(html_code):
+            # Store in memory
+            self.memory.add_interaction(
+                {"prompt": html_prompt, "specs": user_specs}, 
+                {"html_code": html_code[:500]}, 
+                "code_generation"
+            )
+            return html_code
+        else:
+            print("[HTMLAgent] HTML validation failed")
+            forget_llm_response(prompt, self.memory.agent_name)
             return None
     
     def _clean_code_response(self, content):
@@ -1228,6 +4209,28 @@ OUTPUT: Return ONLY the complete HTML document. No explanations, no markdown blo
         
         return content.strip()
     
+    def _preview_document(self, partial_content):
+        """Make a partially streamed document safe to render in the preview pane"""
+        content = partial_content.lstrip()
+        
+        # Drop a leading markdown fence (the closing fence has not arrived yet)
+        if content.startswith("```"):
+            content = content.split('\n', 1)[1] if '\n' in content else ""
+        
+        lower = content.lower()
+        
+        # Never execute half-written JavaScript - cut at an unterminated <script>
+        script_start = lower.rfind('<script')
+        if script_start > lower.rfind('</script>'):
+            content = content[:script_start]
+            lower = lower[:script_start]
+        
+        # Close an unterminated <style> so the body that follows can render
+        if lower.rfind('<style') > lower.rfind('</style>'):
+            content += '\n</style>'
+        
+        return content
+    
     def _validate_html(self, content):
         """Basic HTML validation"""
         if not content:
@@ -1295,32 +4298,385 @@ OUTPUT: Return ONLY the complete HTML document. No explanations, no markdown blo
             formatted.append(f"- Previous work: {str(ctx.get('output', {}))[:100]}...")
         return "\n".join(formatted)
 
+class PageRegions:
+    """Splits a single-file page into addressable regions and merges region-level patches"""
+    REGION_TAGS = ('header', 'nav', 'section', 'footer')
+    TAG_PATTERN = re.compile(r'<(/?)(header|nav|section|footer)\b([^>]*)>', re.IGNORECASE)
+    STYLE_PATTERN = re.compile(r'<style\b[^>]*>.*?</style>', re.IGNORECASE | re.DOTALL)
+    SCRIPT_PATTERN = re.compile(r'<script\b(?![^>]*\bsrc=)[^>]*>.*?</script>', re.IGNORECASE | re.DOTALL)
+    PATCH_PATTERN = re.compile(r'<<<REGION\s+([^>\n]+?)\s*>>>\s*?\n(.*?)\n?\s*<<<END>>>', re.DOTALL)
+    
+    @classmethod
+    def split(cls, html):
+        """Return an ordered list of (name, start, end) spans: style, top-level page blocks, script"""
+        regions = []
+        head_end = html.lower().find('</head>')
+        body_start = html.lower().find('<body')
+        
+        style = cls.STYLE_PATTERN.search(html, 0, head_end if head_end != -1 else len(html))
+        if style:
+            regions.append(('style', style.start(), style.end()))
+        
+        # Ignore tag-like text inside embedded CSS/JS
+        scripts = list(cls.SCRIPT_PATTERN.finditer(html, max(body_start, 0)))
+        opaque = [(m.start(), m.end()) for m in scripts + list(cls.STYLE_PATTERN.finditer(html))]
+        
+        stack = []
+        counts = {}
+        for match in cls.TAG_PATTERN.finditer(html, max(body_start, 0)):
+            if any(start <= match.start() < end for start, end in opaque):
+                continue
+            closing, tag = match.group(1), match.group(2).lower()
+            if not closing:
+                stack.append((tag, match.start(), match.group(3)))
+                continue
+            if not stack or stack[-1][0] != tag:
+                raise ValueError(f"unbalanced </{tag}> at offset {match.start()}")
+            
+            open_tag, start, attrs = stack.pop()
+            if stack:
+                continue
+            element_id = re.search(r'\bid=["\']([^"\']+)["\']', attrs)
+            counts[tag] = counts.get(tag, 0) + 1
+            if element_id:
+                name = f"{tag}#{element_id.group(1)}"
+            else:
+                name = tag if counts[tag] == 1 else f"{tag}:{counts[tag]}"
+            regions.append((name, start, match.end()))
+        
+        if stack:
+            raise ValueError(f"unclosed <{stack[-1][0]}>")
+        
+        if scripts:
+            regions.append(('script', scripts[-1].start(), scripts[-1].end()))
+        return regions
+    
+    @classmethod
+    def outline(cls, html):
+        """One line per region for the patch prompt"""
+        lines = []
+        for name, start, end in cls.split(html):
+            preview = re.sub(r'\s+', ' ', html[start:end])[:80]
+            lines.append(f"- {name} ({end - start} chars): {preview}")
+        return "\n".join(lines)
+    
+    @classmethod
+    def apply(cls, html, patch_text):
+        """Merge `<<<REGION name>>> ... <<<END>>>` blocks into the page (raises ValueError if unusable)"""
+        patches = cls.PATCH_PATTERN.findall(patch_text or '')
+        if not patches:
+            raise ValueError("response contains no region blocks")
+        
+        spans = {name: (start, end) for name, start, end in cls.split(html)}
+        edits = []
+        seen = set()
+        for order, (name, replacement) in enumerate(patches):
+            name = name.strip()
+            replacement = replacement.strip()
+            # A region replaced twice would be spliced with stale offsets: drop exact repeats, reject conflicts
+            if (name, replacement) in seen:
+                continue
+            if not name.startswith('after:') and any(name == patched for patched, _ in seen):
+                raise ValueError(f"region '{name}' is patched more than once")
+            seen.add((name, replacement))
+            if name.startswith('after:'):
+                target = name[len('after:'):].strip()
+                if target not in spans:
+                    raise ValueError(f"unknown region '{target}'")
+                position = spans[target][1]
+                edits.append((position, position, "\n" + replacement, order))
+            elif name in spans:
+                start, end = spans[name]
+                edits.append((start, end, replacement, order))
+            else:
+                raise ValueError(f"unknown region '{name}'")
+        
+        # Apply back to front so earlier offsets stay valid
+        for start, end, replacement, _ in sorted(edits, key=lambda edit: (edit[0], edit[3]), reverse=True):
+            html = html[:start] + replacement + html[end:]
+        return html
+
+class SectionStitcher:
+    """Assembles separately generated sections into one single-file page"""
+    PLACEHOLDER = "<!-- SECTION:{} -->"
+    SECTION_PATTERN = re.compile(r'<section\b.*</section>', re.IGNORECASE | re.DOTALL)
+    STYLE_BODY_PATTERN = re.compile(r'<style\b[^>]*>(.*?)</style>', re.IGNORECASE | re.DOTALL)
+    SCRIPT_BODY_PATTERN = re.compile(r'<script\b[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+    
+    # Words that do not tell sections apart ("Our Team" and "Our Services" must not both become "our")
+    SLUG_FILLER_WORDS = {'a', 'an', 'and', 'for', 'my', 'of', 'our', 'the', 'to', 'us', 'with', 'your'}
+    
+    @classmethod
+    def section_slug(cls, label, taken=()):
+        """'About Us' -> 'about', 'Services/Products' -> 'services-products'; a -2, -3... suffix avoids slugs in taken"""
+        words = re.findall(r'[a-z0-9]+', label.lower())
+        slug = '-'.join(word for word in words if word not in cls.SLUG_FILLER_WORDS) or '-'.join(words) or 'section'
+        unique, suffix = slug, 2
+        while unique in taken:
+            unique, suffix = f"{slug}-{suffix}", suffix + 1
+        return unique
+    
+    @classmethod
+    def parse_fragment(cls, fragment):
+        """Split a section response into (section markup, css, js)"""
+        scripts = cls.SCRIPT_BODY_PATTERN.findall(fragment)
+        styles = cls.STYLE_BODY_PATTERN.findall(fragment)
+        markup = cls.SCRIPT_BODY_PATTERN.sub('', cls.STYLE_BODY_PATTERN.sub('', fragment))
+        section = cls.SECTION_PATTERN.search(markup)
+        if not section:
+            raise ValueError("fragment has no <section> element")
+        return section.group(0), "\n".join(styles), "\n".join(scripts)
+    
+    @staticmethod
+    def css_rules(css):
+        """Split a stylesheet into top-level rule blocks (keeps @media blocks whole)"""
+        css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+        rules, depth, start = [], 0, 0
+        for index, char in enumerate(css):
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    rules.append(css[start:index + 1].strip())
+                    start = index + 1
+        return [rule for rule in rules if rule]
+    
+    @classmethod
+    def stitch(cls, skeleton, sections):
+        """Insert (slug, markup, css, js) sections into the skeleton with de-duplicated CSS and scripts"""
+        html = skeleton
+        skeleton_style = cls.STYLE_BODY_PATTERN.search(skeleton)
+        seen_rules = {re.sub(r'\s+', ' ', rule) for rule in cls.css_rules(skeleton_style.group(1) if skeleton_style else '')}
+        
+        extra_css, scripts, seen_scripts = [], [], set()
+        for slug, markup, css, js in sections:
+            placeholder = cls.PLACEHOLDER.format(slug)
+            if placeholder in html:
+                html = html.replace(placeholder, markup, 1)
+            else:
+                anchor = next((tag for tag in ('</main>', '<footer', '</body>') if tag in html), None)
+                if anchor is None:
+                    raise ValueError("skeleton has no insertion point for sections")
+                html = html.replace(anchor, f"{markup}\n{anchor}", 1)
+            
+            for rule in cls.css_rules(css):
+                normalized = re.sub(r'\s+', ' ', rule)
+                if normalized not in seen_rules:
+                    seen_rules.add(normalized)
+                    extra_css.append(rule)
+            
+            normalized_js = re.sub(r'\s+', ' ', js).strip()
+            if normalized_js and normalized_js not in seen_scripts:
+                seen_scripts.add(normalized_js)
+                # Each section's script gets its own scope so top-level names cannot collide
+                scripts.append(f"// {slug}\n(() => {{\n{js.strip()}\n}})();")
+        
+        html = re.sub(r'<!-- SECTION:[\w-]+ -->', '', html)
+        if extra_css:
+            css_block = "\n".join(extra_css)
+            if '</style>' in html:
+                html = html.replace('</style>', f"\n{css_block}\n</style>", 1)
+            else:
+                html = html.replace('</head>', f"<style>\n{css_block}\n</style>\n</head>", 1)
+        if scripts:
+            js_block = "\n".join(scripts)
+            script_tags = list(re.finditer(r'</script>', html, re.IGNORECASE))
+            if script_tags:
+                end = script_tags[-1].start()
+                html = f"{html[:end]}\n{js_block}\n{html[end:]}"
+            else:
+                html = html.replace('</body>', f"<script>\n{js_block}\n</script>\n</body>", 1)
+        return html
+
+class HTMLLintChecker(HTMLParser):
+    """Deterministic structural checks for generated single-file websites"""
+    
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                 'param', 'source', 'track', 'wbr'}
+    # Elements whose end tag may legally be omitted
+    OPTIONAL_END_TAGS = {'p', 'li', 'dt', 'dd', 'option', 'optgroup', 'tr', 'td', 'th',
+                         'thead', 'tbody', 'tfoot', 'colgroup', 'rp', 'rt'}
+    HEADING_TAGS = {'h1', 'h2', 'h3', 'h4'}
+    FORM_FIELD_TAGS = {'input', 'textarea', 'select'}
+    SCRIPT_TYPES = {'', 'text/javascript', 'module', 'application/javascript'}
+    MAX_FINDINGS = 12
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.findings = []
+        self.ids = set()
+        self.markers = []
+        self.anchors = []
+        self.forms = []
+        self.scripts = []
+        self._heading_text = None
+    
+    @classmethod
+    def check(cls, html, user_specs=None):
+        """Return (severity, message) findings, errors first (empty when the page is structurally sound)
+
+        "error" marks a page that is certainly broken (external files, truncated output, a requested
+        form missing); "warning" marks heuristic checks that can misfire on valid markup.
+        """
+        checker = cls()
+        checker.feed(html or '')
+        checker.close()
+        checker._finish(user_specs or {})
+        findings = sorted(checker.findings, key=lambda finding: finding[0] != "error")
+        return findings[:cls.MAX_FINDINGS]
+    
+    def _report(self, message, severity="warning"):
+        if (severity, message) not in self.findings:
+            self.findings.append((severity, message))
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: (value or '') for name, value in attrs}
+        
+        if attrs.get('id'):
+            self.ids.add(attrs['id'])
+            self.markers.append(attrs['id'])
+        if attrs.get('class'):
+            self.markers.append(attrs['class'])
+        
+        if tag == 'a' and attrs.get('href', '').startswith('#') and len(attrs['href']) > 1:
+            self.anchors.append(attrs['href'][1:])
+        elif tag == 'form':
+            self.forms.append({'attrs': attrs, 'fields': 0, 'submit': False})
+        elif tag in self.FORM_FIELD_TAGS or tag == 'button':
+            if self.forms and 'form' in self.stack:
+                form = self.forms[-1]
+                if tag in self.FORM_FIELD_TAGS and attrs.get('type') not in ('submit', 'hidden'):
+                    form['fields'] += 1
+                if attrs.get('type') == 'submit' or (tag == 'button' and attrs.get('type', 'submit') == 'submit'):
+                    form['submit'] = True
+        elif tag == 'link' and 'stylesheet' in attrs.get('rel', '').lower():
+            self._report(f"External stylesheet <link href=\"{attrs.get('href', '')}\"> - all CSS must be embedded in <style> in <head>", "error")
+        elif tag == 'style' and 'head' not in self.stack:
+            self._report("<style> block outside <head> - move all CSS into the <style> tag in <head>")
+        elif tag == 'script' and attrs.get('type', '').lower() in self.SCRIPT_TYPES:
+            if attrs.get('src'):
+                self._report(f"External script <script src=\"{attrs['src']}\"> - all JavaScript must be embedded", "error")
+            elif 'head' in self.stack:
+                self._report("<script> in <head> - place all JavaScript in one <script> tag before </body>")
+            self.scripts.append('')
+        
+        if tag in self.HEADING_TAGS:
+            self._heading_text = []
+        
+        if tag not in self.VOID_TAGS:
+            self.stack.append(tag)
+    
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in self.VOID_TAGS and self.stack and self.stack[-1] == tag:
+            self.stack.pop()
+    
+    def handle_endtag(self, tag):
+        if tag in self.VOID_TAGS:
+            return
+        if tag not in self.stack:
+            self._report(f"Stray closing tag </{tag}> without a matching <{tag}>")
+            return
+        
+        # Pop back to the matching start tag; anything skipped was left open
+        while self.stack:
+            open_tag = self.stack.pop()
+            if open_tag == tag:
+                break
+            if open_tag not in self.OPTIONAL_END_TAGS:
+                self._report(f"Unclosed <{open_tag}> inside <{tag}>")
+        
+        if tag in self.HEADING_TAGS and self._heading_text is not None:
+            self.markers.append(' '.join(self._heading_text))
+            self._heading_text = None
+    
+    def handle_data(self, data):
+        if self._heading_text is not None:
+            self._heading_text.append(data.strip())
+        if self.stack and self.stack[-1] == 'script' and self.scripts:
+            self.scripts[-1] += data
+    
+    def _finish(self, user_specs):
+        unclosed = [tag for tag in self.stack if tag not in self.OPTIONAL_END_TAGS]
+        if unclosed:
+            self._report(f"Document ends with unclosed tags: {', '.join('<' + tag + '>' for tag in unclosed)} (output may be truncated)", "error")
+        
+        for target in dict.fromkeys(self.anchors):
+            if target not in self.ids:
+                self._report(f"Navigation link href=\"#{target}\" points to a missing id")
+        
+        markers = ' '.join(self.markers).lower()
+        for section in user_specs.get('core_sections', []):
+            keywords = [word.rstrip('s') for word in re.findall(r'[a-z]+', section.lower()) if word != 'us']
+            if keywords and not any(keyword in markers for keyword in keywords):
+                self._report(f"Required section '{section}' not found (no matching id, class or heading)")
+        
+        script_text = ' '.join(self.scripts)
+        for form in self.forms:
+            if not form['fields']:
+                self._report("<form> has no input, textarea or select fields")
+            has_handler = form['attrs'].get('action') or form['attrs'].get('onsubmit') or 'submit' in script_text
+            if not (form['submit'] and has_handler):
+                self._report("<form> has no submit control or submit handler")
+        
+        wants_form = 'Contact Form' in user_specs.get('special_features', [])
+        if wants_form and not self.forms:
+            self._report("Contact form requested but the page has no <form>", "error")
+
 class QAAgent:
     """Enhanced QA Agent with LLM and memory"""
     
+    # Set to False to always call the LLM for this agent (bypass the response cache)
+    use_llm_cache = True
+    
     def __init__(self):
         self.memory = AgentMemory("QAAgent")
         self.memory.update_context("role", "Senior QA engineer and code reviewer")
+        # Consecutive reviews that lint warnings have failed (see _lint_gate)
+        self.lint_warning_rounds = 0
     
     def review_html_code(self, html_code, user_specs, design_output, content_output):
         """Comprehensive QA review of HTML code"""
         if not LLM_MODEL:
             return True, "Basic QA review passed"
         
-        # Get relevant context from memory
-        previous_reviews = self.memory.get_relevant_context("code_review")
-        context_summary = ""
-        if previous_reviews:
-            context_summary = f"\nPREVIOUS QA REVIEWS:\n{self._format_context(previous_reviews)}"
+        # Structural problems are found locally; the LLM only reviews pages that pass
+        if HTML_LINT_ENABLED:
+            verdict = self._lint_gate(html_code, user_specs)
+            if verdict:
+                return verdict
         
-        # Be more lenient on later iterations
-        iteration_guidance = ""
-        if len(previous_reviews) >= 2:
-            iteration_guidance = f"\nIMPORTANT: This is iteration {len(previous_reviews) + 1}. Focus on CRITICAL issues only. Accept code if it's functional and meets basic requirements. Avoid perfectionist standards - this is an MVP."
-        elif len(previous_reviews) >= 4:
-            iteration_guidance = f"\nCRITICAL: This is iteration {len(previous_reviews) + 1}/5. MUST PASS unless there are blocking errors. Focus only on functionality, not optimization."
+        prompt = self._review_prompt(html_code, user_specs, design_output, content_output)
+        try:
+            content = invoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="code_review")
+            return self._handle_review_response(content, prompt, html_code, user_specs)
+        except Exception as e:
+            print(f"[QAAgent] Review error: {e}")
+            return True, "QA review passed - basic functionality confirmed"
+    
+    async def areview_html_code(self, html_code, user_specs, design_output, content_output):
+        """Async variant of review_html_code (uses the LangChain ainvoke API)"""
+        if not LLM_MODEL:
+            return True, "Basic QA review passed"
         
-        prompt = f"""You are a senior QA engineer reviewing a SINGLE-FILE HTML website. This is an MVP - focus on essential functionality, not perfection.
+        # Structural problems are found locally; the LLM only reviews pages that pass
+        if HTML_LINT_ENABLED:
+            verdict = self._lint_gate(html_code, user_specs)
+            if verdict:
+                return verdict
+        
+        prompt = self._review_prompt(html_code, user_specs, design_output, content_output)
+        try:
+            content = await ainvoke_llm(prompt, self.memory.agent_name, use_cache=self.use_llm_cache, schema="code_review")
+            return await asyncio.to_thread(self._handle_review_response, content, prompt, html_code, user_specs)
+        except Exception as e:
+            print(f"[QAAgent] Review error: {e}")
+            return True, "QA review passed - basic functionality confirmed"
+    
+    REVIEW_PROMPT = PromptTemplate("QAAgent.code_review", """
+You are a senior QA engineer reviewing a SINGLE-FILE HTML website. This is an MVP - focus on essential functionality, not perfection.
 
 CRITICAL CONSTRAINTS:
 • SINGLE HTML FILE with embedded CSS and JavaScript ONLY
@@ -1329,21 +4685,6 @@ CRITICAL CONSTRAINTS:
 • MVP approach - functionality over perfection
 • Must be ready for immediate use
 
-HTML CODE TO REVIEW:
-{html_code[:2000]}...
-
-DESIGN REQUIREMENTS:
-{design_output}
-
-CONTENT REQUIREMENTS:
-{content_output}
-
-USER SPECIFICATIONS:
-• Business: {user_specs.get('business_name', 'Professional Business')}
-• Target Audience: {user_specs.get('target_audience', 'Business Professionals')}
-{context_summary}
-{iteration_guidance}
-
 MVP QA CHECKLIST (ESSENTIAL ONLY):
 1. BLOCKING ISSUES (Must Fix):
    - HTML syntax errors that break rendering
@@ -1366,72 +4707,117 @@ QA STANDARDS:
 
 OUTPUT FORMAT:
 ```json
-{{
+{
     "qa_passed": true/false,
     "overall_score": "percentage_score",
     "critical_issues": [
-        {{"description": "blocking_issue_description", "fix_suggestion": "how_to_fix"}}
+        {"description": "blocking_issue_description", "fix_suggestion": "how_to_fix"}
     ],
     "suggestions": [
-        {{"description": "nice_to_have_improvement"}}
+        {"description": "nice_to_have_improvement"}
     ],
     "feedback_for_html_agent": "Brief feedback focusing on critical fixes only, or approval message"
-}}
+}
 ```
 
-REMEMBER: Pass the code if it works and meets basic requirements. This is MVP development."""
-
-        try:
-            response = LLM_MODEL.invoke(prompt)
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            result = self._extract_json_from_response(content)
-            if result:
-                qa_passed = result.get('qa_passed', False)
-                feedback = result.get('feedback_for_html_agent', 'Issues found, please review')
-                
-                # Force pass on 4th+ iteration if no critical issues
-                if len(previous_reviews) >= 3 and not result.get('critical_issues'):
-                    qa_passed = True
-                    feedback = "Code approved for MVP deployment. Minor suggestions noted for future improvements."
-                
-                # Store in memory
-                self.memory.add_interaction(
-                    {"html_code": html_code[:500], "specs": user_specs}, 
-                    result, 
-                    "code_review"
-                )
-                
-                return qa_passed, feedback
-            else:
-                # Fallback to pass if we can't parse response
-                return True, "QA review completed - code approved for MVP"
-                
-        except Exception as e:
-            print(f"[QAAgent] Review error: {e}")
-            return True, "QA review passed - basic functionality confirmed"
+REMEMBER: Pass the code if it works and meets basic requirements. This is MVP development.""", (
+        ("DESIGN REQUIREMENTS", "design"),
+        ("CONTENT REQUIREMENTS", "content"),
+        ("USER SPECIFICATIONS", "specs"),
+        ("HTML CODE TO REVIEW", "html"),
+        ("PREVIOUS QA REVIEWS", "history"),
+        (None, "guidance"),
+    ))
     
-    def _extract_json_from_response(self, content):
-        """Extract JSON from LLM response"""
-        import json
-        import re
+    def _review_prompt(self, html_code, user_specs, design_output, content_output):
+        """Build the QA review prompt"""
+        # Get relevant context from memory
+        previous_reviews = self.memory.get_relevant_context("code_review", include_stored=False)
         
-        json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except:
-                pass
+        # Be more lenient on later iterations
+        iteration_guidance = None
+        if len(previous_reviews) >= 2:
+            iteration_guidance = f"IMPORTANT: This is iteration {len(previous_reviews) + 1}. Focus on CRITICAL issues only. Accept code if it's functional and meets basic requirements. Avoid perfectionist standards - this is an MVP."
+        elif len(previous_reviews) >= 4:
+            iteration_guidance = f"CRITICAL: This is iteration {len(previous_reviews) + 1}/5. MUST PASS unless there are blocking errors. Focus only on functionality, not optimization."
         
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(0))
-            except:
-                pass
+        context = PromptContext.compile("qa", design=design_output, content=content_output)
+        
+        return self.REVIEW_PROMPT.render(
+            design=context['design'],
+            content=context['content'],
+            specs=PromptTemplate.spec_lines(
+                user_specs,
+                ("Business", 'business_name', 'Professional Business'),
+                ("Target Audience", 'target_audience', 'Business Professionals'),
+            ),
+            html=f"{html_code[:2000]}...",
+            history=self._format_context(previous_reviews) if previous_reviews else None,
+            guidance=iteration_guidance
+        )
+    
+    def _handle_review_response(self, content, prompt, html_code, user_specs):
+        """Parse the QA verdict and record it in memory"""
+        previous_reviews = self.memory.get_relevant_context("code_review", include_stored=False)
+        
+        result = parse_agent_output(content, "code_review", self.memory.agent_name)
+        if result:
+            qa_passed = result.get('qa_passed', False)
+            feedback = result.get('feedback_for_html_agent') or 'Issues found, please review'
+        
+            # Force pass on 4th+ iteration if no critical issues
+            if len(previous_reviews) >= 3 and not result.get('critical_issues'):
+                qa_passed = True
+                feedback = "Code approved for MVP deployment. Minor suggestions noted for future improvements."
         
+            # Store in memory
+            self.memory.add_interaction(
+                {"html_code": html_code[:500], "specs": user_specs}, 
+                result, 
+                "code_review"
+            )
+        
+            return qa_passed, feedback
+        else:
+            forget_llm_response(prompt, self.memory.agent_name, "code_review")
+            # Fallback to pass if we can't parse response
+            return True, "QA review completed - code approved for MVP"
+    
+    def _lint_gate(self, html_code, user_specs):
+        """Failed-review verdict from the local lint checks, or None to continue with the LLM review
+
+        Errors always fail. Warnings fail the first LINT_WARNING_ROUNDS consecutive reviews they
+        appear in and are only logged after that, so one persistent false positive cannot use up
+        every QA cycle. Lint rounds are not stored as code_review memory (they are not LLM reviews).
+        """
+        findings = HTMLLintChecker.check(html_code, user_specs)
+        errors = [message for severity, message in findings if severity == "error"]
+        warnings = [message for severity, message in findings if severity != "error"]
+        
+        if not warnings:
+            self.lint_warning_rounds = 0
+        elif errors or self.lint_warning_rounds < LINT_WARNING_ROUNDS:
+            self.lint_warning_rounds += 1
+        else:
+            print(f"[QAAgent] Passing {len(warnings)} lint warning(s) on to the LLM review after "
+                  f"{self.lint_warning_rounds} rounds: {'; '.join(warnings)}")
+            warnings = []
+        
+        if errors or warnings:
+            return self._handle_lint_findings(errors, warnings)
         return None
     
+    def _handle_lint_findings(self, errors, warnings):
+        """Turn local lint findings into a failed review without calling the LLM"""
+        print(f"[QAAgent] Lint found {len(errors)} error(s), {len(warnings)} warning(s) - skipping LLM review")
+        
+        parts = []
+        if errors:
+            parts.append("STRUCTURAL ERRORS (automated check) - fix all of these:\n" + "\n".join(f"- {finding}" for finding in errors))
+        if warnings:
+            parts.append("STRUCTURAL WARNINGS (automated check) - fix these unless they are intended:\n" + "\n".join(f"- {finding}" for finding in warnings))
+        return False, "\n\n".join(parts)
+    
     def _format_context(self, context_list):
         """Format context for prompt inclusion"""
         formatted = []
@@ -1460,6 +4846,275 @@ class PackageAgent:
         
         return zip_path
 
+class JobQueue:
+    """Worker pool for website builds with a JSON status record per job"""
+    MAX_EVENTS = 200
+    
+    def __init__(self, job_dir, max_workers=2, retention_hours=24):
+        from concurrent.futures import ThreadPoolExecutor
+        self.job_dir = job_dir
+        self.retention_seconds = retention_hours * 3600
+        os.makedirs(job_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webweaver-job")
+        self._lock = threading.Lock()
+        # Futures of queued/running jobs only (each removes itself when done)
+        self._futures = {}
+        # Agent instances stay with their job so a reattaching session gets the same memories,
+        # until the result is collected (release) or the job files expire (sweep)
+        self.agents = {}
+        self.sweep()
+    
+    def _status_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.json")
+    
+    def preview_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.preview.html")
+    
+    def _write(self, record):
+        path = self._status_path(record['id'])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+    
+    def _update(self, job_id, event=None, **changes):
+        with self._lock:
+            record = self._read(job_id)
+            record.update(changes)
+            if event:
+                record['events'] = (record['events'] + [event])[-self.MAX_EVENTS:]
+            self._write(record)
+    
+    def _read(self, job_id):
+        with open(self._status_path(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def submit(self, kind, payload, workspace_path, agents, user_specs=None):
+        """Queue a "create" (payload = spec) or "modify" (payload = feedback) job and return its id"""
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._write({
+                'id': job_id,
+                'kind': kind,
+                'state': 'queued',
+                'payload': payload,
+                'workspace_path': workspace_path,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'success': None,
+                'message': None,
+                'events': []
+            })
+            self.agents[job_id] = agents
+            future = self._executor.submit(
+                self._run, job_id, kind, payload, workspace_path, agents, user_specs, current_llm_session()
+            )
+            self._futures[job_id] = future
+            # The record on disk holds the result; may run right here if the job already finished
+            future.add_done_callback(lambda _: self._futures.pop(job_id, None))
+        print(f"[JobQueue] Queued {kind} job {job_id}")
+        self.sweep()
+        return job_id
+    
+    def _run(self, job_id, kind, payload, workspace_path, agents, user_specs, session):
+        self._update(job_id, state='running', started_at=time.time())
+        
+        def sink(level, message):
+            self._update(job_id, event={'time': time.time(), 'level': level, 'message': message})
+        
+        def preview(html_content):
+            tmp_path = f"{self.preview_path(job_id)}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(html_content)
+            os.replace(tmp_path, self.preview_path(job_id))
+        
+        workflow = WorkflowManager()
+        try:
+            with progress_sink(sink), llm_session(session):
+                if kind == "create":
+                    success, message = HTMLAgent._create_website_workflow(payload, workspace_path, agents, workflow, preview)
+                else:
+                    success, message = HTMLAgent._modify_website_workflow(
+                        payload, workspace_path, agents, workflow, preview, user_specs=user_specs
+                    )
+        except Exception as e:
+            print(f"[JobQueue] Job {job_id} crashed: {e}")
+            success, message = False, f"Critical error: {str(e)}"
+        
+        self._update(job_id, state='succeeded' if success else 'failed', success=success, message=message,
+                     finished_at=time.time(), stage_timings=workflow.stage_timings, stop_log=workflow.stop_log,
+                     usage=workflow.usage.summary())
+        print(f"[JobQueue] Job {job_id} finished: {message}")
+    
+    def status(self, job_id):
+        """Current status record, or None for an unknown id"""
+        try:
+            with self._lock:
+                record = self._read(job_id)
+        except (OSError, ValueError):
+            return None
+        
+        # A record left running by a previous server process will never finish
+        if record['state'] in ('queued', 'running') and job_id not in self._futures:
+            record['state'] = 'interrupted'
+            record['success'] = False
+            record['message'] = "Build was interrupted (the server restarted) - please start it again"
+        return record
+    
+    def preview(self, job_id):
+        """Latest (partial) HTML the job has produced, if any"""
+        try:
+            with open(self.preview_path(job_id), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def release(self, job_id):
+        """Drop a finished job's agents once its session has collected the result"""
+        with self._lock:
+            if job_id not in self._futures:
+                self.agents.pop(job_id, None)
+    
+    def sweep(self):
+        """Delete status/preview files of jobs not touched for retention_seconds; returns the removed ids"""
+        cutoff = time.time() - self.retention_seconds
+        removed = set()
+        with self._lock:
+            try:
+                names = os.listdir(self.job_dir)
+            except OSError:
+                return removed
+            for name in names:
+                job_id = name.split('.', 1)[0]
+                path = os.path.join(self.job_dir, name)
+                try:
+                    if job_id in self._futures or os.path.getmtime(path) > cutoff:
+                        continue
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed.add(job_id)
+            for job_id in removed:
+                self.agents.pop(job_id, None)
+        if removed:
+            print(f"[JobQueue] Removed {len(removed)} expired job(s)")
+        return removed
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Get (and lazily create) the process-wide build job queue"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(JOB_DIR, max_workers=JOB_WORKERS, retention_hours=JOB_RETENTION_HOURS)
+    return _job_queue
+
+def make_preview_callback(placeholder, height=600):
+    """Build a callback that renders (partial) HTML into a Streamlit placeholder"""
+    def render(html_content):
+        with placeholder.container():
+            st.components.v1.html(html_content, height=height, scrolling=True)
+    # Bound to the session's script context so async/worker threads can update the preview
+    return bind_script_context(render)
+
+def get_session_agents():
+    """Agent instances for this session (created on first use)"""
+    if 'agent_instances' not in st.session_state:
+        st.session_state.agent_instances = {
+            'product_manager': ProductManagerAgent(),
+            'design_agent': DesignAgent(),
+            'content_agent': ContentAgent(),
+            'html_agent': HTMLAgent(),
+            'qa_agent': QAAgent()
+        }
+    return st.session_state.agent_instances
+
+def record_applied_change(feedback):
+    """Add an applied modification to the session's change history"""
+    import datetime
+    st.session_state.feedback_history.append(feedback)
+    
+    # Add timestamp for this change
+    timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+    if 'change_timestamps' not in st.session_state:
+        st.session_state.change_timestamps = []
+    st.session_state.change_timestamps.append(timestamp)
+    
+    st.session_state.reload_trigger += 1
+    st.session_state.feedback_counter = st.session_state.get('feedback_counter', 0) + 1
+
+def start_build_job(kind, payload):
+    """Queue a create/modify job for this session and remember its id (also in the URL for reattaching)"""
+    job_id = get_job_queue().submit(
+        kind, payload, st.session_state.workspace_path, get_session_agents(),
+        user_specs=dict(st.session_state.get('website_context', {}))
+    )
+    st.session_state.active_job = job_id
+    st.query_params["job"] = job_id
+    return job_id
+
+def attach_build_job():
+    """Return this session's active job, reattaching to the one in the URL after a browser refresh"""
+    job_id = st.session_state.get('active_job')
+    if job_id:
+        return job_id
+    
+    # The job id in the URL is the only access check: anyone holding it can reattach to that
+    # job's workspace and agents (ids are random 48-bit hex and expire with the job files)
+    job_id = st.query_params.get("job")
+    record = get_job_queue().status(job_id) if job_id else None
+    if not record:
+        return None
+    
+    st.session_state.active_job = job_id
+    st.session_state.workspace_path = record['workspace_path']
+    agents = get_job_queue().agents.get(job_id)
+    if agents:
+        st.session_state.agent_instances = agents
+    if os.path.exists(os.path.join(record['workspace_path'], 'index.html')):
+        st.session_state.development_started = True
+    print(f"[JobQueue] Session reattached to job {job_id}")
+    return job_id
+
+def finish_build_job(record):
+    """Apply a finished job's result to the session and stop tracking it"""
+    st.session_state.active_job = None
+    if "job" in st.query_params:
+        del st.query_params["job"]
+    if record.get('id'):
+        get_job_queue().release(record['id'])
+    
+    if record['success']:
+        st.session_state.development_started = True
+        if record['kind'] == "modify":
+            record_applied_change(record['payload'])
+    elif record['kind'] == "create":
+        st.error(f"Failed to create website: {record['message'] or 'build was interrupted'}")
+    else:
+        st.error(record['message'] or "❌ Modification was interrupted")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_build_job(job_id):
+    """Poll a background job and show its progress; reruns the page once it finishes"""
+    queue = get_job_queue()
+    record = queue.status(job_id)
+    if record is None or record['state'] not in ('queued', 'running'):
+        st.rerun()
+    
+    elapsed = time.time() - (record['started_at'] or record['created_at'])
+    action = "Building website" if record['kind'] == "create" else "Applying changes"
+    st.markdown(f"**⏳ {action}** · job `{job_id}` · {record['state']} · {elapsed:.0f}s")
+    
+    for event in record['events'][-4:]:
+        getattr(st, event['level'])(event['message'])
+    
+    partial_html = queue.preview(job_id)
+    if partial_html:
+        st.components.v1.html(partial_html, height=600, scrolling=True)
+
 def initialize_session():
     """Initialize session state variables"""
     if 'workspace_path' not in st.session_state:
@@ -1514,6 +5169,12 @@ def main():
             LLM_MODEL, LLM_NAME = get_available_llm()
             _llm_initialized = True
             print(f"LLM initialized: {LLM_NAME}")
+            if _openai_backend():
+                for key, route in MODEL_ROUTES.items():
+                    print(f"[ModelRouter] Route {key}: {route}")
+            for name, template in PROMPT_TEMPLATES.items():
+                print(f"[PromptTemplate] {name}: static prefix ~{count_tokens(template.system)} tokens "
+                      f"({template.prefix_hash})")
         except Exception as e:
             LLM_MODEL, LLM_NAME = None, "LLM Failed"
             _llm_initialized = True
@@ -1536,12 +5197,25 @@ def main():
             ```
             """)
     
+    # Background build in progress (or finished since the last rerun)
+    active_job = attach_build_job() if BACKGROUND_JOBS_ENABLED else None
+    if active_job:
+        record = get_job_queue().status(active_job)
+        if record and record['state'] in ('queued', 'running'):
+            show_build_job(active_job)
+        else:
+            finish_build_job(record or {'success': False, 'kind': 'create', 'message': 'Build job not found'})
+            active_job = None
+    
+    # Main-area slot for streaming the first build while the sidebar workflow runs
+    build_preview = st.empty()
+    
     # Sidebar - SpecAgent
     with st.sidebar:
         spec = SpecAgent.collect_specs()
         
         # Start Development Button
-        if st.button("🚀 Start Development", type="primary", use_container_width=True):
+        if st.button("🚀 Start Development", type="primary", use_container_width=True, disabled=bool(active_job)):
             if not spec.get('business_name') or not spec.get('industry_focus'):
                 st.error("⚠️ Please complete the required fields: Business Name and Industry Focus")
             else:
@@ -1558,8 +5232,15 @@ def main():
                     }
                 })
                 
+                if BACKGROUND_JOBS_ENABLED:
+                    start_build_job("create", spec)
+                    st.rerun()
+                
                 # Generate files
-                success, message = HTMLAgent.generate_website(spec, st.session_state.workspace_path)
+                success, message = HTMLAgent.generate_website(
+                    spec, st.session_state.workspace_path,
+                    preview=make_preview_callback(build_preview)
+                )
                 
                 if success:
                     st.session_state.development_started = True
@@ -1587,6 +5268,7 @@ def main():
     # Main content area
     if st.session_state.development_started:
         col1, col2 = st.columns([3, 1])
+        live_preview = None
         
         with col1:
             st.subheader("🔍 Live Preview")
@@ -1599,8 +5281,10 @@ def main():
                     with open(html_path, 'r', encoding='utf-8') as f:
                         html_content = f.read()
                     
-                    # Display HTML content directly in Streamlit
-                    st.components.v1.html(html_content, height=600, scrolling=True)
+                    # Display HTML content directly in Streamlit (slot is reused for streamed edits)
+                    live_preview = st.empty()
+                    with live_preview.container():
+                        st.components.v1.html(html_content, height=600, scrolling=True)
                 except Exception as e:
                     st.error(f"Error loading preview: {e}")
                     st.info("Please try regenerating the website.")
@@ -1638,25 +5322,19 @@ def main():
                 key=feedback_key
             )
             
-            if st.button("🚀 Apply Changes", type="primary", use_container_width=True):
-                if feedback.strip():
+            if st.button("🚀 Apply Changes", type="primary", use_container_width=True, disabled=bool(active_job)):
+                if feedback.strip() and BACKGROUND_JOBS_ENABLED:
+                    start_build_job("modify", feedback)
+                    st.rerun()
+                elif feedback.strip():
                     success, message = HTMLAgent.modify_website(
-                        feedback, st.session_state.workspace_path
+                        feedback, st.session_state.workspace_path,
+                        preview=make_preview_callback(live_preview) if live_preview else None
                     )
                     
                     if success:
                         st.success("✅ Updated")
-                        st.session_state.feedback_history.append(feedback)
-                        
-                        # Add timestamp for this change
-                        import datetime
-                        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-                        if 'change_timestamps' not in st.session_state:
-                            st.session_state.change_timestamps = []
-                        st.session_state.change_timestamps.append(timestamp)
-                        
-                        st.session_state.reload_trigger += 1
-                        st.session_state.feedback_counter = st.session_state.get('feedback_counter', 0) + 1
+                        record_applied_change(feedback)
                         st.rerun()
                     else:
                         st.error(message)
@@ -1691,8 +5369,62 @@ def main():
                             else:
                                 st.markdown("💤")
                                 st.caption("Low")
-                        
+
                         st.markdown("---")
+
+                    # LLM response cache counters (process-wide)
+                    cache = get_llm_cache()
+                    if cache:
+                        try:
+                            stats = cache.stats()
+                            st.caption(
+                                f"🗄️ **LLM Cache**: {stats['hits']} hits / {stats['misses']} misses "
+                                f"({stats['hit_rate']:.0%}), {stats['entries']} entries"
+                            )
+                        except sqlite3.Error as e:
+                            st.caption(f"🗄️ **LLM Cache**: unavailable ({e})")
+                    
+                    session_usage = get_session_usage().summary()
+                    if session_usage['calls']:
+                        st.caption(
+                            f"🪙 **Tokens (this session)**: {session_usage['input_tokens']:,} in "
+                            f"({session_usage['cached_input_tokens']:,} from prompt cache) / "
+                            f"{session_usage['output_tokens']:,} out, ≈${session_usage['cost_usd']:.4f} "
+                            f"over {session_usage['calls']} calls"
+                        )
+                        st.caption(" · ".join(
+                            f"{name}: {agent['input_tokens'] + agent['output_tokens']:,} (${agent['cost']:.4f})"
+                            for name, agent in session_usage['by_agent'].items()
+                        ))
+                    
+                    scheduler_stats = get_llm_scheduler().stats()
+                    st.caption(
+                        f"🚦 **LLM Scheduler**: {scheduler_stats['in_flight']}/{scheduler_stats['max_in_flight']} in flight, "
+                        f"{scheduler_stats['queued']} queued ({scheduler_stats['sessions_waiting']} sessions), "
+                        f"{scheduler_stats['retries']} rate-limit retries"
+                    )
+                    
+                    flight_stats = _single_flight.stats()
+                    if flight_stats['coalesced']:
+                        st.caption(
+                            f"🔗 **Single-Flight**: {flight_stats['coalesced']} duplicate calls shared "
+                            f"{flight_stats['leaders']} requests"
+                        )
+                    
+                    if HEDGE_STATS:
+                        st.caption(
+                            f"⏱️ **Hedged Requests**: {HEDGE_STATS['hedged']} sent, "
+                            f"{HEDGE_STATS['hedge_won']} finished first, "
+                            f"{HEDGE_STATS['hedge_skipped']} skipped while saturated, "
+                            f"{HEDGE_STATS['deadline_fallback']} retried after a missed deadline"
+                        )
+                    
+                    if JSON_EXTRACT_STATS:
+                        st.caption(
+                            f"🧩 **JSON Parsing**: {JSON_EXTRACT_STATS['direct']} direct / "
+                            f"{JSON_EXTRACT_STATS['repaired']} repaired / {JSON_EXTRACT_STATS['failed']} failed / "
+                            f"{JSON_EXTRACT_STATS['invalid']} off-schema"
+                        )
             
             # Enhanced recent changes display
             if st.session_state.get('feedback_history'):
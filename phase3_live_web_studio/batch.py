@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Headless batch generator for WebWeaver sites
+
+Reads a JSONL file with one spec per line (same keys as SpecAgent.collect_specs) and runs
+the website creation workflow for each spec on a process pool:
+
+    python batch.py specs.jsonl --out out --processes 4
+    WEBWEAVER_LLM_MODE=replay python batch.py specs.jsonl --processes 8 --max-concurrent 4
+
+Each site is written to out/<slug>/index.html and a per-site summary to out/summary.json.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import app
+from app import (
+    ProductManagerAgent, DesignAgent, ContentAgent, HTMLAgent, QAAgent,
+    WorkflowManager, get_available_llm, progress_sink
+)
+
+def slugify(text, index):
+    """Directory name for a spec: business name slug plus its line number"""
+    slug = re.sub(r'[^a-z0-9]+', '-', (text or 'site').lower()).strip('-')[:40] or 'site'
+    return f"{index:04d}-{slug}"
+
+def load_specs(path):
+    """Read specs from a JSONL file, skipping blank lines"""
+    specs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                specs.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Skipping line {line_number}: {e}")
+    return specs
+
+def init_worker(use_cache, quiet):
+    """Set up the LLM once per worker process"""
+    llm, name = get_available_llm()
+    app.LLM_MODEL = llm
+    app.LLM_NAME = name
+    app.LLM_CACHE_ENABLED = use_cache
+    # Each site is built from its own spec; other sites' saved memory stays out unless asked for
+    if "WEBWEAVER_MEMORY_STORE" not in os.environ:
+        app.MEMORY_STORE_ENABLED = False
+    # Live preview and streaming are UI features
+    app.STREAM_PREVIEW_ENABLED = False
+    app.BACKGROUND_JOBS_ENABLED = False
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+
+def build_site(index, spec, out_dir, quiet):
+    """Run the create workflow for one spec (executes in a worker process)"""
+    slug = slugify(spec.get('business_name'), index)
+    workspace = os.path.join(out_dir, slug)
+    os.makedirs(workspace, exist_ok=True)
+
+    spec.setdefault('site_title', spec.get('business_name', 'Website'))
+    spec.setdefault('sections', spec.get('core_sections') or ['hero', 'about', 'contact'])
+
+    agents = {
+        'product_manager': ProductManagerAgent(),
+        'design_agent': DesignAgent(),
+        'content_agent': ContentAgent(),
+        'html_agent': HTMLAgent(),
+        'qa_agent': QAAgent()
+    }
+    workflow = WorkflowManager()
+
+    def report(level, message):
+        if not quiet:
+            print(f"[{slug}] {message}", flush=True)
+
+    start = time.perf_counter()
+    try:
+        with progress_sink(report):
+            success, message = HTMLAgent._create_website_workflow(spec, workspace, agents, workflow)
+    except Exception as e:
+        success, message = False, f"Critical error: {str(e)}"
+    elapsed = time.perf_counter() - start
+
+    usage = workflow.usage.summary()
+    html_path = os.path.join(workspace, 'index.html')
+
+    return {
+        'slug': slug,
+        'business_name': spec.get('business_name'),
+        'success': success,
+        'message': message,
+        'seconds': round(elapsed, 2),
+        'cycles': workflow.total_cycles,
+        'stop_reasons': [entry['reason'] for entry in workflow.stop_log],
+        'llm_calls': usage['calls'],
+        'input_tokens': usage['input_tokens'],
+        'output_tokens': usage['output_tokens'],
+        'estimated_cost_usd': round(usage['cost_usd'], 4),
+        'html_bytes': os.path.getsize(html_path) if os.path.exists(html_path) else 0
+    }
+
+def run_batch(specs, out_dir, processes, max_concurrent, use_cache=True, quiet=False):
+    """Build every spec with at most max_concurrent sites in flight; returns the per-site results"""
+    os.makedirs(out_dir, exist_ok=True)
+    results = []
+    pending = set()
+    queue = list(enumerate(specs, 1))
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker, initargs=(use_cache, quiet)) as pool:
+        while queue or pending:
+            while queue and len(pending) < max_concurrent:
+                index, spec = queue.pop(0)
+                pending.add(pool.submit(build_site, index, spec, out_dir, quiet))
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results.append(result)
+                print(f"{'✅' if result['success'] else '❌'} {result['slug']} "
+                      f"({result['seconds']:.1f}s, {result['llm_calls']} LLM calls, "
+                      f"~${result['estimated_cost_usd']:.4f}) [{len(results)}/{len(specs)}]", flush=True)
+
+    return sorted(results, key=lambda result: result['slug'])
+
+def print_summary(results, wall_time):
+    """Per-site table plus totals"""
+    print("\n" + "=" * 96)
+    print(f"{'Site':<40} {'Status':<8} {'Time':>8} {'Cycles':>7} {'Calls':>6} {'Tokens in/out':>15} {'Cost':>9}")
+    print("-" * 96)
+    for result in results:
+        tokens = f"{result['input_tokens']}/{result['output_tokens']}"
+        print(f"{result['slug']:<40} {'ok' if result['success'] else 'FAILED':<8} {result['seconds']:>7.1f}s "
+              f"{result['cycles']:>7} {result['llm_calls']:>6} {tokens:>15} ${result['estimated_cost_usd']:>8.4f}")
+    print("-" * 96)
+
+    succeeded = sum(1 for result in results if result['success'])
+    total_cost = sum(result['estimated_cost_usd'] for result in results)
+    site_seconds = sum(result['seconds'] for result in results)
+    print(f"{succeeded}/{len(results)} sites built in {wall_time:.1f}s wall time "
+          f"({site_seconds:.1f}s of site time), estimated cost ${total_cost:.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate many WebWeaver sites from a JSONL spec file")
+    parser.add_argument('specs', help="JSONL file, one SpecAgent-style spec per line")
+    parser.add_argument('--out', default='out', help="Output directory (one folder per site)")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2, help="Worker processes")
+    parser.add_argument('--max-concurrent', type=int, default=None,
+                        help="Maximum sites in flight (defaults to --processes)")
+    parser.add_argument('--limit', type=int, default=None, help="Only build the first N specs")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the LLM response cache")
+    parser.add_argument('--quiet', action='store_true', help="Only print per-site results and the summary")
+    args = parser.parse_args()
+
+    specs = load_specs(args.specs)[:args.limit]
+    if not specs:
+        print("❌ No specs found")
+        return 1
+
+    processes = max(1, min(args.processes, len(specs)))
+    max_concurrent = max(1, args.max_concurrent or processes)
+    print(f"🕸️ WebWeaver batch: {len(specs)} sites, {processes} processes, {max_concurrent} in flight")
+
+    start = time.perf_counter()
+    results = run_batch(specs, args.out, processes, max_concurrent,
+                        use_cache=not args.no_cache, quiet=args.quiet)
+    wall_time = time.perf_counter() - start
+
+    print_summary(results, wall_time)
+    summary_path = os.path.join(args.out, 'summary.json')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump({'wall_seconds': round(wall_time, 2), 'sites': results}, f, indent=2)
+    print(f"📄 Summary written to {summary_path}")
+
+    return 0 if all(result['success'] for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
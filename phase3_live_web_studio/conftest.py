@@ -0,0 +1,8 @@
+"""Keep the test run away from the user's ~/.webweaver stores (set before app is imported)"""
+import os
+import tempfile
+
+_store_dir = tempfile.mkdtemp(prefix="webweaver_test_")
+os.environ.setdefault("WEBWEAVER_MEMORY_STORE_PATH", os.path.join(_store_dir, "agent_memory.sqlite3"))
+os.environ.setdefault("WEBWEAVER_LLM_CACHE_PATH", os.path.join(_store_dir, "llm_cache.sqlite3"))
+os.environ.setdefault("WEBWEAVER_JOB_DIR", os.path.join(_store_dir, "jobs"))
@@ -1,74 +1,115 @@
 #!/usr/bin/env python3
 """
 Demo script to test WebWeaver components independently
+
+Runs the full website creation workflow without the Streamlit UI. Combine with the
+offline record/replay LLM to benchmark orchestration without network access:
+
+    WEBWEAVER_LLM_MODE=record python demo.py            # live calls, saved to llm_fixtures.jsonl
+    WEBWEAVER_LLM_MODE=replay python demo.py --runs 5   # replays fixtures, no API key needed
 """
 
+import argparse
 import tempfile
 import os
 import shutil
-from app import SpecAgent, CodeAgent, FeedbackAgent, PackageAgent
+import statistics
+import time
+
+import app
+from app import (
+    ProductManagerAgent, DesignAgent, ContentAgent, HTMLAgent, QAAgent,
+    PackageAgent, WorkflowManager, get_available_llm
+)
 
 print("🕸️ WebWeaver Demo")
 print("Build websites in minutes with AI-powered agents")
 print("=" * 60)
 
-def demo_agents():
-    """Test all agents independently"""
-    # Create temporary workspace
-    workspace = tempfile.mkdtemp(prefix='webweaver_demo_')
-    print(f"\n📁 Created workspace: {workspace}")
-    
-    # Demo SpecAgent
-    print("\n🧙‍♂️ SpecAgent Demo")
-    spec = {
-        'site_title': 'Demo Website',
-        'needs_nav': True,
-        'primary_color': '#3498db',
-        'sections': ['header', 'hero', 'features', 'contact form']
+DEMO_SPEC = {
+    'purpose': 'Technology/Software',
+    'business_name': 'Demo Website',
+    'industry_focus': 'Cloud cost optimization for mid-size SaaS companies',
+    'target_audience': 'CTOs and engineering managers',
+    'design_style': 'Modern & Minimalist',
+    'color_scheme': 'Blue Professional',
+    'primary_color': '#2c3e50',
+    'core_sections': ['Hero/Welcome', 'About Us', 'Services/Products', 'Contact'],
+    'special_features': ['Contact Form'],
+    'key_messages': 'Cut cloud bills by 30% in 90 days',
+    'unique_selling_points': 'Only pay for savings we deliver',
+    'site_title': 'Demo Website',
+    'needs_nav': True,
+    'sections': ['Hero/Welcome', 'About Us', 'Services/Products', 'Contact']
+}
+
+def create_agents():
+    """Fresh agents per run so prompts (and replayed fixtures) are identical across runs"""
+    return {
+        'product_manager': ProductManagerAgent(),
+        'design_agent': DesignAgent(),
+        'content_agent': ContentAgent(),
+        'html_agent': HTMLAgent(),
+        'qa_agent': QAAgent()
     }
-    print(f"Spec: {spec}")
-    
-    # Demo CodeAgent
-    print("\n🛠️ CodeAgent Demo")
-    CodeAgent.generate_files(spec, workspace)
-    
-    # Check generated files
+
+def demo_agents(runs=1, use_cache=False):
+    """Run the creation workflow end to end and report timings"""
+    app.LLM_MODEL, app.LLM_NAME = get_available_llm()
+    app.LLM_CACHE_ENABLED = use_cache
+    # Repeated runs must see the same prompts, so earlier runs' saved memory stays out unless asked for
+    if "WEBWEAVER_MEMORY_STORE" not in os.environ:
+        app.MEMORY_STORE_ENABLED = False
+    print(f"\n🤖 LLM: {app.LLM_NAME}")
+
+    timings = []
+    workspace = None
+    success = False
+    for run in range(1, runs + 1):
+        if workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+        workspace = tempfile.mkdtemp(prefix='webweaver_demo_')
+        print(f"\n🛠️ Run {run}/{runs} - workspace: {workspace}")
+
+        start = time.perf_counter()
+        success, message = HTMLAgent._create_website_workflow(
+            DEMO_SPEC, workspace, create_agents(), WorkflowManager()
+        )
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        print(f"{'✅' if success else '❌'} {message} ({elapsed:.2f}s)")
+
+        if not success:
+            break
+
     html_file = os.path.join(workspace, 'index.html')
-    css_file = os.path.join(workspace, 'styles.css')
-    
-    if os.path.exists(html_file) and os.path.exists(css_file):
-        print("✅ Files generated successfully!")
-        with open(html_file, 'r') as f:
-            html_size = len(f.read())
-        with open(css_file, 'r') as f:
-            css_size = len(f.read())
-        print(f"📄 HTML file size: {html_size} characters")
-        print(f"🎨 CSS file size: {css_size} characters")
+    if os.path.exists(html_file):
+        with open(html_file, 'r', encoding='utf-8') as f:
+            print(f"📄 HTML file size: {len(f.read())} characters")
+
+        # Demo PackageAgent
+        print("\n📦 PackageAgent Demo")
+        zip_path = PackageAgent.create_zip(workspace)
+        print(f"✅ ZIP created: {zip_path} ({os.path.getsize(zip_path)} bytes)")
     else:
         print("❌ File generation failed")
-        return
-    
-    # Demo FeedbackAgent
-    print("\n🎨 FeedbackAgent Demo")
-    feedback = "Make header background blue"
-    print(f"Feedback: '{feedback}'")
-    result = FeedbackAgent.parse_and_apply_feedback(feedback, workspace)
-    print(f"Result: {result}")
-    
-    # Demo PackageAgent
-    print("\n📦 PackageAgent Demo")
-    zip_path = PackageAgent.create_zip(workspace)
-    if zip_path and os.path.exists(zip_path):
-        print(f"✅ ZIP created: {zip_path}")
-        zip_size = os.path.getsize(zip_path)
-        print(f"📦 ZIP size: {zip_size} bytes")
-    else:
-        print("❌ ZIP creation failed")
-    
+
+    if len(timings) > 1:
+        print(f"\n⏱️ Workflow time over {len(timings)} runs: "
+              f"min {min(timings):.2f}s / median {statistics.median(timings):.2f}s / max {max(timings):.2f}s")
+
     print(f"\n🧹 Cleaning up workspace: {workspace}")
     shutil.rmtree(workspace, ignore_errors=True)
-    
-    print("\n✨ Demo completed successfully!")
+
+    if success:
+        print("\n✨ Demo completed successfully!")
+    else:
+        print("\n⚠️ Demo finished with errors (in replay mode, check the fixture file matches this spec)")
 
 if __name__ == "__main__":
-    demo_agents() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the WebWeaver workflow without the UI")
+    parser.add_argument('--runs', type=int, default=1, help="Number of end-to-end runs to time")
+    parser.add_argument('--cache', action='store_true', help="Keep the LLM response cache enabled")
+    args = parser.parse_args()
+
+    demo_agents(runs=args.runs, use_cache=args.cache)
@@ -0,0 +1,48 @@
+"""Regression checks for ConvergenceTracker (run with: python -m pytest -q)"""
+from app import ConvergenceTracker
+
+
+def make_page(heading_color="#2c3e50"):
+    """~12k-character single-file page with a large embedded stylesheet and script"""
+    rules = "\n".join(
+        f".block-{i} {{ padding: {i % 7}px; margin: {i % 5}px auto; border-radius: 4px; }}" for i in range(150)
+    )
+    sections = "\n".join(f'<section id="s{i}" class="block-{i}"><h2>Section {i}</h2><p>Text {i}</p></section>' for i in range(40))
+    script = "\n".join(f"document.getElementById('s{i}').dataset.ready = 'yes';" for i in range(40))
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Test</title>
+    <style>
+        h2 {{ color: {heading_color}; font-size: 2rem; }}
+{rules}
+    </style>
+</head>
+<body>
+{sections}
+    <script>
+{script}
+    </script>
+</body>
+</html>"""
+
+
+def test_css_only_fix_counts_as_progress():
+    tracker = ConvergenceTracker()
+    assert len(make_page()) > 10000
+    assert tracker.observe_html(make_page()) is None
+    assert tracker.observe_html(make_page(heading_color="#c0392b")) is None
+
+
+def test_identical_candidate_stalls():
+    tracker = ConvergenceTracker()
+    tracker.observe_html(make_page())
+    reason = tracker.observe_html(make_page().replace("\n", "\n  "))
+    assert reason and reason.startswith("no progress")
+
+
+def test_embedded_blocks_are_split_into_rules():
+    tokens = ConvergenceTracker._html_tokens(make_page())
+    assert "h2 {" in tokens
+    assert "color: #2c3e50;" in tokens
@@ -0,0 +1,28 @@
+"""Per-agent deadline fallback (run with: python -m pytest -q)"""
+import asyncio
+
+import app
+
+
+class SlowOnceLLM:
+    model_name = "fake"
+    temperature = 0
+    
+    def __init__(self):
+        self.calls = 0
+    
+    async def ainvoke(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.5 if self.calls == 1 else 0)
+        return app.ReplayMessage(f"answer {self.calls}")
+
+
+def test_missed_deadline_falls_back_to_a_plain_call(monkeypatch):
+    llm = SlowOnceLLM()
+    monkeypatch.setattr(app, "LLM_MODEL", llm)
+    monkeypatch.setattr(app, "LLM_TIMEOUTS", {"TestAgent": 0.1})
+    monkeypatch.setattr(app, "HEDGE_AGENTS", set())
+    
+    assert asyncio.run(app.ainvoke_llm("hello", "TestAgent", use_cache=False)) == "answer 2"
+    assert llm.calls == 2
+
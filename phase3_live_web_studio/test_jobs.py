@@ -0,0 +1,42 @@
+"""Regression checks for JobQueue cleanup (run with: python -m pytest -q)"""
+import os
+import time
+
+from app import JobQueue
+
+
+def test_sweep_removes_expired_job_files_and_agents(tmp_path):
+    queue = JobQueue(str(tmp_path), max_workers=1, retention_hours=1)
+    old, fresh = "a" * 12, "b" * 12
+    for job_id in (old, fresh):
+        queue._write({'id': job_id, 'state': 'succeeded'})
+        with open(queue.preview_path(job_id), 'w') as f:
+            f.write("<html></html>")
+        queue.agents[job_id] = object()
+    stale = time.time() - 2 * 3600
+    for name in (f"{old}.json", f"{old}.preview.html"):
+        os.utime(tmp_path / name, (stale, stale))
+    
+    assert queue.sweep() == {old}
+    assert sorted(os.listdir(tmp_path)) == [f"{fresh}.json", f"{fresh}.preview.html"]
+    assert list(queue.agents) == [fresh]
+
+
+def test_release_keeps_agents_of_running_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path), max_workers=1)
+    queue.agents.update({"done": object(), "running": object()})
+    queue._futures["running"] = object()
+    
+    queue.release("done")
+    queue.release("running")
+    assert list(queue.agents) == ["running"]
+
+
+def test_orphaned_job_reports_why_it_stopped(tmp_path):
+    queue = JobQueue(str(tmp_path), max_workers=1)
+    queue._write({'id': "c" * 12, 'kind': 'create', 'state': 'running', 'success': None, 'message': None})
+    
+    record = queue.status("c" * 12)
+    assert record['state'] == 'interrupted'
+    assert record['success'] is False
+    assert "interrupted" in record['message']
@@ -0,0 +1,32 @@
+"""Severity handling of the structural lint gate (run with: python -m pytest -q)"""
+import app
+from app import HTMLLintChecker, QAAgent
+
+SPECS = {'core_sections': ['Hero', 'Testimonials']}
+# Valid page the section heuristic misreads: the testimonials block is labelled "Reviews"
+PAGE = """<!DOCTYPE html><html><head><style>body{margin:0}</style></head>
+<body><section id="hero"><h1>Welcome</h1></section><section id="reviews"><h2>Reviews</h2></section>
+<script>document.body.dataset.ready = '1';</script></body></html>"""
+
+
+def test_findings_carry_a_severity():
+    findings = HTMLLintChecker.check(PAGE.replace("<head>", '<head><link rel="stylesheet" href="site.css">'), SPECS)
+    assert findings[0] == ("error", 'External stylesheet <link href="site.css"> - all CSS must be embedded in <style> in <head>')
+    assert ("warning", "Required section 'Testimonials' not found (no matching id, class or heading)") in findings
+
+
+def test_persistent_warning_stops_blocking(monkeypatch):
+    monkeypatch.setattr(app, "LINT_WARNING_ROUNDS", 2)
+    qa = QAAgent()
+    assert qa._lint_gate(PAGE, SPECS)[0] is False
+    assert qa._lint_gate(PAGE, SPECS)[0] is False
+    assert qa._lint_gate(PAGE, SPECS) is None
+    # Lint rounds do not count as LLM reviews for the iteration leniency
+    assert qa.memory.get_relevant_context("code_review", include_stored=False) == []
+
+
+def test_errors_always_block(monkeypatch):
+    monkeypatch.setattr(app, "LINT_WARNING_ROUNDS", 0)
+    truncated = PAGE.split("<script>")[0]
+    verdict = QAAgent()._lint_gate(truncated, {})
+    assert verdict[0] is False and "STRUCTURAL ERRORS" in verdict[1]
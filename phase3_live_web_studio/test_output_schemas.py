@@ -0,0 +1,47 @@
+"""Checks that realistic agent answers pass the structured-output models (run with: python -m pytest -q)"""
+import json
+
+import pytest
+
+from app import OUTPUT_SCHEMAS, parse_agent_output
+
+pytestmark = pytest.mark.skipif(not OUTPUT_SCHEMAS, reason="pydantic not installed")
+
+
+def test_rich_design_answer_validates():
+    design = {
+        "design_strategy": {"visual_concept": "calm", "design_principles": ["clarity"]},
+        "visual_system": {
+            "color_palette": {"primary": "#2c3e50"},
+            "typography": {"headings": "Inter", "scale": 1.25},
+            "layout": {"breakpoints": ["640px", "1024px"]},
+            "components": {"buttons": {"radius": "8px", "style": "solid"}},
+        },
+        "sections_design": {"hero": {"layout": "split", "image": "right"}},
+        "content_agent_prompt": "Write calm copy",
+    }
+    assert parse_agent_output(json.dumps(design), "design_system")["sections_design"]["hero"]["layout"] == "split"
+
+
+def test_metric_objects_validate():
+    analysis = {
+        "analysis": {"business_type": "SaaS", "success_metrics": [{"metric": "signups", "target": 100}]},
+        "enhanced_requirements": {"primary_objectives": ["Convert visitors"]},
+        "design_agent_prompt": "Design a clean site",
+    }
+    assert parse_agent_output(json.dumps(analysis), "requirements_analysis")["analysis"]["success_metrics"][0]["target"] == 100
+
+
+def test_nested_mismatch_keeps_the_answer_but_missing_workflow_fields_do_not():
+    design = {
+        "design_strategy": "calm and minimal",
+        "visual_system": {"color_palette": {"primary": "#2c3e50"}, "typography": ["Inter"]},
+        "content_agent_prompt": "Write calm copy",
+    }
+    assert parse_agent_output(json.dumps(design), "design_system") is None
+    
+    design["design_strategy"] = {"visual_concept": "calm"}
+    assert parse_agent_output(json.dumps(design), "design_system")["visual_system"]["typography"] == ["Inter"]
+    
+    del design["content_agent_prompt"]
+    assert parse_agent_output(json.dumps(design), "design_system") is None
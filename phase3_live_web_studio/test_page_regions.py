@@ -0,0 +1,35 @@
+"""Region patch merging (run with: python -m pytest -q)"""
+import pytest
+
+from app import PageRegions
+
+PAGE = """<!DOCTYPE html><html><head><style>body{margin:0}</style></head><body>
+<header><h1>Alder</h1></header>
+<section id="about"><p>About us</p></section>
+<footer>(c) Alder</footer>
+</body></html>"""
+
+
+def block(name, body):
+    return f"<<<REGION {name}>>>\n{body}\n<<<END>>>\n"
+
+
+def test_conflicting_patches_to_one_region_are_rejected():
+    patch = block("section#about", '<section id="about"><p>One</p></section>') + \
+        block("section#about", '<section id="about"><p>Two</p></section>')
+    with pytest.raises(ValueError):
+        PageRegions.apply(PAGE, patch)
+
+
+def test_repeated_identical_patch_is_applied_once():
+    replacement = '<section id="about"><p>Fresh, longer copy</p></section>'
+    patched = PageRegions.apply(PAGE, block("section#about", replacement) * 2 + block("footer", "<footer>(c) 2026</footer>"))
+    assert patched == PAGE.replace('<section id="about"><p>About us</p></section>', replacement).replace(
+        "<footer>(c) Alder</footer>", "<footer>(c) 2026</footer>")
+
+
+def test_inserts_after_one_region_keep_their_order():
+    patch = block("after:section#about", '<section id="team"></section>') + \
+        block("after:section#about", '<section id="faq"></section>')
+    patched = PageRegions.apply(PAGE, patch)
+    assert patched.index('id="about"') < patched.index('id="team"') < patched.index('id="faq"') < patched.index("<footer>")
@@ -0,0 +1,92 @@
+"""Prefix-stability checks for the agent PromptTemplates (run with: python -m pytest -q)"""
+import pytest
+
+from app import (PROMPT_TEMPLATES, ContentAgent, DesignAgent, HTMLAgent, ProductManagerAgent,
+                 PromptTemplate, QAAgent)
+
+SPECS = [
+    {'business_name': 'Alder & Co', 'industry_focus': 'Carpentry', 'target_audience': 'Homeowners',
+     'core_sections': ['Hero', 'About', 'Services', 'Contact'], 'special_features': ['contact form'],
+     'primary_color': '#8e5b3a'},
+    {'business_name': 'Quantum Tea', 'industry_focus': 'Retail', 'purpose': 'Sell loose-leaf tea online',
+     'core_sections': ['Hero', 'Shop'], 'special_features': [], 'primary_color': '#1abc9c'},
+]
+DESIGNS = [
+    {'design_strategy': {'visual_concept': 'warm craft'}, 'visual_system': {'color_palette': {'primary': '#8e5b3a'}},
+     'content_agent_prompt': 'Write warm, practical copy'},
+    {'design_strategy': {'visual_concept': 'calm minimal'}, 'visual_system': {'typography': {'headings': 'Inter'}}},
+]
+CONTENTS = [
+    {'website_content': {'hero': {'headline': 'Built to last'}}, 'html_agent_prompt': 'Build a warm site'},
+    {'website_content': {'shop': {'headline': 'Steep something new'}}},
+]
+
+
+def render_all(index):
+    """Render every agent prompt from the index-th value set"""
+    specs, design, content = SPECS[index], DESIGNS[index], CONTENTS[index]
+    html_agent = HTMLAgent()
+    slug, label, features = html_agent._section_plan(specs)[0]
+    return {
+        "ProductManager.requirements": ProductManagerAgent()._requirements_prompt(specs),
+        "ProductManager.validation": ProductManagerAgent()._validation_prompt(
+            f"<html>{index}</html>", {'analysis': {'business_type': specs['industry_focus']}}, design, content),
+        "DesignAgent.design_system": DesignAgent()._design_prompt(f"direction {index}", specs, is_modification=bool(index)),
+        "ContentAgent.content_generation": ContentAgent()._content_prompt(f"copy {index}", specs, design),
+        "HTMLAgent.html": html_agent._html_prompt(
+            f"build {index}", specs, design, content, current_html="<html></html>" if index else None),
+        "HTMLAgent.patch": html_agent._patch_prompt(
+            f"change {index}", specs, design, content, f"<html><head></head><body><section id='s{index}'></section></body></html>"),
+        "HTMLAgent.skeleton": html_agent._skeleton_prompt(f"shell {index}", specs, design, html_agent._section_plan(specs)),
+        "HTMLAgent.section": html_agent._section_prompt(slug, label, features, specs, design, content),
+        "QAAgent.code_review": QAAgent()._review_prompt(f"<html>{index}</html>", specs, design, content),
+    }
+
+
+def test_every_template_is_covered():
+    assert set(render_all(0)) == set(PROMPT_TEMPLATES)
+
+
+@pytest.mark.parametrize("name", sorted(PROMPT_TEMPLATES))
+def test_system_prefix_is_byte_identical(name):
+    first, second = render_all(0)[name], render_all(1)[name]
+    assert [role for role, _ in first] == ["system", "human"]
+    assert first[0][1].encode('utf-8') == second[0][1].encode('utf-8') == PROMPT_TEMPLATES[name].system.encode('utf-8')
+    assert first[1][1] != second[1][1]
+
+
+def test_request_values_stay_out_of_the_prefix():
+    template = PromptTemplate("test.template", "Static rules", (("DATA", "data"),))
+    system = template.render(data="Quantum Tea")[0][1]
+    assert "Quantum Tea" not in system
+    with pytest.raises(ValueError):
+        template.render(unknown="x")
+    PROMPT_TEMPLATES.pop("test.template")
+
+
+def test_remembered_history_is_left_out_of_the_cache_key():
+    from app import _llm_cache_key
+    template = PROMPT_TEMPLATES["ProductManager.requirements"]
+    fresh = template.render(specs="• Business: A")
+    remembered = template.render(specs="• Business: A", history="an earlier session's analysis")
+    assert "an earlier session's analysis" in remembered[1][1]
+    assert _llm_cache_key(fresh) == _llm_cache_key(remembered)
+    assert _llm_cache_key(fresh) != _llm_cache_key(template.render(specs="• Business: B"))
+
+
+def test_replay_fixtures_are_keyed_like_the_cache():
+    from app import ReplayLLM
+    template = PROMPT_TEMPLATES["DesignAgent.design_system"]
+    fresh = template.render(direction="calm", specs="• Business: A")
+    remembered = template.render(direction="calm", specs="• Business: A", history="- Previous design: warm")
+    assert ReplayLLM.fixture_key(fresh) == ReplayLLM.fixture_key(remembered)
+    assert ReplayLLM.fixture_key(fresh) != ReplayLLM.fixture_key(template.render(direction="bold", specs="• Business: A"))
+
+
+def test_cached_responses_record_the_routed_model(tmp_path):
+    import sqlite3
+    from app import LLMResponseCache, _cache_store
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"))
+    _cache_store(cache, "routed", "{}", {"model": "gpt-4o-mini", "temperature": 0})
+    with sqlite3.connect(cache.db_path) as conn:
+        assert conn.execute("SELECT model FROM llm_cache WHERE key = 'routed'").fetchone() == ("gpt-4o-mini",)
@@ -0,0 +1,59 @@
+"""Regression checks for the parallel QA/PM review (run with: python -m pytest -q)"""
+import asyncio
+
+import app
+from app import HTMLAgent
+
+
+class QuickReject:
+    async def areview_html_code(self, *args):
+        return False, "Missing contact section"
+
+
+class SlowApprove:
+    async def avalidate_final_website(self, *args):
+        await asyncio.sleep(30)
+        return True, "ok"
+
+
+def test_cancelled_review_is_logged_by_the_caller(monkeypatch):
+    # The coroutine runs on the shared agent loop, where st.session_state belongs to another session
+    def fail(*args, **kwargs):
+        raise AssertionError("log_agent_communication called from the review coroutine")
+    monkeypatch.setattr(app, "log_agent_communication", fail)
+    monkeypatch.setattr(app, "REVIEW_MERGE_GRACE_SECONDS", 0.01)
+    
+    agents = {'qa_agent': QuickReject(), 'product_manager': SlowApprove()}
+    verdicts, cancelled = asyncio.run(HTMLAgent._review_candidate(agents, "<html></html>", {}, {}, {}, {}))
+    
+    assert verdicts == {"QAAgent": (False, "Missing contact section")}
+    assert cancelled == ["ProductManager"]
+
+
+def test_review_memory_writes_run_off_the_event_loop(monkeypatch):
+    import threading
+    
+    class FakeLLM:
+        model_name = "fake"
+        temperature = 0
+        
+        async def ainvoke(self, prompt, **kwargs):
+            return app.ReplayMessage('{"qa_passed": true, "feedback_for_html_agent": "ok"}')
+    
+    monkeypatch.setattr(app, "LLM_MODEL", FakeLLM())
+    monkeypatch.setattr(app, "HTML_LINT_ENABLED", False)
+    monkeypatch.setattr(app, "HEDGE_AGENTS", set())
+    qa = app.QAAgent()
+    writers = []
+    original = qa.memory.add_interaction
+    monkeypatch.setattr(qa.memory, "add_interaction",
+                        lambda *args: writers.append(threading.current_thread()) or original(*args))
+    
+    async def review():
+        loop_thread = threading.current_thread()
+        verdict = await qa.areview_html_code("<html></html>", {}, {}, {})
+        return verdict, loop_thread
+    
+    verdict, loop_thread = asyncio.run(review())
+    assert verdict == (True, "ok")
+    assert writers and loop_thread not in writers
@@ -0,0 +1,24 @@
+"""Section planning checks for sectioned HTML generation (run with: python -m pytest -q)"""
+from app import HTMLAgent, SectionStitcher
+
+
+def test_slug_uses_every_distinguishing_word():
+    assert SectionStitcher.section_slug("About Us") == "about"
+    assert SectionStitcher.section_slug("Services/Products") == "services-products"
+    assert SectionStitcher.section_slug("Our Team") == "team"
+    assert SectionStitcher.section_slug("Our Services") == "services"
+
+
+def test_plan_keeps_sections_whose_slugs_collide():
+    specs = {'core_sections': ['Our Team', 'Our Services', 'Services', 'Contact'],
+             'special_features': ['contact form']}
+    plan = HTMLAgent()._section_plan(specs)
+    assert [slug for slug, _, _ in plan] == ['team', 'services', 'services-2', 'contact']
+    assert plan[3][2] == ['contact form']
+
+
+def test_section_prompt_finds_content_by_slug_word():
+    specs = {'business_name': 'Alder & Co', 'core_sections': ['Services/Products']}
+    content = {'website_content': {'services': {'headline': 'Hand-built cabinets'}}}
+    prompt = HTMLAgent()._section_prompt('services-products', 'Services/Products', [], specs, {}, content)
+    assert 'Hand-built cabinets' in str(prompt)
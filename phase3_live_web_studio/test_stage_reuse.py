@@ -0,0 +1,43 @@
+"""Create -> modify stage reuse (run with: python -m pytest -q)"""
+import app
+from app import HTMLAgent, StageCache, WorkflowManager
+
+SPEC = {'business_name': 'Alder & Co', 'industry_focus': 'Carpentry', 'design_style': 'Modern',
+        'core_sections': ['Hero', 'About', 'Contact']}
+# What the UI passes on modification: the session's website_context, not the SpecAgent spec
+WEBSITE_CONTEXT = {'current_theme': 'Carpentry website', 'business_type': 'business', 'key_features': [],
+                   'style_preferences': {'design_style': 'Modern'}, 'evolution_log': []}
+DESIGN = {'design_strategy': {'visual_concept': 'warm craft'}, 'content_agent_prompt': 'Write warm copy'}
+CONTENT = {'website_content': {'hero': {'headline': 'Built to last'}}, 'html_agent_prompt': 'Build it'}
+
+
+class NoRerun:
+    def create_design_system(self, *args, **kwargs):
+        raise AssertionError("DesignAgent reran for an HTML-only change")
+    
+    def generate_website_content(self, *args, **kwargs):
+        raise AssertionError("ContentAgent reran for an HTML-only change")
+
+
+def test_html_only_modification_reuses_design_and_content(tmp_path, monkeypatch):
+    workspace = str(tmp_path)
+    (tmp_path / 'index.html').write_text("<html><body><a href='#'>Call</a></body></html>")
+    StageCache(workspace).record(SPEC, DESIGN, CONTENT)
+    
+    seen = {}
+    def html_qa_cycle(html_prompt, user_specs, design_output, content_output, *args, **kwargs):
+        seen.update(design=design_output, content=content_output)
+        return "<html><body><a href='#contact'>Call</a></body></html>"
+    monkeypatch.setattr(HTMLAgent, "_html_qa_cycle", staticmethod(html_qa_cycle))
+    monkeypatch.setattr(app, "STAGE_REUSE_ENABLED", True)
+    monkeypatch.setattr(app, "ASYNC_AGENTS_ENABLED", False)
+    
+    agents = {'design_agent': NoRerun(), 'content_agent': NoRerun()}
+    success, message = HTMLAgent._modify_website_workflow(
+        "Fix the broken button links", workspace, agents, WorkflowManager(), user_specs=WEBSITE_CONTEXT
+    )
+    
+    assert success, message
+    assert seen == {'design': DESIGN, 'content': CONTENT}
+    # The modification keeps the stages keyed on the creation spec for the next edit
+    assert StageCache(workspace).site_specs() == SPEC
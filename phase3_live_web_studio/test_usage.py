@@ -0,0 +1,12 @@
+"""Token accounting checks (run with: python -m pytest -q)"""
+import app
+
+
+def test_session_usage_keeps_only_recent_sessions(monkeypatch):
+    monkeypatch.setattr(app, "_session_usage", app.OrderedDict())
+    monkeypatch.setattr(app, "USAGE_MAX_SESSIONS", 2)
+    first = app.get_session_usage("first")
+    app.get_session_usage("second")
+    assert app.get_session_usage("first") is first
+    app.get_session_usage("third")
+    assert list(app._session_usage) == ["first", "third"]
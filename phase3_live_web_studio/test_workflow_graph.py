@@ -0,0 +1,27 @@
+"""Regression checks for the creation workflow graph (run with: python -m pytest -q)"""
+import app
+from app import HTMLAgent, WorkflowManager
+
+
+def build(monkeypatch, sectioned, parallel_review=False):
+    monkeypatch.setattr(app, "SECTIONED_HTML_ENABLED", sectioned)
+    monkeypatch.setattr(app, "PARALLEL_REVIEW_ENABLED", parallel_review)
+    graph = HTMLAgent._build_create_graph({}, WorkflowManager(), "/tmp")
+    graph.validate({'user_specs'})
+    return graph
+
+
+def test_page_shell_is_drafted_alongside_content(monkeypatch):
+    graph = build(monkeypatch, sectioned=True)
+    assert graph.dependencies("content") == {"design"}
+    assert graph.dependencies("skeleton") == {"design"}
+    assert graph.dependencies("html_qa") == {"design", "content", "skeleton"}
+    
+    graph = build(monkeypatch, sectioned=True, parallel_review=True)
+    assert graph.dependencies("parallel_review") == {"pm_analysis", "design", "content", "skeleton"}
+
+
+def test_full_page_generation_has_no_skeleton_step(monkeypatch):
+    graph = build(monkeypatch, sectioned=False)
+    assert "skeleton" not in graph.steps
+    assert graph.dependencies("html_qa") == {"design", "content"}